@@ -1,9 +1,20 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-import pandas as pd
+try:
+    import tkinter as tk
+    from tkinter import ttk, filedialog, messagebox
+except ImportError:
+    # Tkの無い環境（サーバーでのコマンドライン実行）でも取込・集計は使えるようにする
+    tk = ttk = filedialog = messagebox = None
 import sqlite3
 import re
 import os
+import sys
+import threading
+import queue
+import traceback
+import functools
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
 
 def get_brand_map():
     return {
@@ -23,66 +34,1163 @@ def get_brand_map():
         "35": "Northern Watters Knitwear"
     }
 
+# 解決済みのDBパス（Dropboxの場所は起動中に変わらないので1回だけ調べる）
+db_path_cache = {}
+
 def get_db_path(db_filename):
+    if db_filename in db_path_cache:
+        return db_path_cache[db_filename]
     c_path = os.path.join('C:/Griffin Dropbox/Harada Tetsuro/nakashima/DB', db_filename)
     d_path = os.path.join('D:/Griffin Dropbox/Harada Tetsuro/nakashima/DB', db_filename)    
     if os.path.exists(c_path):
-        return c_path
+        path = c_path
     elif os.path.exists(d_path):
-        return d_path
+        path = d_path
     else:
-        return db_filename  # カレントディレクトリ
+        path = db_filename  # カレントディレクトリ
+    db_path_cache[db_filename] = path
+    return path
+
+# PCごとの記録（処理時間のログなど）の保存先
+# スクリプト・EXEのフォルダやDropboxのDBフォルダには置かず、ユーザーごとのデータフォルダを使う
+# （Windows: %LOCALAPPDATA%、それ以外: ~/.cache）
+LOCAL_DATA_DIRNAME = "売上データ処理システム"
+
+def get_local_data_dir():
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    folder = os.path.join(base, LOCAL_DATA_DIRNAME)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+# === DBスキーマのマイグレーション ===
+# DBごとに「バージョン順のSQLリスト」を持ち、PRAGMA user_version で適用済みを管理する
+# 新しい変更は各リストの末尾に追加すること（既存の要素は書き換えない）
+WEB_ORDER_COLUMNS = [
+    "受注№", "受注日", "年齢", "性別", "品番", "品名", "色", "サイズ",
+    "税抜金額", "税込金額", "居住地", "支払方法", "年", "月", "点数", "ギフト", "ブランド"
+]
 
-def process_file(filename):
+# 月次集計テーブル: 品番10桁×年月×ブランド×属性（年齢層・性別・居住地・ギフト）ごとの点数・金額合計
+# 集計レポートはordersではなくこのテーブルを読む（取込のたびに追加分だけ加算する）
+# 品名・色・税抜金額は初回rowidの行（商品マスタに無い品番の表示用）
+MONTHLY_SALES_DDL = """
+    CREATE TABLE IF NOT EXISTS monthly_sales (
+        品番10 TEXT NOT NULL,
+        年月キー INTEGER NOT NULL,
+        年 INTEGER NOT NULL,
+        月 INTEGER NOT NULL,
+        ブランド TEXT NOT NULL,
+        年齢層 INTEGER NOT NULL,
+        性別 TEXT NOT NULL,
+        居住地 TEXT NOT NULL,
+        ギフト INTEGER NOT NULL,
+        点数 REAL NOT NULL,
+        金額合計 REAL NOT NULL,
+        初回rowid INTEGER,
+        品名,
+        色,
+        税抜金額,
+        PRIMARY KEY (品番10, 年月キー, 年, 月, ブランド, 年齢層, 性別, 居住地, ギフト)
+    )
+"""
+
+# 取込済みファイルの台帳: ファイル内容のハッシュ→種類・年月・件数
+# 同じ内容のファイルは読まずにスキップし、同じ月の別ファイルはその月の行を置き換える
+INGESTED_FILES_DDL = """
+    CREATE TABLE IF NOT EXISTS ingested_files (
+        ハッシュ TEXT PRIMARY KEY,
+        種類 TEXT NOT NULL,
+        ファイル名 TEXT NOT NULL,
+        年 INTEGER NOT NULL,
+        月 INTEGER NOT NULL,
+        件数 INTEGER NOT NULL,
+        取込日時 TEXT NOT NULL
+    )
+"""
+
+MIGRATIONS = {
+    "frame.db": [
+        # v1: ordersテーブル（従来のto_sqlで作られるものと同じTEXT列）
+        [
+            "CREATE TABLE IF NOT EXISTS orders (" + ", ".join(f'"{col}" TEXT' for col in WEB_ORDER_COLUMNS) + ")",
+        ],
+        # v2: 年月キー列 + 期間・ブランド・品番・受注№のインデックス
+        [
+            "ALTER TABLE orders ADD COLUMN 年月キー INTEGER",
+            "UPDATE orders SET 年月キー = CAST(年 AS INTEGER) * 100 + CAST(月 AS INTEGER)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_ym ON orders (年, 月)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_brand_ym ON orders (ブランド, 年, 月)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_ymkey ON orders (年月キー)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_item ON orders (品番)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_order_no ON orders (受注№)",
+        ],
+        # v3: 月次集計テーブル（既存のordersから作成）
+        [
+            MONTHLY_SALES_DDL,
+            "CREATE INDEX IF NOT EXISTS idx_monthly_sales_ymkey ON monthly_sales (年月キー)",
+            lambda conn: refresh_monthly_sales(conn, "frame.db"),
+        ],
+        # v4: 取込済みファイルの台帳
+        [
+            INGESTED_FILES_DDL,
+            "CREATE INDEX IF NOT EXISTS idx_ingested_files_ym ON ingested_files (種類, 年, 月)",
+        ],
+    ],
+    "framefukuoka.db": [
+        # v1: ordersテーブル
+        [
+            """
+            CREATE TABLE IF NOT EXISTS orders (
+                品番 TEXT,
+                品名 TEXT,
+                色 TEXT,
+                サイズ TEXT,
+                税抜金額 INTEGER,
+                税込金額 INTEGER,
+                点数 INTEGER,
+                年 INTEGER,
+                月 INTEGER,
+                ブランド TEXT
+            )
+            """,
+        ],
+        # v2: 年月キー列 + 期間・ブランド・品番のインデックス
+        [
+            "ALTER TABLE orders ADD COLUMN 年月キー INTEGER",
+            "UPDATE orders SET 年月キー = CAST(年 AS INTEGER) * 100 + CAST(月 AS INTEGER)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_ym ON orders (年, 月)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_brand_ym ON orders (ブランド, 年, 月)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_ymkey ON orders (年月キー)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_item ON orders (品番)",
+        ],
+        # v3: 月次集計テーブル（既存のordersから作成）
+        [
+            MONTHLY_SALES_DDL,
+            "CREATE INDEX IF NOT EXISTS idx_monthly_sales_ymkey ON monthly_sales (年月キー)",
+            lambda conn: refresh_monthly_sales(conn, "framefukuoka.db"),
+        ],
+        # v4: 取込済みファイルの台帳
+        [
+            INGESTED_FILES_DDL,
+            "CREATE INDEX IF NOT EXISTS idx_ingested_files_ym ON ingested_files (種類, 年, 月)",
+        ],
+    ],
+    "product.db": [
+        # v1: productsテーブル（主キーは品番CD + カラーNO）
+        [
+            """
+            CREATE TABLE IF NOT EXISTS products (
+                商品名 TEXT,
+                品番CD TEXT,
+                カラーNO TEXT,
+                カラー名 TEXT,
+                サイズ数計 INTEGER,
+                金額 REAL,
+                革の種類 TEXT,
+                ブランド TEXT,
+                PRIMARY KEY (品番CD, カラーNO)
+            )
+            """,
+        ],
+        # v2: 金額CSVの突合用（品番CDの上8桁）の式インデックス
+        [
+            "CREATE INDEX IF NOT EXISTS idx_products_code8 ON products (substr(品番CD, 1, 8))",
+        ],
+    ],
+}
+
+def migrate_db(conn, db_filename):
+    # 未適用のマイグレーションを1バージョンずつトランザクションで適用する
+    # 起動時のバックグラウンド処理と画面からの処理が同時に接続しても二重に適用しないよう、
+    # 書込ロックを取ってからバージョンを読み直す
+    steps = MIGRATIONS.get(db_filename, [])
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= len(steps):
+        return
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= len(steps):
+            conn.commit()
+            return
+        new_version, statements = version + 1, steps[version]
+        try:
+            for sql in statements:
+                # SQL文字列のほか、接続を受け取る関数（データの作り直しなど）も書ける
+                if callable(sql):
+                    sql(conn)
+                else:
+                    conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {new_version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+# === DB接続の共有 ===
+# DBごとに接続を1つだけ開いて使い回す（取込・集計のたびに接続し直さない）
+# connect_db で借りて、使い終わったら従来どおり close() で返す。借りている間は他のスレッドは待つ
+DB_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -65536",    # 64MB
+    "PRAGMA mmap_size = 268435456",  # 256MB
+]
+db_pool = {}
+db_pool_lock = threading.Lock()
+
+class PooledConnection(sqlite3.Connection):
+    # connect_db が返す共有接続。close() では接続を閉じずに返却する
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.RLock()
+        self.owner = None
+        self.depth = 0
+
+    def acquire(self):
+        self.lock.acquire()
+        self.owner = threading.current_thread()
+        self.depth += 1
+
+    def close(self):
+        if self.owner is not threading.current_thread():
+            return
+        self.depth -= 1
+        if self.depth == 0:
+            # 未確定のトランザクションは従来のclose()と同じく破棄
+            if self.in_transaction:
+                self.rollback()
+            self.owner = None
+        self.lock.release()
+
+    def commit(self):
+        # DBはDropboxで同期するので、確定した内容は-walに残さずすぐDB本体に書き戻す
+        super().commit()
+        self.checkpoint()
+
+    def checkpoint(self):
+        # 読込中の接続があると書き戻せないことがある（その分は次のコミットか処理の終了時に書き戻す）
+        return self.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+
+    def release_all(self):
+        # 現在のスレッドが借りたまま返していない分をまとめて返す
+        while self.owner is threading.current_thread():
+            self.close()
+
+    def close_connection(self):
+        # 他のスレッドが使用中なら少し待つ（終了時に止まったままにならないよう待ち時間は区切る）
+        locked = self.lock.acquire(timeout=5)
+        try:
+            super().close()
+        finally:
+            if locked:
+                self.lock.release()
+
+def connect_db(db_filename):
+    # DBの共有接続を借り、スキーマを最新にしてから返す（初回のみ接続してPRAGMAを設定）
+    with db_pool_lock:
+        conn = db_pool.get(db_filename)
+        if conn is None:
+            conn = sqlite3.connect(get_db_path(db_filename), factory=PooledConnection, check_same_thread=False)
+            for pragma in DB_PRAGMAS:
+                conn.execute(pragma)
+            db_pool[db_filename] = conn
+    conn.acquire()
+    try:
+        migrate_db(conn, db_filename)
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+def release_db_connections():
+    # 処理の終了時に、エラー等で返し忘れた接続を返却する
+    with db_pool_lock:
+        conns = list(db_pool.values())
+    for conn in conns:
+        conn.release_all()
+        # 他のスレッドが使用中でなければ、書き戻せていないWALをDB本体に書き戻す
+        if conn.lock.acquire(blocking=False):
+            try:
+                conn.checkpoint()
+            except sqlite3.Error:
+                pass
+            finally:
+                conn.lock.release()
+
+def close_db_connections():
+    # 終了時に全ての共有接続を閉じる（WALの内容はここでDB本体に書き戻される）
+    with db_pool_lock:
+        conns = list(db_pool.values())
+        db_pool.clear()
+    for conn in conns:
+        conn.close_connection()
+
+def run_migrations():
+    # 起動時に全DBのマイグレーションを実行
+    for db_filename in MIGRATIONS:
+        try:
+            conn = connect_db(db_filename)
+            conn.close()
+        except Exception as e:
+            print(f"マイグレーションエラー({db_filename}): {e}")
+
+# === 処理時間の記録 ===
+# 取込・出力1回ごとに、段階ごとの時間・件数・使用メモリのピークを計測する
+#   @profiled("名前") を付けた関数の実行が1回の計測、その中の with profile_stage("段階") as stage: が1段階
+#   （件数は stage["rows"] に入れる。計測中でなければ profile_stage は何もしない）
+# 結果はユーザーごとのデータフォルダの profile.log（サイズでローテーション）に出力し、直近の分は「前回の処理時間」画面で表示する
+PROFILE_LOG = "profile.log"
+PROFILE_LOG_MAX_BYTES = 1024 * 1024
+PROFILE_LOG_BACKUPS = 5
+PROFILE_MEMORY_INTERVAL = 0.05  # 使用メモリを調べる間隔（秒）
+PROFILE_RECENT_RUNS = 10
+
+profile_local = threading.local()  # 実行中の計測（スレッドごと）
+recent_profiles = deque(maxlen=PROFILE_RECENT_RUNS)  # 新しい順
+profile_logger = None
+memory_usage_reader = None
+
+def find_memory_usage_reader():
+    # 使用メモリ（バイト）を返す関数を選ぶ: psutil → /proc（Linux） → Win32 API。どれも使えなければNoneを返す関数
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        process = psutil.Process()
+        return lambda: process.memory_info().rss
+    if os.path.exists("/proc/self/statm"):
+        page_size = os.sysconf("SC_PAGE_SIZE")
+
+        def read_statm():
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * page_size
+        return read_statm
+    if os.name == "nt":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")
+            ]
+        try:
+            get_current_process = ctypes.windll.kernel32.GetCurrentProcess
+            get_current_process.restype = wintypes.HANDLE
+            get_memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+            get_memory_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(ProcessMemoryCounters), wintypes.DWORD]
+        except (AttributeError, OSError):
+            return lambda: None
+
+        def read_working_set():
+            counters = ProcessMemoryCounters()
+            counters.cb = ctypes.sizeof(counters)
+            if not get_memory_info(get_current_process(), ctypes.byref(counters), counters.cb):
+                return None
+            return counters.WorkingSetSize
+        return read_working_set
+    return lambda: None
+
+def get_memory_usage():
+    global memory_usage_reader
+    if memory_usage_reader is None:
+        memory_usage_reader = find_memory_usage_reader()
+    try:
+        return memory_usage_reader()
+    except (OSError, ValueError):
+        return None
+
+class MemorySampler:
+    # 別スレッドで一定間隔ごとに使用メモリを調べ、区間（段階）ごとの最大値を求める
+    def __init__(self, interval=PROFILE_MEMORY_INTERVAL):
+        self.peak = get_memory_usage()
+        self.stop_event = threading.Event()
+        self.thread = None
+        if self.peak is not None:
+            self.thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+            self.thread.start()
+
+    def _run(self, interval):
+        while not self.stop_event.wait(interval):
+            self.sample()
+
+    def sample(self):
+        usage = get_memory_usage()
+        if usage is not None and (self.peak is None or usage > self.peak):
+            self.peak = usage
+
+    def begin(self):
+        # 区間の開始: 外側の区間の最大値を返し、現在値から測り直す
+        outer = self.peak
+        self.peak = get_memory_usage()
+        return outer
+
+    def end(self, outer=None):
+        # 区間の終了: 区間内の最大値（MB）を返し、外側の区間の最大値に戻す
+        self.sample()
+        peak = self.peak
+        if outer is not None and peak is not None:
+            self.peak = max(outer, peak)
+        return None if peak is None else round(peak / 1024 / 1024, 1)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+class RunProfile:
+    # 1回分の計測結果。stages は {"name", "depth", "seconds", "rows", "peak_mb"} を開始順に並べたもの
+    def __init__(self, name):
+        from datetime import datetime
+        self.name = name
+        self.started_at = datetime.now()
+        self.stages = []
+        self.depth = 0
+        self.seconds = None
+        self.peak_mb = None
+        self.status = "完了"
+        self.sampler = MemorySampler()
+
+@contextmanager
+def profile_stage(name):
+    import time
+    profile = getattr(profile_local, "current", None)
+    stage = {"name": name, "rows": None}
+    if profile is None:
+        yield stage
+        return
+    stage["depth"] = profile.depth
+    profile.stages.append(stage)
+    profile.depth += 1
+    outer_peak = profile.sampler.begin()
+    started = time.perf_counter()
+    try:
+        yield stage
+    finally:
+        stage["seconds"] = time.perf_counter() - started
+        stage["peak_mb"] = profile.sampler.end(outer_peak)
+        profile.depth -= 1
+
+@contextmanager
+def profile_run(name):
+    # 1回分の計測（RunProfile を返す）。計測中に呼ばれた場合は外側の計測の1段階として記録する
+    import time
+    if getattr(profile_local, "current", None) is not None:
+        with profile_stage(name) as stage:
+            yield stage
+        return
+    profile = RunProfile(name)
+    profile_local.current = profile
+    started = time.perf_counter()
+    try:
+        yield profile
+    except TaskCancelled:
+        profile.status = "キャンセル"
+        raise
+    except Exception as e:
+        profile.status = f"エラー: {e}"
+        raise
+    finally:
+        profile.seconds = time.perf_counter() - started
+        profile.peak_mb = profile.sampler.end()
+        profile.sampler.stop()
+        profile_local.current = None
+        recent_profiles.appendleft(profile)
+        write_profile_log(profile)
+
+def profile_label(arg):
+    # 計測名に付ける対象（ファイル名・ファイル数・集計条件）
+    if isinstance(arg, str):
+        return os.path.basename(arg)
+    if isinstance(arg, (list, tuple)):
+        return f"{len(arg)}ファイル"
+    if isinstance(arg, ReportRequest):
+        return f"{arg.brand} {arg.start_key}-{arg.end_key} {arg.db_mode}"
+    return ""
+
+def profiled(name, arg_indexes=(0,)):
+    # 関数の実行全体を1回の計測にするデコレータ（計測名は 名前＋指定した位置の引数の内容）
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            labels = [profile_label(args[i]) for i in arg_indexes if i < len(args)]
+            with profile_run(" ".join([name] + [label for label in labels if label])):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def format_profile(profile):
+    lines = [f"{profile.started_at:%Y-%m-%d %H:%M:%S} {profile.name}（{profile.status}） 合計 {profile.seconds:.2f}秒"
+             + (f" ピーク {profile.peak_mb:.0f}MB" if profile.peak_mb is not None else "")]
+    for stage in profile.stages:
+        line = f"{'  ' * (stage['depth'] + 1)}{stage['name']}: {stage['seconds']:.2f}秒"
+        if stage["rows"] is not None:
+            line += f" {stage['rows']:,}件"
+        if stage["peak_mb"] is not None:
+            line += f" ピーク {stage['peak_mb']:.0f}MB"
+        lines.append(line)
+    return "\n".join(lines)
+
+def get_profile_log_path():
+    # ユーザーごとのデータフォルダ（取込・集計中にカレントフォルダが変わっても同じ場所）
+    return os.path.join(get_local_data_dir(), PROFILE_LOG)
+
+def write_profile_log(profile):
+    # ログに書けない場合（フォルダに書込権限が無いなど）は1回だけ知らせて、以降は画面表示用の記録のみ
+    global profile_logger
+    if profile_logger is None:
+        import logging
+        from logging.handlers import RotatingFileHandler
+        try:
+            handler = RotatingFileHandler(get_profile_log_path(), maxBytes=PROFILE_LOG_MAX_BYTES,
+                                          backupCount=PROFILE_LOG_BACKUPS, encoding="utf-8")
+        except OSError as e:
+            print(f"処理時間のログを開けませんでした: {e}")
+            profile_logger = False
+            return
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        profile_logger = logging.getLogger("profile")
+        profile_logger.setLevel(logging.INFO)
+        profile_logger.propagate = False
+        profile_logger.addHandler(handler)
+    if profile_logger:
+        profile_logger.info(format_profile(profile))
+
+# 居住地フィルタ用の地方→都道府県対応表
+REGION_MAP = {
+    "北海道地方": ["北海道"],
+    "東北地方": ["青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県"],
+    "関東地方": ["東京都", "神奈川県", "千葉県", "埼玉県", "茨城県", "栃木県", "群馬県"],
+    "中部地方": ["新潟県", "富山県", "石川県", "福井県", "山梨県", "長野県", "岐阜県", "静岡県", "愛知県"],
+    "近畿地方": ["大阪府", "兵庫県", "京都府", "滋賀県", "奈良県", "和歌山県", "三重県"],
+    "中国地方": ["鳥取県", "島根県", "岡山県", "広島県", "山口県"],
+    "四国地方": ["徳島県", "香川県", "愛媛県", "高知県"],
+    "九州地方": ["福岡県", "佐賀県", "長崎県", "熊本県", "大分県", "宮崎県", "鹿児島県","沖縄県"]
+}
+
+def build_orders_where(start_key, end_key, brand="(すべて)", age="ALL", gender="ALL", region="ALL", gift="ALL", summary=False):
+    # GUIの選択内容から WHERE 句とパラメータを組み立てる
+    # 年齢・ギフトはTEXT列で保存されている場合があるのでCASTして比較する
+    # summary=True のときは月次集計テーブル（monthly_sales）の列で組み立てる
+    item_col = "品番10" if summary else "品番"
+    where = ["年月キー BETWEEN ? AND ?"]
+    params = [start_key, end_key]
+
+    # ブランド（登録時のブランド名が古い場合も拾えるよう品番上2桁でも判定）
+    if brand and brand != "(すべて)":
+        codes = [code for code, name in get_brand_map().items() if name == brand]
+        if codes:
+            where.append(f"(ブランド = ? OR substr({item_col}, 1, 2) IN ({', '.join('?' * len(codes))}))")
+            params += [brand] + codes
+        else:
+            where.append("ブランド = ?")
+            params.append(brand)
+
+    # 年齢
+    if age != "ALL":
+        # 集計テーブルの年齢層は10歳刻み（20歳未満は10、60歳以上は60、不明は-1）
+        age_expr = "NULLIF(年齢層, -1)" if summary else "CAST(NULLIF(年齢, '') AS INTEGER)"
+        if age == "10代以下":
+            where.append(f"{age_expr} < 20")
+        elif age == "60代以上":
+            where.append(f"{age_expr} >= 60")
+        else:
+            try:
+                age_num = int(age[:2])
+                where.append(f"{age_expr} >= ? AND {age_expr} < ?")
+                params += [age_num, age_num + 10]
+            except ValueError:
+                pass
+
+    # 性別
+    if gender == "男性":
+        where.append("性別 IN ('RM', 'M')")
+    elif gender == "女性":
+        where.append("性別 IN ('RL', 'L')")
+
+    # 居住地
+    if region != "ALL":
+        prefectures = REGION_MAP.get(region, [region])
+        where.append(f"居住地 IN ({', '.join('?' * len(prefectures))})")
+        params += prefectures
+
+    # ギフト
+    gift_expr = "ギフト" if summary else "COALESCE(CAST(NULLIF(ギフト, '') AS INTEGER), 0)"
+    if gift == "あり":
+        where.append(f"{gift_expr} = 1")
+    elif gift == "なし":
+        where.append(f"{gift_expr} = 0")
+
+    return " AND ".join(where), params
+
+def make_month_labels(df):
+    # 年・月列から "24/05" 形式の年月ラベルを作る
+    import pandas as pd
+    years = pd.to_numeric(df["年"], errors="coerce").dropna().astype(int)
+    months = pd.to_numeric(df["月"], errors="coerce").loc[years.index].astype(int)
+    return years.astype(str).str[-2:] + "/" + months.astype(str).str.zfill(2)
+
+# 集計用フレームの型: 種類の少ない文字列列はカテゴリ、整数値だけの数値列は int32（収まる場合）にしてメモリを減らす
+INT32_MAX = 2 ** 31 - 1
+
+def compact_frame(df, categories=(), integers=()):
+    # integers の列は、整数値だけで int32 に収まる場合に限り int32 にする（小数や欠損があればそのまま）
+    for col in categories:
+        df[col] = df[col].astype("category")
+    for col in integers:
+        values = df[col]
+        if values.isna().any() or not (values == values.round()).all():
+            continue
+        if values.empty or values.abs().max() <= INT32_MAX:
+            df[col] = values.astype("int32")
+    return df
+
+def read_sql_compact(sql, conn, params=None, categories=(), integers=()):
+    # pd.read_sql の結果を compact_frame で詰めて返す（集計で使う読込はこれを通す）
+    import pandas as pd
+    return compact_frame(pd.read_sql(sql, conn, params=params), categories, integers)
+
+def to_int_frame(df):
+    # 集計値（欠損は0埋め済み）を整数にする。int32に収まらない場合だけint64
+    return df.astype("int32" if df.empty or df.abs().max().max() <= INT32_MAX else "int64")
+
+# 集計用の接続に ATTACH するDB（スキーマ名: DBファイル）
+REPORT_ATTACHED_DBS = {
+    "store": "framefukuoka.db",
+    "prod": "product.db",
+}
+
+def connect_report_db():
+    # 集計用の接続を借りる: frame.db の共有接続に店舗DB（store）と商品マスタ（prod）をATTACHしたもの
+    # ATTACH先もマイグレーション済みにしておく（frame.dbを借りる前に済ませる）
+    for db_filename in REPORT_ATTACHED_DBS.values():
+        connect_db(db_filename).close()
+    conn = connect_db("frame.db")
+    try:
+        attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+        for schema, db_filename in REPORT_ATTACHED_DBS.items():
+            if schema not in attached:
+                conn.execute(f"ATTACH DATABASE ? AS {schema}", (get_db_path(db_filename),))
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+def build_products_where(brand="(すべて)", alias="p"):
+    # 集計対象の商品マスタの条件（ブランド一致、革の種類がSAMPLと金額が空のものは除外）
+    where = [f"COALESCE({alias}.革の種類, '') != 'SAMPL'", f"{alias}.金額 IS NOT NULL"]
+    params = []
+    if brand != "(すべて)":
+        where.append(f"{alias}.ブランド = ?")
+        params.append(brand)
+    return " AND ".join(where), params
+
+def read_sales_report(db_mode, start_key, end_key, brand="(すべて)", filters=None):
+    # 集計に必要なデータを1つの接続から読む（年齢・性別・居住地・ギフトはWEBのみ）
+    # ALLはWEB・店舗の月次集計を UNION ALL してSQLite内で集計し、商品マスタとの突合もSQLで行う
+    # 戻り値: (商品マスタ,
+    #          品番10×年月×ブランドの点数・金額合計と商品マスタ有無,
+    #          商品マスタに無い品番10の最初の行の品名・色・税抜金額（ALLはWEBが先）,
+    #          期間内に存在する年月)
+    filters = filters or {}
+    if db_mode == "WEB":
+        sources = [("main", filters)]
+    elif db_mode == "店舗":
+        sources = [("store", {})]
+    else:
+        sources = [("main", {}), ("store", {})]
+
+    def union_sales(sales_brand):
+        parts = []
+        params = []
+        for order, (schema, flt) in enumerate(sources):
+            where, where_params = build_orders_where(start_key, end_key, sales_brand, **flt, summary=True)
+            parts.append(f"SELECT {order} AS ソース順, * FROM {schema}.monthly_sales WHERE {where}")
+            params += where_params
+        return " UNION ALL ".join(parts), params
+
+    products_where, products_params = build_products_where(brand)
+    # 商品マスタの結合キー一覧はSQLite内で1回だけ作られる（キーが空の行があってもNULLにならないようCOALESCE）
+    in_master = f"COALESCE(sales.品番10 IN (SELECT p.品番CD || '0' || p.カラーNO FROM prod.products p WHERE {products_where}), 0)"
+    sales_sql, sales_params = union_sales(brand)
+    # 月の列はブランドで絞る前の範囲で作る（従来の出力と同じ列にするため）
+    months_sql, months_params = union_sales("(すべて)")
+
+    conn = connect_report_db()
+    try:
+        # 商品マスタは登録順（ソート前の並びを従来と同じにするため）
+        df_products = read_sql_compact(
+            f"SELECT * FROM prod.products p WHERE {products_where} ORDER BY p.rowid", conn, params=products_params,
+            categories=["ブランド"])
+        df_sales = read_sql_compact(f"""
+            WITH sales AS ({sales_sql})
+            SELECT 品番10, 年, 月, ブランド, SUM(点数) AS 点数, SUM(金額合計) AS 金額合計, {in_master} AS 商品マスタ
+            FROM sales
+            GROUP BY 品番10, 年, 月, ブランド
+        """, conn, params=sales_params + products_params,
+            categories=["品番10", "ブランド"], integers=["年", "月", "点数", "金額合計"])
+        df_first = read_sql_compact(f"""
+            WITH sales AS ({sales_sql}),
+            ranked AS (
+                SELECT 品番10, 品名, 色, 税抜金額,
+                       ROW_NUMBER() OVER (PARTITION BY 品番10 ORDER BY ソース順, 初回rowid) AS 順
+                FROM sales
+            )
+            SELECT 品番10, 品名, 色, 税抜金額 FROM ranked AS sales
+            WHERE 順 = 1 AND NOT {in_master}
+        """, conn, params=sales_params + products_params)
+        df_months = read_sql_compact(
+            f"SELECT DISTINCT 年, 月 FROM ({months_sql})", conn, params=months_params, integers=["年", "月"])
+    finally:
+        conn.close()
+    return df_products, df_sales, df_first, df_months
+
+# 全データCSVの出力先
+WEB_CSV = "frame_全データ出力.csv"
+STORE_CSV = "framefukuoka_全データ出力.csv"
+PRODUCT_CSV = "商品マスタ.csv"
+
+# 取込後のCSV出力方法（アップロード画面で切替）
+#   full     : 取込のたびに全件出力（従来どおり）
+#   append   : 今回登録した行だけ既存CSVに追記
+#   deferred : 複数ファイル取込の最後に1回だけ全件出力
+CSV_EXPORT_MODES = {
+    "full": "毎回全件出力",
+    "append": "差分のみ追記",
+    "deferred": "最後にまとめて出力",
+}
+
+def get_max_rowid(conn, table):
+    return conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()[0]
+
+def export_table_csv(conn, table, csv_path, since_rowid=None):
+    # テーブルをCSV出力する
+    # since_rowid 指定時はそれより後に登録された行だけを既存CSVに追記する
+    # （CSVが無い・列構成が変わった場合は全件出力に切り替える）
+    import pandas as pd
+    if since_rowid is not None and os.path.exists(csv_path):
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        with open(csv_path, encoding="utf-8-sig") as f:
+            header = f.readline().rstrip("\r\n").split(",")
+        if header == columns:
+            df_new = pd.read_sql(f"SELECT * FROM {table} WHERE rowid > ?", conn, params=[since_rowid])
+            # 追記時はBOMを付けない
+            df_new.to_csv(csv_path, mode="a", header=False, index=False, encoding="utf-8")
+            return
+    df_all = pd.read_sql(f"SELECT * FROM {table}", conn)
+    df_all.to_csv(csv_path, index=False, encoding="utf-8-sig")
+
+def export_orders_csv(db_filename, csv_path):
+    # 複数ファイル取込後にまとめて全件出力する（deferred用）
+    conn = connect_db(db_filename)
+    try:
+        export_table_csv(conn, "orders", csv_path)
+    finally:
+        conn.close()
+
+def df_to_rows(df):
+    # DataFrameをsqlite3に渡せる行（NaN/NA→None、numpy型→Python型）に変換
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+def insert_rows(conn, table, df):
+    # DataFrameの行をそのままINSERTする（コミットは呼び出し側で行う）
+    col_sql = ", ".join(f'"{col}"' for col in df.columns)
+    placeholders = ", ".join("?" * len(df.columns))
+    cur = conn.executemany(f"INSERT INTO {table} ({col_sql}) VALUES ({placeholders})", df_to_rows(df))
+    return cur.rowcount
+
+def create_orders_staging(conn, columns):
+    # 登録前の行を置く一時テーブル（orders_staging）を作り直す
+    col_sql = ", ".join(f'"{col}"' for col in columns)
+    conn.execute("DROP TABLE IF EXISTS temp.orders_staging")
+    conn.execute(f"CREATE TEMP TABLE orders_staging ({col_sql})")
+
+def insert_staged_orders(conn, columns, key_cols):
+    # orders_staging のうち、キーが既存ordersに無い行だけを登録する（戻り値: 登録件数）
+    # 受注№のインデックスで1行ずつ存在確認するので、既存件数に比例して遅くならない
+    col_sql = ", ".join(f'"{col}"' for col in columns)
+    match = " AND ".join(f'o."{col}" = s."{col}"' for col in key_cols)
+    cur = conn.execute(f"""
+        INSERT INTO orders ({col_sql})
+        SELECT {", ".join(f's."{col}"' for col in columns)}
+        FROM temp.orders_staging s
+        WHERE NOT EXISTS (SELECT 1 FROM orders o WHERE {match})
+        ORDER BY s.rowid
+    """)
+    return cur.rowcount
+
+def insert_new_orders(conn, df, key_cols):
+    # 一時テーブル（orders_staging）に読み込み、キーが既存ordersに無い行だけを登録する
+    # コミットは呼び出し側で行う（複数ファイルを1トランザクションで登録するため）
+    # 戻り値: 登録件数
+    try:
+        create_orders_staging(conn, df.columns)
+        insert_rows(conn, "temp.orders_staging", df)
+        return insert_staged_orders(conn, df.columns, key_cols)
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.orders_staging")
+
+# 月次集計テーブルの属性列の式（店舗データには年齢・性別・居住地・ギフトが無いので固定値）
+MONTHLY_SALES_DIMENSIONS = {
+    "frame.db": {
+        "年齢層": """
+            CASE WHEN CAST(NULLIF(年齢, '') AS INTEGER) IS NULL THEN -1
+                 WHEN CAST(NULLIF(年齢, '') AS INTEGER) < 20 THEN 10
+                 WHEN CAST(NULLIF(年齢, '') AS INTEGER) >= 60 THEN 60
+                 ELSE CAST(NULLIF(年齢, '') AS INTEGER) / 10 * 10 END""",
+        "性別": "COALESCE(性別, '')",
+        "居住地": "COALESCE(居住地, '')",
+        "ギフト": "COALESCE(CAST(NULLIF(ギフト, '') AS INTEGER), 0)",
+    },
+    "framefukuoka.db": {
+        "年齢層": "-1",
+        "性別": "''",
+        "居住地": "''",
+        "ギフト": "0",
+    },
+}
+
+def refresh_monthly_sales(conn, db_filename, since_rowid=0):
+    # ordersの rowid > since_rowid の行を月次集計テーブルに加算する（コミットはしない）
+    # 品番10桁は従来の集計（astype(str).str[:10]）と同じく、品番が空なら'None'
+    dims = MONTHLY_SALES_DIMENSIONS[db_filename]
+    qty = "COALESCE(CAST(NULLIF(点数, '') AS REAL), 0)"
+    price = "COALESCE(CAST(NULLIF(税抜金額, '') AS REAL), 0)"
+    conn.execute(f"""
+        INSERT INTO monthly_sales
+            (品番10, 年月キー, 年, 月, ブランド, 年齢層, 性別, 居住地, ギフト, 点数, 金額合計, 初回rowid, 品名, 色, 税抜金額)
+        SELECT
+            COALESCE(substr(品番, 1, 10), 'None'), 年月キー, CAST(年 AS INTEGER), CAST(月 AS INTEGER),
+            COALESCE(ブランド, ''), {dims["年齢層"]}, {dims["性別"]}, {dims["居住地"]}, {dims["ギフト"]},
+            SUM({qty}), SUM({qty} * {price}), MIN(rowid), 品名, 色, 税抜金額
+        FROM orders
+        WHERE rowid > ? AND 年月キー IS NOT NULL AND NULLIF(年, '') IS NOT NULL AND NULLIF(月, '') IS NOT NULL
+        GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9
+        ON CONFLICT (品番10, 年月キー, 年, 月, ブランド, 年齢層, 性別, 居住地, ギフト) DO UPDATE SET
+            点数 = 点数 + excluded.点数,
+            金額合計 = 金額合計 + excluded.金額合計
+    """, (since_rowid,))
+
+# === 取込済みファイルの管理 ===
+def file_sha256(filename):
+    import hashlib
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def find_ingested_file(conn, file_hash):
+    # 取込済みなら (ファイル名, 取込日時)、未取込ならNone
+    return conn.execute("SELECT ファイル名, 取込日時 FROM ingested_files WHERE ハッシュ = ?", (file_hash,)).fetchone()
+
+def replace_month_rows(conn, kind, year, month, date_range=None):
+    # 同じ月のファイルを取込済みなら、その月の行を削除して置き換えに備える（コミットはしない）
+    # 店舗データはファイル＝1か月分の全件なので、台帳に無くても（台帳導入前の取込分）その月の行があれば置き換える
+    # WEBデータは1日-15日・16日-末日のように分けて出力することがあるので、新しいファイルの受注日の範囲
+    # （date_range: (最小, 最大)）が登録済みの行の受注日の範囲を全て含むときだけ置き換える
+    # （含まない場合は従来どおり重複を除いて追加する）
+    # 戻り値: 削除しなければNone、削除したら削除後の最大rowid
+    #   末尾の行を消すとrowidが再利用されるので、月次集計の追加分はこのrowidより後から数える
+    ym = year * 100 + month
+    registered = conn.execute(
+        "SELECT 1 FROM ingested_files WHERE 種類 = ? AND 年 = ? AND 月 = ?", (kind, year, month)).fetchone()
+    if INGEST_KINDS[kind]["replace_month"] == "registered":
+        if not registered or date_range is None:
+            return None
+        first, last = conn.execute(
+            "SELECT MIN(CAST(受注日 AS INTEGER)), MAX(CAST(受注日 AS INTEGER)) FROM orders WHERE 年月キー = ?",
+            (ym,)).fetchone()
+        if first is not None and (date_range[0] > first or date_range[1] < last):
+            return None
+    elif not registered and not conn.execute("SELECT 1 FROM orders WHERE 年月キー = ? LIMIT 1", (ym,)).fetchone():
+        return None
+    conn.execute("DELETE FROM orders WHERE 年月キー = ?", (ym,))
+    conn.execute("DELETE FROM monthly_sales WHERE 年月キー = ?", (ym,))
+    conn.execute("DELETE FROM ingested_files WHERE 種類 = ? AND 年 = ? AND 月 = ?", (kind, year, month))
+    return get_max_rowid(conn, "orders")
+
+def order_date_range(df):
+    # DataFrameの受注日の (最小, 最大)。受注日が無ければNone
+    dates = df["受注日"].dropna()
+    if dates.empty:
+        return None
+    return int(dates.min()), int(dates.max())
+
+def record_ingested_file(conn, file_hash, kind, filename, year, month, count):
+    from datetime import datetime
+    conn.execute(
+        "INSERT OR REPLACE INTO ingested_files (ハッシュ, 種類, ファイル名, 年, 月, 件数, 取込日時) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (file_hash, kind, os.path.basename(filename), year, month, count, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+    )
+
+def after_month_replaced(db_filename, csv_mode):
+    # 行を削除した後は分析用キャッシュを作り直し、差分追記のCSVは全件出力に切り替える
+    clear_analytics_cache(db_filename)
+    return "full" if csv_mode == "append" else csv_mode
+
+# === 分析用キャッシュ（Parquet） ===
+# ordersを年ごとのParquetファイルに写しておき、出力処理は必要な年・列だけを型付きで読む
+# pyarrowが無い環境ではキャッシュを作らず、従来どおりSQLiteから読む
+# 構成: <ユーザーのデータフォルダ>/analytics_cache/<DBフォルダ別>/<DB名>/年=YYYY/rows-<開始rowid>-<終了rowid>.parquet
+#       反映済みの最終rowid・その時点の rowid <= 最終rowid の行数・最終rowidの行の内容を 最終rowid.txt に記録
+#       （ファイルを全部書き終えてから更新する）
+# キャッシュはPCごとに持つ（DBフォルダに置くとDropboxでDBと別々に同期され、DBと食い違ったキャッシュを使ってしまう）
+# 他のPCが取り込んだDBが同期されて行数・最終rowidの行が記録と合わなくなった場合は、全件から作り直す
+# （末尾の月を置き換えるとrowidが再利用されるので、行数だけでなく行の内容も比べる）
+ANALYTICS_CACHE_DIR = "analytics_cache"
+ANALYTICS_CACHE_MARKER = "最終rowid.txt"
+ANALYTICS_CACHE_MAX_PARTS = 20  # 1年分のファイル数がこれを超えたら、全列を読んだときに1ファイルにまとめる
+ANALYTICS_CACHE_CHUNK_ROWS = 10000  # 更新時に一度に読む行数
+# 数値で持つ列・カテゴリで持つ列（それ以外は文字列のまま）
+ANALYTICS_CACHE_DTYPES = {
+    "frame.db": {
+        "number": ["受注日", "年齢", "税抜金額", "税込金額", "点数", "年", "月"],
+        "category": ["性別", "色", "サイズ", "居住地", "支払方法", "ギフト", "ブランド"],
+    },
+    "framefukuoka.db": {
+        "number": ["税抜金額", "税込金額", "点数", "年", "月"],
+        "category": ["色", "サイズ", "ブランド"],
+    },
+}
+ANALYTICS_PART_PATTERN = re.compile(r"rows-(\d+)-(\d+)\.parquet")
+
+def has_analytics_cache():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def get_analytics_cache_dir(db_filename):
+    # DBのフォルダごとに分ける（--db-dir やベンチマークの一時フォルダのDBのキャッシュと混ざらないように）
+    import hashlib
+    db_dir = os.path.dirname(os.path.abspath(get_db_path(db_filename)))
+    folder_key = hashlib.sha1(db_dir.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(get_local_data_dir(), ANALYTICS_CACHE_DIR, folder_key, os.path.splitext(db_filename)[0])
+
+def read_analytics_marker(cache_dir):
+    # {"最終rowid", "行数", "最終行"}。記録が無い・読めない場合は最終rowidが0
+    import json
+    try:
+        with open(os.path.join(cache_dir, ANALYTICS_CACHE_MARKER), encoding="utf-8") as f:
+            marker = json.load(f)
+        return {"最終rowid": int(marker["最終rowid"]), "行数": int(marker["行数"]), "最終行": marker["最終行"]}
+    except (FileNotFoundError, ValueError, TypeError, KeyError):
+        return {"最終rowid": 0, "行数": 0, "最終行": None}
+
+def get_analytics_db_state(conn, last_rowid):
+    # キャッシュの記録と突き合わせるDBの状態:
+    # (キャッシュに写す対象（年月キーのある行）のうち rowid <= last_rowid の行数, rowid = last_rowid の行の内容)
+    import json
+    rows = conn.execute(
+        "SELECT COUNT(*) FROM orders WHERE 年月キー IS NOT NULL AND rowid <= ?", (last_rowid,)).fetchone()[0]
+    last_row = conn.execute("SELECT * FROM orders WHERE rowid = ?", (last_rowid,)).fetchone()
+    return rows, json.dumps(last_row, ensure_ascii=False, default=str)
+
+def list_analytics_parts(cache_dir, last_rowid, stale=None):
+    # {年: [(開始rowid, 終了rowid, パス)]}
+    # 最終rowidより後のファイル（書込途中で止まった残り）と、まとめ直しで不要になったファイルは除き、
+    # stale にリストを渡せばそのパスを集める
+    parts = {}
+    if not os.path.isdir(cache_dir):
+        return parts
+    for entry in os.listdir(cache_dir):
+        if not entry.startswith("年="):
+            continue
+        year_dir = os.path.join(cache_dir, entry)
+        year_parts = []
+        for name in os.listdir(year_dir):
+            m = ANALYTICS_PART_PATTERN.fullmatch(name)
+            if m:
+                year_parts.append((int(m.group(1)), int(m.group(2)), os.path.join(year_dir, name)))
+        # 範囲の広い順に見て、既に採用したファイルの範囲に含まれるものは除く
+        kept = []
+        for part in sorted(year_parts, key=lambda p: (p[0], -p[1])):
+            if part[1] > last_rowid or any(k[0] <= part[0] and part[1] <= k[1] for k in kept):
+                if stale is not None:
+                    stale.append(part[2])
+            else:
+                kept.append(part)
+        if kept:
+            parts[int(entry[2:])] = kept
+    return parts
+
+def to_analytics_dtypes(df, db_filename):
+    import pandas as pd
+    dtypes = ANALYTICS_CACHE_DTYPES[db_filename]
+    for col in dtypes["number"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    for col in dtypes["category"]:
+        df[col] = df[col].astype("category")
+    return df
+
+def write_parquet(df, path):
+    # 一時ファイルに書いてから置き換える（読込中のファイルを壊さない）
+    tmp_path = path + ".tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+def refresh_analytics_cache(conn, db_filename):
+    # ordersの未反映分（最終rowidより後の行）を年ごとのParquetに追記する
+    # 大量に取り込んだ後でもメモリを使い過ぎないよう、ANALYTICS_CACHE_CHUNK_ROWS 行ずつ読んで書く
+    # キャッシュの更新に失敗しても取込自体は成功させ、次回は作り直す
+    if not has_analytics_cache():
+        return
+    import json
+    import pandas as pd
+    cache_dir = get_analytics_cache_dir(db_filename)
+    try:
+        marker = read_analytics_marker(cache_dir)
+        last_rowid, rows = marker["最終rowid"], marker["行数"]
+        if last_rowid and get_analytics_db_state(conn, last_rowid) != (rows, marker["最終行"]):
+            # 反映済みの範囲の行が変わっている（他のPCでの取込・置き換えが同期された）
+            clear_analytics_cache(db_filename)
+            last_rowid, rows = 0, 0
+        stale = []
+        list_analytics_parts(cache_dir, last_rowid, stale)
+        for path in stale:
+            os.remove(path)
+        first, last = last_rowid + 1, last_rowid
+        for df in pd.read_sql(
+            "SELECT rowid AS 行番号, * FROM orders WHERE rowid > ? AND 年月キー IS NOT NULL ORDER BY rowid",
+            conn, params=(last_rowid,), chunksize=ANALYTICS_CACHE_CHUNK_ROWS,
+        ):
+            if df.empty:
+                continue
+            df = to_analytics_dtypes(df, db_filename)
+            last = int(df["行番号"].max())
+            rows += len(df)
+            for year, part in df.groupby(df["年月キー"] // 100):
+                year_dir = os.path.join(cache_dir, f"年={int(year)}")
+                os.makedirs(year_dir, exist_ok=True)
+                write_parquet(part, os.path.join(year_dir, f"rows-{first:010d}-{last:010d}.parquet"))
+            first = last + 1
+        if last > last_rowid:
+            marker = {"最終rowid": last, "行数": rows, "最終行": get_analytics_db_state(conn, last)[1]}
+            with open(os.path.join(cache_dir, ANALYTICS_CACHE_MARKER), "w", encoding="utf-8") as f:
+                json.dump(marker, f, ensure_ascii=False)
+    except Exception as e:
+        print(f"分析用キャッシュの更新に失敗しました（次回作り直します）: {e}")
+        clear_analytics_cache(db_filename)
+
+def clear_analytics_cache(db_filename):
+    # ordersの行を削除・変更したときはキャッシュを捨てる（次の更新で全件から作り直す）
+    import shutil
+    shutil.rmtree(get_analytics_cache_dir(db_filename), ignore_errors=True)
+
+def read_analytics_cache(db_filename, years=None, columns=None):
+    # キャッシュから指定した年・列だけを読む（rowid順）。キャッシュが使えない場合はNone
+    if not has_analytics_cache():
+        return None
+    import pandas as pd
+    conn = connect_db(db_filename)
+    try:
+        refresh_analytics_cache(conn, db_filename)
+    finally:
+        conn.close()
+    cache_dir = get_analytics_cache_dir(db_filename)
+    last_rowid = read_analytics_marker(cache_dir)["最終rowid"]
+    if last_rowid == 0:
+        return None
+    read_columns = None if columns is None else ["行番号"] + [c for c in columns if c != "行番号"]
+    frames = []
+    try:
+        for year, year_parts in sorted(list_analytics_parts(cache_dir, last_rowid).items()):
+            if years is not None and year not in years:
+                continue
+            year_frames = [pd.read_parquet(p[2], columns=read_columns) for p in year_parts]
+            if columns is None and len(year_parts) > ANALYTICS_CACHE_MAX_PARTS:
+                # ファイルが増えた年は、読み込んだついでに1ファイルにまとめ直す
+                year_df = pd.concat(year_frames, ignore_index=True)
+                first, last = year_parts[0][0], max(p[1] for p in year_parts)
+                write_parquet(year_df, os.path.join(os.path.dirname(year_parts[0][2]), f"rows-{first:010d}-{last:010d}.parquet"))
+                for p in year_parts:
+                    os.remove(p[2])
+                year_frames = [year_df]
+            frames.extend(year_frames)
+    except OSError as e:
+        # 別の処理がまとめ直している最中など。DBから読む
+        print(f"分析用キャッシュを読めませんでした: {e}")
+        return None
+    if not frames:
+        return None
+    df = pd.concat(frames, ignore_index=True).sort_values("行番号", kind="stable", ignore_index=True)
+    return df.drop(columns=["行番号"])
+
+# WEB受注の重複判定キー（既存データと同じく文字列で比較する）
+WEB_ORDER_KEY_COLS = ["受注№", "品番", "税込金額"]
+
+def backfill_return_dates(dates, amounts, state=None):
+    # マイナス金額（返品）の行の受注日を、直前の0円以上の行の受注日で置き換える
+    # 金額が空の行も返品と同じ扱い。先頭から0円以上の行が無い間はそのまま
+    # （旧: iterrows + .at のループと同じ結果をベクトル演算で求める）
+    # 分割して読む場合は state（dict）で前のチャンクの最後の0円以上の行の受注日を引き継ぐ
+    import pandas as pd
+    import numpy as np
+    is_positive = (amounts >= 0).fillna(False).to_numpy(dtype=bool)
+    positions = np.arange(len(dates))
+    # 各行から見た「直前（自分を含む）の0円以上の行」の位置
+    last_positive = pd.Series(np.where(is_positive, positions, np.nan)).ffill().to_numpy()
+    target = ~is_positive & ~np.isnan(last_positive)
+    result = dates.copy()
+    result.iloc[positions[target]] = dates.iloc[last_positive[target].astype(int)].to_numpy()
+    if state is not None:
+        if "last_date" in state:
+            result.iloc[positions[~is_positive & np.isnan(last_positive)]] = state["last_date"]
+        if is_positive.any():
+            state["last_date"] = dates.iloc[positions[is_positive][-1]]
+    return result
+
+# WEB用Excelの列位置
+WEB_COLUMN_INDICES = {
+    "受注日": 0,
+    "受注№": 1,
+    "年齢": 4,
+    "性別": 5,
+    "品番": 6,
+    "品名": 7,
+    "色": 8,
+    "サイズ": 9,
+    "税抜金額": 10,
+    "税込金額": 11,
+    "居住地": 12,
+    "支払方法": 13,
+    "ギフト": 14
+}
+# ギフト対象品番
+WEB_GIFT_ITEMS = ["909900220199", "909900250199", "699900030199"]
+
+def parse_web_filename(filename):
     match = re.search(r"(\d{4})年(\d{1,2})月", filename)
     if not match:
-        messagebox.showerror("エラー", "ファイル名に年と月が含まれていません")
-        return
-    year, month = int(match.group(1)), int(match.group(2))
+        raise ValueError("ファイル名に年と月が含まれていません")
+    return int(match.group(1)), int(match.group(2))
 
-    db_name = get_db_path("frame.db")
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='orders'")
-    if not cursor.fetchone():
-        empty_df = pd.DataFrame(columns=[
-            "受注№", "受注日", "年齢", "性別", "品番", "品名", "色", "サイズ",
-            "税抜金額", "税込金額", "居住地", "支払方法", "年", "月", "点数", "ギフト", "ブランド"
-        ])
-        empty_df.to_sql("orders", conn, if_exists="fail", index=False)
+def parse_web_file(filename):
+    # WEB用Excelを読み込み、orders登録用のDataFrameに変換する（DB・画面には触らない）
+    # 複数ファイル取込ではプロセスプールから呼ばれる
+    # 戻り値: (年, 月, DataFrame)
+    import pandas as pd
+    year, month = parse_web_filename(filename)
 
-    df_existing = pd.read_sql("SELECT * FROM orders", conn)
     df = pd.read_excel(filename, sheet_name=0)
 
-    # 列の順番に基づいてデータを選択
-    column_indices = {
-        "受注日": 0,
-        "受注№": 1,
-        "年齢": 4,
-        "性別": 5,
-        "品番": 6,
-        "品名": 7,
-        "色": 8,
-        "サイズ": 9,
-        "税抜金額": 10,
-        "税込金額": 11,
-        "居住地": 12,
-        "支払方法": 13,
-        "ギフト": 14
-    }
-
     # 必要な列をインデックスで選択
-    selected_columns = [index for index in column_indices.values() if index < len(df.columns)]
+    selected_columns = [index for index in WEB_COLUMN_INDICES.values() if index < len(df.columns)]
     df_selected = df.iloc[:, selected_columns]
-    print("デバッグ情報: 選択された列")
-    print(df_selected.columns)
 
     # 列名を設定
-    df_selected.columns = [name for name, index in column_indices.items() if index < len(df.columns)]
+    df_selected.columns = [name for name, index in WEB_COLUMN_INDICES.items() if index < len(df.columns)]
+    return year, month, transform_web_orders(df_selected, year, month)
 
-    # デバッグ情報: 選択された列を確認
-    #print("デバッグ情報: 選択された列")
-    #print(df_selected.columns)
+def transform_web_orders(df_selected, year, month, state=None):
+    # 列名を付けたWEB受注の行を登録用に変換する
+    # state（dict）を渡すと分割読込用: 返品の受注日補完を前のチャンクから引き継ぎ、
+    # ギフト判定はチャンク内だけで行う（チャンクをまたぐ分は fix_staged_gift_flags で直す）
+    import pandas as pd
 
     # 必要に応じてデータ型を変換
     df_selected.loc[df_selected["品番"].notna(), "品番"] = (
@@ -105,23 +1213,16 @@ def process_file(filename):
 
 
     # マイナス金額補完処理（前の販売日コピー）
-    last_positive_date = None
-    for idx, row in df_selected.iterrows():
-        if row["税込金額"] >= 0:
-            last_positive_date = row["受注日"]
-        else:
-            if last_positive_date is not None:
-                df_selected.at[idx, "受注日"] = last_positive_date
+    df_selected["受注日"] = backfill_return_dates(df_selected["受注日"], df_selected["税込金額"], state)
 
     # その他の処理を続行
     df_selected["年"] = year
     df_selected["月"] = month
+    df_selected["年月キー"] = year * 100 + month
     df_selected["点数"] = df_selected["税込金額"].apply(lambda x: -1 if x < 0 else 1)
 
-    # ギフト対象品番
-    gift_items = ["909900220199", "909900250199", "699900030199"]
     # 品番によるギフト判定
-    gift_orders_by_item = df_selected[df_selected["品番"].astype(str).isin(gift_items)]["受注№"].unique()
+    gift_orders_by_item = df_selected[df_selected["品番"].astype(str).isin(WEB_GIFT_ITEMS)]["受注№"].unique()
     # ギフトリボンに「リボン」が含まれるかどうか（NaNを除外して文字列として検索）
     has_ribbon = df_selected["ギフト"].fillna("").astype(str).str.contains("リボン")
     # ギフトフラグ設定
@@ -129,67 +1230,294 @@ def process_file(filename):
         df_selected["受注№"].isin(gift_orders_by_item) | has_ribbon
     ).astype(int)
 
+    df_selected[WEB_ORDER_KEY_COLS] = df_selected[WEB_ORDER_KEY_COLS].astype(str)
+    return df_selected
+
+# === 大きなExcelの分割読込 ===
+# 繁忙月のWEB受注ファイルは全列を一度に読むとメモリを大きく使うため、
+# 必要な列だけを openpyxl の read_only モードで1行ずつ読み、一定行数ごとに変換・登録する
+EXCEL_CHUNK_ROWS = 5000
+WEB_STREAMING_MIN_BYTES = 20 * 1024 * 1024  # これ以上のWEB受注ファイルは分割読込
+
+def iter_excel_rows(filename, positions):
+    # 先頭シートの行を (行の幅, 指定位置の値のリスト) で1行ずつ返す（1行目の見出しも含む）
+    # セル値の変換は pandas（openpyxlエンジン）の read_excel と同じ。末尾の空行は除き、途中の空行は空の値の行として返す
+    from openpyxl import load_workbook
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    def convert(cell):
+        value = cell.value
+        if value is None:
+            return ""
+        if cell.data_type == TYPE_ERROR:
+            return float("nan")
+        if cell.data_type == TYPE_NUMERIC:
+            int_value = int(value)
+            return int_value if int_value == value else float(value)
+        return value
+
+    wb = load_workbook(filename, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb.worksheets[0]
+        ws.reset_dimensions()
+        empty_rows = 0
+        for row in ws.rows:
+            width = len(row)
+            while width and row[width - 1].value in (None, ""):
+                width -= 1
+            if not width:
+                empty_rows += 1
+                continue
+            for _ in range(empty_rows):
+                yield 0, [""] * len(positions)
+            empty_rows = 0
+            yield width, [convert(row[p]) if p < width else "" for p in positions]
+    finally:
+        wb.close()
+
+def read_excel_chunks(filename, positions, chunk_rows=EXCEL_CHUNK_ROWS):
+    # pd.read_excel(filename, sheet_name=0).iloc[:, positions] と同じ内容を chunk_rows 行ずつ返す
+    # 列の型（欠損を含む整数列はfloatなど）はファイル全体で決まるので、
+    # 1回目はExcelを読みながら各チャンクの型を調べて値を一時ファイルに退避し、2回目は一時ファイルから型をそろえて返す
+    # 列名は列位置。ファイルの列数を超える位置は含めない
+    import pickle
+    import tempfile
+    import numpy as np
+    from pandas.io.parsers import TextParser
+    positions = list(positions)
+
+    def parse(rows, columns, dtype=None):
+        return TextParser(rows, header=None, names=columns, skip_blank_lines=False, dtype=dtype).read()
+
+    with tempfile.TemporaryFile() as spool:
+        # 1回目: ファイルの列数と、各列の型（チャンクごとの型をまとめたもの）
+        width = 0
+        chunk_count = 0
+        kinds = {p: set() for p in positions}
+        has_na = dict.fromkeys(positions, False)
+        rows = []
+
+        def spool_rows():
+            chunk = parse(rows, positions)
+            for p in positions:
+                na = chunk[p].isna()
+                has_na[p] = has_na[p] or bool(na.any())
+                if not na.all():
+                    kinds[p].add(chunk[p].dtype)
+            pickle.dump(rows, spool, pickle.HIGHEST_PROTOCOL)
+
+        rows_iter = iter_excel_rows(filename, positions)
+        header = next(rows_iter, None)
+        if header is not None:
+            width = header[0]
+        for row_width, values in rows_iter:
+            width = max(width, row_width)
+            rows.append(values)
+            if len(rows) >= chunk_rows:
+                spool_rows()
+                chunk_count += 1
+                rows = []
+                report_progress(f"Excel読込中... {chunk_count * chunk_rows} 行")
+        if rows:
+            spool_rows()
+            chunk_count += 1
+        rows = []
+
+        columns = [p for p in positions if p < width]
+        numeric = {np.dtype("int64"), np.dtype("float64")}
+        dtypes = {}
+        for col in columns:
+            found = kinds[col]
+            if not found:
+                dtypes[col] = np.dtype("float64")  # 全て空
+            elif len(found) == 1:
+                dtype = next(iter(found))
+                if has_na[col] and dtype == np.dtype("int64"):
+                    dtype = np.dtype("float64")
+                elif has_na[col] and dtype == np.dtype("bool"):
+                    dtype = np.dtype(object)
+                dtypes[col] = dtype
+            elif found <= numeric:
+                dtypes[col] = np.dtype("float64")
+            else:
+                dtypes[col] = np.dtype(object)
+
+        # 2回目: 型をそろえて返す（object列は数値変換させずに読む）
+        object_cols = {col: object for col in columns if dtypes[col] == np.dtype(object)}
+        indices = [positions.index(col) for col in columns]
+        spool.seek(0)
+        for _ in range(chunk_count):
+            chunk_rows_values = [[values[i] for i in indices] for values in pickle.load(spool)]
+            chunk = parse(chunk_rows_values, columns, object_cols or None)
+            yield chunk.astype({col: dtypes[col] for col in columns if chunk[col].dtype != dtypes[col]})
+
+def fix_staged_gift_flags(conn):
+    # ギフト対象品番を含む受注№の行は全てギフトにする（チャンクをまたいだ受注の分）
+    placeholders = ", ".join("?" * len(WEB_GIFT_ITEMS))
+    conn.execute(f"""
+        UPDATE temp.orders_staging SET ギフト = 1
+        WHERE ギフト = 0 AND 受注№ IN (
+            SELECT 受注№ FROM temp.orders_staging WHERE 品番 IN ({placeholders})
+        )
+    """, WEB_GIFT_ITEMS)
+
+def store_web_file_streaming(conn, filename, chunk_rows=EXCEL_CHUNK_ROWS, replace=False):
+    # WEB用Excelを分割して読み、変換した行を一時テーブルにためてから既存ordersとの重複を除いて登録する
+    # （一時テーブルはSQLite側に置くので、ファイルの大きさによらずメモリ使用量は一定）
+    # replace=True なら、全件を読んで受注日の範囲が分かった後、登録前に replace_month_rows で月を置き換える
+    # 戻り値: (年, 月, 登録件数, replace_month_rows の戻り値)
+    year, month = parse_web_filename(filename)
+    names = {index: name for name, index in WEB_COLUMN_INDICES.items()}
+    state = {}
+    columns = None
+    staged = 0
+    try:
+        for chunk in read_excel_chunks(filename, WEB_COLUMN_INDICES.values(), chunk_rows):
+            chunk.columns = [names[col] for col in chunk.columns]
+            chunk = transform_web_orders(chunk, year, month, state)
+            if columns is None:
+                columns = list(chunk.columns)
+                create_orders_staging(conn, columns)
+            insert_rows(conn, "temp.orders_staging", chunk)
+            staged += len(chunk)
+            report_progress(f"DB登録中... {staged} 行")
+        if columns is None:
+            return year, month, 0, None
+        fix_staged_gift_flags(conn)
+        replaced_rowid = None
+        if replace:
+            first, last = conn.execute(
+                "SELECT MIN(CAST(受注日 AS INTEGER)), MAX(CAST(受注日 AS INTEGER)) FROM temp.orders_staging").fetchone()
+            date_range = None if first is None else (first, last)
+            replaced_rowid = replace_month_rows(conn, "web", year, month, date_range)
+        return year, month, insert_staged_orders(conn, columns, WEB_ORDER_KEY_COLS), replaced_rowid
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.orders_staging")
 
-    compare_cols = ["受注№", "品番", "税込金額"]
-    compare_cols = [col for col in compare_cols if col in df_selected.columns and col in df_existing.columns]
-    df_selected[compare_cols] = df_selected[compare_cols].astype(str)
-    df_existing[compare_cols] = df_existing[compare_cols].astype(str)
+def use_streaming(kind, filename):
+    # 分割読込の対象か（分割読込に対応した種類で、ファイルが一定以上の大きさ）
+    return (INGEST_KINDS[kind]["stream"] is not None and os.path.exists(filename)
+            and os.path.getsize(filename) >= WEB_STREAMING_MIN_BYTES)
 
-    df_selected = pd.merge(
-        df_selected,
-        df_existing[compare_cols].drop_duplicates(),
-        on=compare_cols,
-        how="left",
-        indicator=True
-    )
-    df_selected = df_selected[df_selected["_merge"] == "left_only"].drop(columns=["_merge"])
+def store_web_orders(conn, df):
+    # 既存ordersとの重複除外はSQLite内で実施（全件読み込みはしない）
+    return insert_new_orders(conn, df, WEB_ORDER_KEY_COLS)
+
+def check_ingested(db_filename, filename):
+    # 取込済みと同じ内容のファイルなら (ハッシュ, (ファイル名, 取込日時))、未取込なら (ハッシュ, None)
+    file_hash = file_sha256(filename)
+    conn = connect_db(db_filename)
+    try:
+        return file_hash, find_ingested_file(conn, file_hash)
+    finally:
+        conn.close()
+
+@profiled("WEB取込")
+def process_file(filename, csv_mode="full"):
+    # 取込済みと同じ内容のファイルは読まずにスキップ
+    with profile_stage("取込済み確認"):
+        file_hash, ingested = check_ingested("frame.db", filename)
+    if ingested:
+        dialogs.showinfo("結果", f"✅ このファイルは取込済みです（{ingested[0]}、{ingested[1]}）。")
+        return
+
+    # 大きなファイルは分割して読みながら登録する（読込はDB登録と同じトランザクションの中で行う）
+    streaming = use_streaming("web", filename)
+    try:
+        if streaming:
+            year, month = parse_web_filename(filename)
+        else:
+            with profile_stage("Excel読込・変換") as stage:
+                year, month, df_selected = parse_web_file(filename)
+                stage["rows"] = len(df_selected)
+    except ValueError as e:
+        dialogs.showerror("エラー", str(e))
+        return
 
-    if df_selected.empty:
-        messagebox.showinfo("結果", "✅ 新規データはありませんでした。")
+    # テーブル・インデックスは connect_db のマイグレーションで作成済み
+    # 同じ月のファイルを取込済みなら、その月の行を削除してから登録する（1トランザクション）
+    report_progress("DB登録中...")
+    conn = connect_db("frame.db")
+    last_rowid = get_max_rowid(conn, "orders")
+    try:
+        with profile_stage("分割読込・DB登録" if streaming else "DB登録") as stage:
+            if streaming:
+                inserted, replaced_rowid = store_web_file_streaming(conn, filename, replace=True)[2:]
+            else:
+                replaced_rowid = replace_month_rows(conn, "web", year, month, order_date_range(df_selected))
+                inserted = store_web_orders(conn, df_selected)
+            replaced = replaced_rowid is not None
+            record_ingested_file(conn, file_hash, "web", filename, year, month, inserted)
+            stage["rows"] = inserted
+        report_progress("月次集計中...")
+        with profile_stage("月次集計"):
+            refresh_monthly_sales(conn, "frame.db", min(last_rowid, replaced_rowid) if replaced else last_rowid)
+            # キャンセルはコミットの直前まで（キャンセルしたら登録・月の置き換えを全て取り消す）
+            report_progress("登録を確定中...")
+            conn.commit()
+        clear_summary_cache()
+        if replaced:
+            csv_mode = after_month_replaced("frame.db", csv_mode)
+        report_progress("分析キャッシュ更新中...", cancellable=False)
+        with profile_stage("分析キャッシュ更新"):
+            refresh_analytics_cache(conn, "frame.db")
+    except Exception:
+        conn.rollback()
+        conn.close()
+        raise
+
+    if replaced:
+        dialogs.showinfo("完了", f"✅ {year}年{month}月のデータを置き換えました（{inserted} 件）。")
+    elif inserted == 0:
+        dialogs.showinfo("結果", "✅ 新規データはありませんでした。")
     else:
-        df_selected.to_sql("orders", conn, if_exists="append", index=False)
         diff_csv = f"{year}年{month}月_差分出力.csv"
-        #df_selected.to_csv(diff_csv, index=False, encoding="utf-8-sig")
-        messagebox.showinfo("完了", f"✅ 新規データ {len(df_selected)} 件を登録しました。差分CSV: {diff_csv}")
-
-    df_all = pd.read_sql("SELECT * FROM orders", conn)
-    df_all.to_csv("frame_全データ出力.csv", index=False, encoding="utf-8-sig")
+        dialogs.showinfo("完了", f"✅ 新規データ {inserted} 件を登録しました。差分CSV: {diff_csv}")
+
+    report_progress("CSV出力中...", cancellable=False)
+    with profile_stage("CSV出力"):
+        if csv_mode == "full":
+            export_table_csv(conn, "orders", WEB_CSV)
+        elif csv_mode == "append":
+            export_table_csv(conn, "orders", WEB_CSV, since_rowid=last_rowid)
     conn.close()
 
-def process_fukuoka_file(filename):
-    import re
+# === 消費税 ===
+# 税区分ごとの税率表: [(適用開始の年月キー, 税率)]（開始の古い順）
+# 税率が変わったときは該当する区分の末尾に追加する
+TAX_RATES = {
+    "標準": [(0, 0.05), (201404, 0.08), (201910, 0.10)],
+    "軽減": [(0, 0.05), (201404, 0.08), (201910, 0.08)],
+}
+
+def tax_rates(year_month_keys, category="標準"):
+    # 年月キー（スカラーまたは配列）ごとの税率を税率表から引く
+    import numpy as np
+    starts, rates = zip(*TAX_RATES[category])
+    index = np.searchsorted(starts, np.asarray(year_month_keys), side="right") - 1
+    return np.asarray(rates)[index]
+
+def add_tax(prices, year_month_keys, category="標準"):
+    # 税抜金額→税込金額（1円未満は四捨五入、従来の int(round()) と同じく偶数丸め）
+    import numpy as np
+    return np.round(np.asarray(prices, dtype=float) * (1 + tax_rates(year_month_keys, category))).astype("int64")
+
+def remove_tax(prices, year_month_keys, category="標準"):
+    # 税込金額→税抜金額（丸めは呼び出し側で行う）
+    import numpy as np
+    return np.asarray(prices, dtype=float) / (1 + tax_rates(year_month_keys, category))
+
+def parse_store_file(filename):
+    # 店舗用Excelを読み込み、orders登録用のDataFrameに変換する（DB・画面には触らない）
+    # 戻り値: (年, 月, DataFrame)
     import pandas as pd
-    import sqlite3
-    import os
-    from tkinter import messagebox
 
     # ファイル名から年・月を抽出（例: データ出力202404 → 2024, 4）
     match = re.search(r"データ出力(\d{4})(\d{2})", os.path.basename(filename))
     if not match:
-        messagebox.showerror("エラー", "ファイル名に 'データ出力yyyymm' の形式がありません")
-        return
+        raise ValueError("ファイル名に 'データ出力yyyymm' の形式がありません")
     year, month = int(match.group(1)), int(match.group(2))
 
-    db_name = get_db_path("framefukuoka.db")
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    # テーブル作成（なければ）
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS orders (
-            品番 TEXT,
-            品名 TEXT,
-            色 TEXT,
-            サイズ TEXT,
-            税抜金額 INTEGER,
-            税込金額 INTEGER,
-            点数 INTEGER,
-            年 INTEGER,
-            月 INTEGER,
-            ブランド TEXT
-        )
-    """)
-    conn.commit()
-
     # Excel読込
     try:
         df = pd.read_excel(filename, dtype=str)
@@ -197,9 +1525,7 @@ def process_fukuoka_file(filename):
         if "社員名" in df.columns:
             df = df[df["社員名"] != "ｗｅｂ"]
     except Exception as e:
-        messagebox.showerror("エラー", f"Excelファイルの読込に失敗しました: {e}")
-        conn.close()
-        return
+        raise ValueError(f"Excelファイルの読込に失敗しました: {e}")
 
     # 列名マッピング
     col_map = {
@@ -213,9 +1539,7 @@ def process_fukuoka_file(filename):
     # 必要な列のみ抽出
     missing_cols = [v for v in col_map.values() if v not in df.columns]
     if missing_cols:
-        messagebox.showerror("エラー", f"列名が不足しています: {missing_cols}")
-        conn.close()
-        return
+        raise ValueError(f"列名が不足しています: {missing_cols}")
     df_selected = df[[col_map[k] for k in col_map]].copy()
     df_selected.columns = list(col_map.keys())
 
@@ -223,35 +1547,483 @@ def process_fukuoka_file(filename):
     df_selected["税抜金額"] = pd.to_numeric(df_selected["税抜金額"], errors="coerce").fillna(0).astype(int)
     df_selected["点数"] = pd.to_numeric(df_selected["点数"], errors="coerce").fillna(0).astype(int)
 
-    # 税込金額計算
-    def calc_tax(price, y, m):
-        if y < 2014 or (y == 2014 and m <= 3):
-            rate = 1.05
-        elif (y == 2014 and m >= 4) or (2014 < y < 2019) or (y == 2019 and m <= 9):
-            rate = 1.08
-        else:
-            rate = 1.10
-        return int(round(price * rate))
-    df_selected["税込金額"] = df_selected["税抜金額"].apply(lambda x: calc_tax(x, year, month))
+    # 税込金額計算（ファイルの年月の税率で一括計算）
+    df_selected["税込金額"] = add_tax(df_selected["税抜金額"], year * 100 + month)
 
     # 年・月を追加
     df_selected["年"] = year
     df_selected["月"] = month
+    df_selected["年月キー"] = year * 100 + month
 
     # ブランド名追加（関数化したget_brand_mapを利用）
     brand_map = get_brand_map()
     df_selected["ブランド"] = df_selected["品番"].astype(str).str[:2].map(brand_map).fillna("その他")
+    return year, month, df_selected
+
+def store_store_orders(conn, df):
+    return insert_rows(conn, "orders", df)
+
+@profiled("店舗取込")
+def process_fukuoka_file(filename, csv_mode="full"):
+    # 取込済みと同じ内容のファイルは読まずにスキップ
+    with profile_stage("取込済み確認"):
+        file_hash, ingested = check_ingested("framefukuoka.db", filename)
+    if ingested:
+        dialogs.showinfo("結果", f"✅ このファイルは取込済みです（{ingested[0]}、{ingested[1]}）。")
+        return
 
-    # DBへINSERT
     try:
-        df_selected.to_sql("orders", conn, if_exists="append", index=False)
-        messagebox.showinfo("完了", f"✅ {len(df_selected)} 件を登録しました。")
+        with profile_stage("Excel読込・変換") as stage:
+            year, month, df_selected = parse_store_file(filename)
+            stage["rows"] = len(df_selected)
+    except ValueError as e:
+        dialogs.showerror("エラー", str(e))
+        return
+
+    # テーブル作成はマイグレーションで実施
+    report_progress("DB登録中...")
+    conn = connect_db("framefukuoka.db")
+
+    # DBへINSERT（その月の行が既にあれば置き換える）
+    last_rowid = get_max_rowid(conn, "orders")
+    try:
+        with profile_stage("DB登録") as stage:
+            replaced_rowid = replace_month_rows(conn, "store", year, month)
+            replaced = replaced_rowid is not None
+            inserted = store_store_orders(conn, df_selected)
+            record_ingested_file(conn, file_hash, "store", filename, year, month, inserted)
+            stage["rows"] = inserted
+        report_progress("月次集計中...")
+        with profile_stage("月次集計"):
+            refresh_monthly_sales(conn, "framefukuoka.db", min(last_rowid, replaced_rowid) if replaced else last_rowid)
+            # キャンセルはコミットの直前まで（キャンセルしたら登録・月の置き換えを全て取り消す）
+            report_progress("登録を確定中...")
+            conn.commit()
+        clear_summary_cache()
+        if replaced:
+            csv_mode = after_month_replaced("framefukuoka.db", csv_mode)
+        report_progress("分析キャッシュ更新中...", cancellable=False)
+        with profile_stage("分析キャッシュ更新"):
+            refresh_analytics_cache(conn, "framefukuoka.db")
+        if replaced:
+            dialogs.showinfo("完了", f"✅ {year}年{month}月のデータを置き換えました（{len(df_selected)} 件）。")
+        else:
+            dialogs.showinfo("完了", f"✅ {len(df_selected)} 件を登録しました。")
+    except TaskCancelled:
+        conn.rollback()
+        conn.close()
+        raise
     except Exception as e:
-        messagebox.showerror("エラー", f"DB登録に失敗しました: {e}")
+        conn.rollback()
+        dialogs.showerror("エラー", f"DB登録に失敗しました: {e}")
+
+    report_progress("CSV出力中...", cancellable=False)
+    with profile_stage("CSV出力"):
+        if csv_mode == "full":
+            export_table_csv(conn, "orders", STORE_CSV)
+        elif csv_mode == "append":
+            export_table_csv(conn, "orders", STORE_CSV, since_rowid=last_rowid)
+    conn.close()
 
-    df_all = pd.read_sql("SELECT * FROM orders", conn)
-    df_all.to_csv("framefukuoka_全データ出力.csv", index=False, encoding="utf-8-sig")
+# 取込の種類ごとの設定（複数ファイル取込用）
+INGEST_KINDS = {
+    # replace_month: 同じ月の行を置き換える条件（"registered": 同じ月のファイルが台帳にあり、新しいファイルがその期間を全て含む / "always": その月の行がある）
+    "web": {"parse": parse_web_file, "store": store_web_orders, "stream": store_web_file_streaming,
+            "filename_month": parse_web_filename, "db": "frame.db", "csv": WEB_CSV, "replace_month": "registered"},
+    "store": {"parse": parse_store_file, "store": store_store_orders, "stream": None,
+              "filename_month": None, "db": "framefukuoka.db", "csv": STORE_CSV, "replace_month": "always"},
+}
+
+@profiled("一括取込", arg_indexes=(0, 1))
+def ingest_files(kind, file_paths, csv_mode="append", progress=None):
+    # 複数ファイルの一括取込
+    #   1. Excelの読込・変換（CPU負荷が高い）はプロセスプールで並列実行
+    #   2. DBへの登録は1つの接続から1トランザクションでまとめて実行
+    #      大きなファイル（use_streaming）はプロセスプールに回さず、登録時に分割して読みながら登録する
+    #   取込済み（台帳にある）ファイルと、選択した中で内容が同じファイルは読まずにスキップする
+    #   同じ月のファイルを取込済みなら、その月の行を置き換える（条件は replace_month_rows）
+    # progress(完了数, 全体数, ファイル名, エラー文字列またはNone) で1ファイルごとに通知する
+    # 戻り値: {"inserted": 登録件数, "files": [(ファイル名, 件数)], "errors": [(ファイル名, エラー)],
+    #          "skipped": [(ファイル名, 理由)], "replaced": [置き換えたファイル名]}
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    config = INGEST_KINDS[kind]
+    file_paths = list(dict.fromkeys(file_paths))  # 同じファイルの重複指定は1回だけ
+    parsed = {}
+    errors = []
+    skipped = []
+    hashes = {}
+    with profile_stage("取込済み確認"):
+        conn = connect_db(config["db"])
+        try:
+            for path in file_paths:
+                try:
+                    file_hash = file_sha256(path)
+                except OSError as e:
+                    errors.append((path, str(e)))
+                    continue
+                ingested = find_ingested_file(conn, file_hash)
+                same = [other for other, other_hash in hashes.items() if other_hash == file_hash]
+                if ingested:
+                    skipped.append((path, f"取込済み（{ingested[0]}、{ingested[1]}）"))
+                elif same:
+                    skipped.append((path, f"{os.path.basename(same[0])} と同じ内容"))
+                else:
+                    hashes[path] = file_hash
+        finally:
+            conn.close()
+    file_paths = [path for path in file_paths if path in hashes]
+    total = len(file_paths) + len(errors)
+    streamed = {path for path in file_paths if use_streaming(kind, path)}
+    pool_paths = [path for path in file_paths if path not in streamed]
+
+    def on_parsed(file_path, result=None, error=None):
+        if error is None:
+            parsed[file_path] = result
+        else:
+            errors.append((file_path, error))
+        if progress:
+            progress(len(parsed) + len(errors), total, file_path, error)
+
+    # 並列で読む場合、記録する使用メモリに子プロセスの分は含まれない
+    with profile_stage("Excel読込・変換") as stage:
+        workers = min(len(pool_paths), os.cpu_count() or 1)
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(config["parse"], path): path for path in pool_paths}
+                try:
+                    for future in as_completed(futures):
+                        try:
+                            parsed_result = future.result()
+                        except Exception as e:
+                            on_parsed(futures[future], error=str(e))
+                        else:
+                            on_parsed(futures[future], parsed_result)
+                except TaskCancelled:
+                    # 未着手のファイルは読み込まずに終了
+                    for future in futures:
+                        future.cancel()
+                    raise
+        else:
+            for path in pool_paths:
+                try:
+                    parsed_result = config["parse"](path)
+                except Exception as e:
+                    on_parsed(path, error=str(e))
+                else:
+                    on_parsed(path, parsed_result)
+        stage["rows"] = sum(len(parsed_result[2]) for parsed_result in parsed.values())
+
+    # 登録はファイル選択順に、1トランザクションで行う
+    result = {"inserted": 0, "files": [], "errors": errors, "skipped": skipped, "replaced": []}
+    if not parsed and not streamed:
+        return result
+    report_progress("DB登録中...")
+    conn = connect_db(config["db"])
+    try:
+        with profile_stage("DB登録") as stage:
+            last_rowid = since_rowid = get_max_rowid(conn, "orders")
+            conn.execute("BEGIN")
+            for path in file_paths:
+                if path in streamed:
+                    # 読込途中で失敗したファイルは、月の置き換えも含めてセーブポイントまで戻す
+                    conn.execute("SAVEPOINT stream_file")
+                    try:
+                        year, month = config["filename_month"](path)
+                        count, replaced_rowid = config["stream"](conn, path, replace=True)[2:]
+                    except TaskCancelled:
+                        raise
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO stream_file")
+                        conn.execute("RELEASE stream_file")
+                        on_parsed(path, error=str(e))
+                        continue
+                    conn.execute("RELEASE stream_file")
+                    on_parsed(path, None)
+                elif path in parsed:
+                    year, month, df = parsed[path]
+                    date_range = order_date_range(df) if "受注日" in df.columns else None
+                    replaced_rowid = replace_month_rows(conn, kind, year, month, date_range)
+                    count = config["store"](conn, df)
+                else:
+                    continue
+                record_ingested_file(conn, hashes[path], kind, path, year, month, count)
+                if replaced_rowid is not None:
+                    since_rowid = min(since_rowid, replaced_rowid)
+                    result["replaced"].append(path)
+                result["files"].append((path, count))
+                result["inserted"] += count
+            stage["rows"] = result["inserted"]
+        report_progress("月次集計中...")
+        with profile_stage("月次集計"):
+            refresh_monthly_sales(conn, config["db"], since_rowid)
+            report_progress("登録を確定中...")
+            conn.commit()
+        clear_summary_cache()
+        if result["replaced"]:
+            csv_mode = after_month_replaced(config["db"], csv_mode)
+        report_progress("分析キャッシュ更新中...", cancellable=False)
+        with profile_stage("分析キャッシュ更新"):
+            refresh_analytics_cache(conn, config["db"])
+    except Exception:
+        conn.rollback()
+        conn.close()
+        raise
+
+    report_progress("CSV出力中...", cancellable=False)
+    with profile_stage("CSV出力"):
+        if csv_mode in ("full", "deferred"):
+            export_table_csv(conn, "orders", config["csv"])
+        elif csv_mode == "append":
+            export_table_csv(conn, "orders", config["csv"], since_rowid=last_rowid)
     conn.close()
+    return result
+
+def show_ingest_result(result, total):
+    # 一括取込の結果（ファイルごとの件数・エラー）を表示
+    lines = [f"✅ {len(result['files'])} / {total} 件のファイルを処理しました（新規 {result['inserted']} 件）。"]
+    for path, count in result["files"]:
+        note = "（月の置き換え）" if path in result["replaced"] else ""
+        lines.append(f"  {os.path.basename(path)}: {count} 件{note}")
+    if result["skipped"]:
+        lines.append("")
+        lines.append("⏭ スキップ:")
+        for path, reason in result["skipped"]:
+            lines.append(f"  {os.path.basename(path)}: {reason}")
+    if result["errors"]:
+        lines.append("")
+        lines.append("❌ エラー:")
+        for path, error in result["errors"]:
+            lines.append(f"  {os.path.basename(path)}: {error}")
+        dialogs.showwarning("完了（エラーあり）", "\n".join(lines))
+    else:
+        dialogs.showinfo("完了", "\n".join(lines))
+
+def print_ingest_progress(done, total, file_path, error):
+    status = f"エラー: {error}" if error else "読込完了"
+    print(f"[{done}/{total}] {os.path.basename(file_path)} {status}")
+    report_progress(f"[{done}/{total}] {os.path.basename(file_path)} {status}", done, total)
+
+# === バックグラウンド実行 ===
+# 取込・集計などの重い処理はワーカースレッドで実行し、Tkのメインループを止めない
+# ワーカーからの進捗・結果・ダイアログ表示はキュー経由でメインスレッドに渡し、after() で処理する
+
+class TaskCancelled(Exception):
+    pass
+
+class TaskRunner:
+    def __init__(self, root, poll_ms=100):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.thread = None
+        self.progress_window = None
+        self.root.after(self.poll_ms, self._poll)
+
+    def is_busy(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def is_worker(self):
+        return threading.current_thread() is self.thread
+
+    def run(self, title, func, *args):
+        if self.is_busy():
+            messagebox.showwarning("実行中", "他の処理を実行中です。終了してから再度実行してください。")
+            return
+        self.cancel_event.clear()
+        self._open_progress_window(title)
+        self.thread = threading.Thread(target=self._work, args=(func, args), daemon=True)
+        self.thread.start()
+
+    def _work(self, func, args):
+        try:
+            func(*args)
+            self.queue.put(("done", None))
+        except TaskCancelled:
+            self.queue.put(("cancelled", None))
+        except Exception:
+            self.queue.put(("error", traceback.format_exc()))
+        finally:
+            release_db_connections()
+
+    def report(self, message, done=None, total=None, cancellable=True):
+        # ワーカーから呼ぶ。キャンセル要求があればここで中断する（cancellable=False のときは通知のみ）
+        self.queue.put(("progress", (message, done, total)))
+        if cancellable and self.cancel_event.is_set():
+            raise TaskCancelled()
+
+    def call_in_ui(self, func, *args):
+        # ワーカーからダイアログ等をメインスレッドで実行し、結果を待つ
+        done = threading.Event()
+        result = {}
+        self.queue.put(("call", (func, args, done, result)))
+        done.wait()
+        if "error" in result:
+            raise result["error"]
+        return result.get("value")
+
+    def _poll(self):
+        try:
+            while True:
+                kind, payload = self.queue.get_nowait()
+                if kind == "progress":
+                    self._update_progress(*payload)
+                elif kind == "call":
+                    func, args, done, result = payload
+                    try:
+                        result["value"] = func(*args)
+                    except Exception as e:
+                        result["error"] = e
+                    done.set()
+                elif kind == "done":
+                    self._close_progress_window()
+                elif kind == "cancelled":
+                    self._close_progress_window()
+                    messagebox.showinfo("キャンセル", "処理をキャンセルしました。")
+                elif kind == "error":
+                    self._close_progress_window()
+                    print(payload)
+                    messagebox.showerror("エラー", f"処理中にエラーが発生しました:\n{payload.strip().splitlines()[-1]}")
+        except queue.Empty:
+            pass
+        self.root.after(self.poll_ms, self._poll)
+
+    def _open_progress_window(self, title):
+        win = tk.Toplevel(self.root)
+        win.title(title)
+        win.geometry("360x130")
+        win.transient(self.root)
+        win.protocol("WM_DELETE_WINDOW", self.cancel)
+        self.progress_label = tk.Label(win, text=f"{title} 実行中...", font=("Arial", 10))
+        self.progress_label.pack(pady=10)
+        self.progress_bar = ttk.Progressbar(win, length=300, mode="indeterminate")
+        self.progress_bar.pack(pady=5)
+        self.progress_bar.start(10)
+        self.cancel_button = tk.Button(win, text="キャンセル", command=self.cancel)
+        self.cancel_button.pack(pady=5)
+        self.progress_window = win
+
+    def _update_progress(self, message, done, total):
+        if self.progress_window is None:
+            return
+        self.progress_label.config(text=message)
+        if total:
+            if str(self.progress_bar["mode"]) != "determinate":
+                self.progress_bar.stop()
+                self.progress_bar.config(mode="determinate", maximum=total)
+            self.progress_bar["value"] = done
+        elif str(self.progress_bar["mode"]) != "indeterminate":
+            self.progress_bar.config(mode="indeterminate")
+            self.progress_bar.start(10)
+
+    def _close_progress_window(self):
+        if self.progress_window is not None:
+            self.progress_window.destroy()
+            self.progress_window = None
+
+    def cancel(self):
+        # 次の進捗通知のタイミングで中断される
+        self.cancel_event.set()
+        if self.progress_window is not None:
+            self.progress_label.config(text="キャンセル中...")
+            self.cancel_button.config(state="disabled")
+
+# GUI起動時に TaskRunner を設定する（未設定のときはその場で実行）
+task_runner = None
+
+def run_task(title, func, *args):
+    if task_runner is None:
+        func(*args)
+    else:
+        task_runner.run(title, func, *args)
+
+def report_progress(message, done=None, total=None, cancellable=True):
+    # 処理の途中経過を通知（ワーカースレッド以外から呼ばれた場合は何もしない）
+    # キャンセルされていれば TaskCancelled を送出する。DBのコミット後（CSV出力など）は
+    # 途中でやめると全データCSVとDBがずれるので cancellable=False で通知だけ行う
+    if task_runner is not None and task_runner.is_worker():
+        task_runner.report(message, done, total, cancellable)
+
+class UiDialogs:
+    # messagebox の代わりに使う
+    # ワーカースレッドから呼ばれた場合はメインスレッドで表示して結果を待つ
+    def _call(self, func, *args):
+        # 計測中はダイアログを閉じるまでの時間を段階として分けておく
+        with profile_stage("ダイアログ表示"):
+            if task_runner is not None and task_runner.is_worker():
+                return task_runner.call_in_ui(func, *args)
+            return func(*args)
+
+    def showinfo(self, title, message):
+        return self._call(messagebox.showinfo, title, message)
+
+    def showwarning(self, title, message):
+        return self._call(messagebox.showwarning, title, message)
+
+    def showerror(self, title, message):
+        return self._call(messagebox.showerror, title, message)
+
+    def askyesno(self, title, message):
+        return self._call(messagebox.askyesno, title, message)
+
+dialogs = UiDialogs()
+
+class ConsoleDialogs:
+    # コマンドライン実行用: ダイアログの内容をコンソールに出力する
+    # 上書き確認は assume_yes で答え、エラー・警告・「いいえ」があれば failed を立てる（終了コードに使う）
+    def __init__(self, assume_yes=False):
+        self.assume_yes = assume_yes
+        self.failed = False
+
+    def showinfo(self, title, message):
+        print(f"[{title}] {message}")
+
+    def showwarning(self, title, message):
+        self.failed = True
+        print(f"[{title}] {message}", file=sys.stderr)
+
+    def showerror(self, title, message):
+        self.failed = True
+        print(f"[{title}] {message}", file=sys.stderr)
+
+    def askyesno(self, title, message):
+        answer = "はい" if self.assume_yes else "いいえ（--yes で上書き）"
+        print(f"[{title}] {message} → {answer}")
+        if not self.assume_yes:
+            self.failed = True
+        return self.assume_yes
+
+def import_single_file(kind, file_path, csv_mode):
+    # 1ファイル取込（deferredのときは最後に全件出力）
+    report_progress(f"{os.path.basename(file_path)} 取込中...")
+    if kind == "web":
+        process_file(file_path, csv_mode="none" if csv_mode == "deferred" else csv_mode)
+    else:
+        process_fukuoka_file(file_path, csv_mode="none" if csv_mode == "deferred" else csv_mode)
+    if csv_mode == "deferred":
+        config = INGEST_KINDS[kind]
+        report_progress("CSV出力中...", cancellable=False)
+        export_orders_csv(config["db"], config["csv"])
+
+def import_multiple_files(kind, file_paths, csv_mode):
+    result = ingest_files(kind, file_paths, csv_mode, progress=print_ingest_progress)
+    show_ingest_result(result, len(file_paths))
+
+def get_report_params(selected_brand_var):
+    # 集計条件を画面から取得（ワーカースレッドでTk変数を読まないよう、実行前にメインスレッドで呼ぶ）
+    return ReportRequest(
+        start_year=int(start_year_var.get()),
+        start_month=int(start_month_var.get()),
+        end_year=int(end_year_var.get()),
+        end_month=int(end_month_var.get()),
+        db_mode=db_select_var.get(),
+        brand=selected_brand_var.get(),
+        age=filter_age_var.get(),
+        gender=filter_gender_var.get(),
+        region=filter_region_var.get(),
+        gift=filter_gift_var.get(),
+    )
 
 def upload_file():
     file_path = filedialog.askopenfilename(
@@ -259,7 +2031,7 @@ def upload_file():
         filetypes=[("Excel Files", "*.xlsx *.xls")]
     )
     if file_path:
-        process_file(file_path)
+        run_task("WEB用ファイル取込", import_single_file, "web", file_path, csv_export_mode_var.get())
 
 def upload_files():
     file_paths = filedialog.askopenfilenames(
@@ -267,9 +2039,7 @@ def upload_files():
         filetypes=[("Excel Files", "*.xlsx *.xls")]
     )
     if file_paths:
-        for file_path in file_paths:
-            process_file(file_path)
-        messagebox.showinfo("完了", f"✅ {len(file_paths)} 件のファイルを処理しました。")
+        run_task("WEB用ファイル一括取込", import_multiple_files, "web", list(file_paths), csv_export_mode_var.get())
 
 def upload_fukuoka_file():
     file_path = filedialog.askopenfilename(
@@ -277,7 +2047,7 @@ def upload_fukuoka_file():
         filetypes=[("Excel Files", "*.xlsx *.xls")]
     )
     if file_path:
-        process_fukuoka_file(file_path)
+        run_task("店舗用ファイル取込", import_single_file, "store", file_path, csv_export_mode_var.get())
 
 def upload_fukuoka_files():
     file_paths = filedialog.askopenfilenames(
@@ -285,46 +2055,40 @@ def upload_fukuoka_files():
         filetypes=[("Excel Files", "*.xlsx *.xls")]
     )
     if file_paths:
-        for file_path in file_paths:
-            process_fukuoka_file(file_path)
-        messagebox.showinfo("完了", f"✅ {len(file_paths)} 件のファイルを処理しました。")
-
-def export_data(start_product_code, end_product_code):
-    start_year = int(start_year_var.get())
-    start_month = int(start_month_var.get())
-    end_year = int(end_year_var.get())
-    end_month = int(end_month_var.get())
-    start_key = start_year * 100 + start_month
-    end_key = end_year * 100 + end_month
-
-    # ダウンロードフォルダのパスを取得
-    folder = os.path.join(os.path.expanduser("~"), "Downloads")
+        run_task("店舗用ファイル一括取込", import_multiple_files, "store", list(file_paths), csv_export_mode_var.get())
 
-    conn = sqlite3.connect(get_db_path("frame.db"))
-    df = pd.read_sql("SELECT * FROM orders", conn)
-
-    # デバッグ情報: データ型を確認
-    print("デバッグ情報: データ型")
-    print(df.dtypes)
+@profiled("データ出力")
+def export_data(request, start_product_code="", end_product_code=""):
+    # 期間は ReportRequest（get_report_params / コマンドラインの指定）から受け取る
+    import pandas as pd
+    start_year = request.start_year
+    start_month = request.start_month
+    end_year = request.end_year
+    end_month = request.end_month
+    start_key = request.start_key
+    end_key = request.end_key
+
+    folder = get_output_folder(request)
+
+    # 分析用キャッシュがあれば対象年の分だけ読む（無ければDBから全件）
+    with profile_stage("データ読込") as stage:
+        df = read_analytics_cache("frame.db", years=range(start_year, end_year + 1))
+        if df is None:
+            conn = connect_db("frame.db")
+            df = read_sql_compact("SELECT * FROM orders", conn, categories=ANALYTICS_CACHE_DTYPES["frame.db"]["category"])
+            conn.close()
+        stage["rows"] = len(df)
 
     # 年と月を数値型に変換
     df["年"] = pd.to_numeric(df["年"], errors="coerce")
     df["月"] = pd.to_numeric(df["月"], errors="coerce")
 
-    # 欠損値を確認
-    print("デバッグ情報: 欠損値の数")
-    print(df[["年", "月"]].isna().sum())
-
     # 欠損値を削除
     df = df.dropna(subset=["年", "月"])
 
     # 年月キーの計算
     df["年月キー"] = (df["年"].astype(int) * 100 + df["月"].astype(int)).astype("Int64")
 
-    # デバッグ情報: 年月キーの計算結果を確認
-    print("デバッグ情報: 年月キーの計算結果")
-    print(df[["年", "月", "年月キー"]].head())
-
     # 年月でフィルタリング
     filtered_df = df[(df["年月キー"] >= start_key) & (df["年月キー"] <= end_key)].drop(columns=["年月キー"])
 
@@ -334,9 +2098,8 @@ def export_data(start_product_code, end_product_code):
             (filtered_df["品番"] >= start_product_code) & (filtered_df["品番"] <= end_product_code)
         ]
 
-    conn.close()
     if filtered_df.empty:
-        messagebox.showinfo("結果", "該当期間または指定された品番のデータはありませんでした。")
+        dialogs.showinfo("結果", "該当期間または指定された品番のデータはありませんでした。")
         return
 
     # 列の並びを変更
@@ -357,36 +2120,66 @@ def export_data(start_product_code, end_product_code):
 
 
     # データをExcelに保存
-    filtered_df.to_excel(full_path, index=False)
-    messagebox.showinfo("完了", f"✅ データをExcelに出力しました：\n{full_path}")
+    with profile_stage("Excel出力") as stage:
+        filtered_df.to_excel(full_path, index=False)
+        stage["rows"] = len(filtered_df)
+    dialogs.showinfo("完了", f"✅ データをExcelに出力しました：\n{full_path}")
+
+# 革の種類のキーワードリスト（並び順が判定の優先順位）
+LEATHER_KEYWORDS = [
+    "SAMPL", "OXFORD", "LON/BRI", "BRITISH COUNTRY", "SHRUNKEN", "SAFARI", "DERBY", "REGENT",
+    "LON", "CORDOVAN", "ST.JAMES", "GASTON", "SHRUNKEN", "HAMPSTEAD",
+    "VIN BR", "HORWEEN/BRI", "BR/RUS", "PLAITED", "VTC BADALASSI",
+    "BADALASSI", "NATUR/BR", "NATUR", "CAN/TUS", "TUS", "RUSSET", "PLAI",
+    "FIX LEATHER", "WEBBNG", "WEBBING", "PASTURE SUEDE", "STIRRUP", "LEATHER BALM", "BR2", "BRI"
+]
 
-def get_leather_type(product_name):
-    # 革の種類のキーワードリスト
-    leather_keywords = [
-        "SAMPL", "OXFORD", "LON/BRI", "BRITISH COUNTRY", "SHRUNKEN", "SAFARI", "DERBY", "REGENT",
-        "LON", "CORDOVAN", "ST.JAMES", "GASTON", "SHRUNKEN", "HAMPSTEAD",
-        "VIN BR", "HORWEEN/BRI", "BR/RUS", "PLAITED", "VTC BADALASSI",
-        "BADALASSI", "NATUR/BR", "NATUR", "CAN/TUS", "TUS", "RUSSET", "PLAI",
-        "FIX LEATHER", "WEBBNG", "WEBBING", "PASTURE SUEDE", "STIRRUP", "LEATHER BALM", "BR2", "BRI"
-    ]
-    for keyword in leather_keywords:
+class LeatherClassifier:
+    # 商品名→革の種類の判定器（正規表現は1本にまとめてコンパイル、結果は商品名ごとにキャッシュ）
+    def __init__(self, keywords, default="その他"):
+        self.keywords = list(keywords)
+        self.default = default
+        self.exact = set(self.keywords)
+        # 先頭に固定した先読みの選択肢をキーワード順に並べ、最初に成立したもの＝リスト順で最初に含まれるキーワード
+        branches = []
+        for keyword in self.keywords:
+            if keyword == "LON":
+                # LONDONなど先頭一致（LONGは除外）、または' LONDON'や' LON 'など（LONGを含む名前は除外）
+                branches.append(r"(?=((?i:LON(?!G)|(?!.*\bLONG).*?\bLON)))")
+            else:
+                branches.append(r"(?=.*?(" + re.escape(keyword) + r"))")
+        self.pattern = re.compile(r"\A(?:" + "|".join(branches) + r")", re.DOTALL)
+        self.cache = {}
+
+    def classify(self, product_name):
+        s = str(product_name)
+        result = self.cache.get(s)
+        if result is None:
+            result = self._classify(s)
+            self.cache[s] = result
+        return result
+
+    def _classify(self, s):
         # 完全一致のみ判定（部分一致しない）
-        if str(product_name) == keyword:
-            return keyword
-    # 部分一致で判定（LONはLONDONなど先頭一致、LONGは除外）
-    for keyword in leather_keywords:
-        if keyword == "LON":
-            s = str(product_name).upper()
-            # LONDONなど先頭一致、LONGは除外
-            if s.startswith("LON") and not s.startswith("LONG"):
-                return keyword
-            # ' LONDON'や' LON 'などもOK
-            if re.search(r'\bLON', s) and not re.search(r'\bLONG', s):
-                return keyword
-        else:
-            if keyword in str(product_name):
-                return keyword
-    return "その他"
+        if s in self.exact:
+            return s
+        # 部分一致で判定（キーワード順）
+        m = self.pattern.match(s)
+        if m:
+            return self.keywords[m.lastindex - 1]
+        return self.default
+
+    def classify_series(self, series):
+        # 重複する商品名は1回だけ判定して展開
+        import pandas as pd
+        codes, uniques = pd.factorize(series, use_na_sentinel=False)
+        labels = [self.classify(v) for v in uniques]
+        return pd.Series([labels[c] for c in codes], index=series.index, dtype=object)
+
+leather_classifier = LeatherClassifier(LEATHER_KEYWORDS)
+
+def get_leather_type(product_name):
+    return leather_classifier.classify(product_name)
 
 def upload_product_excel():
     file_path = filedialog.askopenfilename(
@@ -395,71 +2188,104 @@ def upload_product_excel():
     )
     if not file_path:
         return
-    # DB作成・接続
-    db_name = get_db_path("product.db")
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    # productsテーブル作成（なければ）
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS products (
-            商品名 TEXT,
-            品番CD TEXT,
-            カラーNO TEXT,
-            カラー名 TEXT,
-            サイズ数計 INTEGER,
-            金額 REAL,
-            革の種類 TEXT,
-            ブランド TEXT,
-            PRIMARY KEY (品番CD, カラーNO)
-        )
-    """)
-    conn.commit()
+    run_task("商品マスタ取込", import_product_excel, file_path)
+
+# 商品マスタExcelから登録する列（金額は金額CSVで別途更新する）
+PRODUCT_UPSERT_COLS = ["商品名", "品番CD", "カラーNO", "カラー名", "サイズ数計", "革の種類", "ブランド"]
+
+def upsert_products(conn, df):
+    # 商品マスタを一括UPSERTする（1トランザクション）
+    #   1. 一時テーブル products_staging に全行を executemany で読み込む
+    #   2. 同じキーが複数ある場合は後の行を採用（従来の1行ずつ処理と同じ）
+    #   3. 件数を数えたうえで、変更のある行だけ INSERT ... SELECT ... ON CONFLICT DO UPDATE
+    # 戻り値: {"inserted": 新規, "updated": 更新, "unchanged": 変更なし}
+    col_sql = ", ".join(PRODUCT_UPSERT_COLS)
+    key_match = "p.品番CD = s.品番CD AND p.カラーNO = s.カラーNO"
+    same_row = " AND ".join(f"p.{col} IS s.{col}" for col in PRODUCT_UPSERT_COLS)
+    try:
+        conn.execute("DROP TABLE IF EXISTS temp.products_staging")
+        conn.execute(f"CREATE TEMP TABLE products_staging ({col_sql})")
+        conn.execute("BEGIN")
+        insert_rows(conn, "temp.products_staging", df[PRODUCT_UPSERT_COLS])
+        conn.execute("""
+            DELETE FROM temp.products_staging
+            WHERE rowid NOT IN (SELECT MAX(rowid) FROM temp.products_staging GROUP BY 品番CD, カラーNO)
+        """)
+        inserted, unchanged, total = conn.execute(f"""
+            SELECT
+                SUM(NOT EXISTS (SELECT 1 FROM products p WHERE {key_match})),
+                SUM(EXISTS (SELECT 1 FROM products p WHERE {key_match} AND {same_row})),
+                COUNT(*)
+            FROM temp.products_staging s
+        """).fetchone()
+        conn.execute(f"""
+            INSERT INTO products ({col_sql})
+            SELECT {col_sql} FROM temp.products_staging s
+            WHERE NOT EXISTS (SELECT 1 FROM products p WHERE {key_match} AND {same_row})
+            ORDER BY s.rowid
+            ON CONFLICT(品番CD, カラーNO) DO UPDATE SET
+                商品名=excluded.商品名,
+                カラー名=excluded.カラー名,
+                サイズ数計=excluded.サイズ数計,
+                革の種類=excluded.革の種類,
+                ブランド=excluded.ブランド
+        """)
+        conn.commit()
+        clear_summary_cache()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.products_staging")
+    inserted, unchanged, total = inserted or 0, unchanged or 0, total or 0
+    return {"inserted": inserted, "updated": total - inserted - unchanged, "unchanged": unchanged}
+
+@profiled("商品マスタ取込")
+def import_product_excel(file_path):
+    import pandas as pd
+    # DB接続（productsテーブルはマイグレーションで作成）
+    conn = connect_db("product.db")
     # Excel読込
     try:
-        df = pd.read_excel(file_path, dtype=str)
+        with profile_stage("Excel読込") as stage:
+            df = pd.read_excel(file_path, dtype=str)
+            stage["rows"] = len(df)
     except Exception as e:
-        messagebox.showerror("エラー", f"Excelファイルの読込に失敗しました: {e}")
+        dialogs.showerror("エラー", f"Excelファイルの読込に失敗しました: {e}")
         conn.close()
         return
     # 必要な列のみ抽出
     required_cols = ["商品名", "品番CD", "カラーNO", "カラー名","サイズ数計"]
     if not all(col in df.columns for col in required_cols):
-        messagebox.showerror("エラー", f"列名が不足しています: {required_cols}")
+        dialogs.showerror("エラー", f"列名が不足しています: {required_cols}")
         conn.close()
         return
     df = df[required_cols].copy()
     # 金額・革の種類列追加
     # df["金額"] = None  ← この行は削除またはコメントアウト
-    df["革の種類"] = df["商品名"].apply(get_leather_type)
+    df["革の種類"] = leather_classifier.classify_series(df["商品名"])
 
     # ブランド名追加
     brand_map = get_brand_map()
     df["ブランド"] = df["品番CD"].astype(str).str[:2].map(brand_map).fillna("その他")
 
     # DB登録（UPSERT: 金額は常に更新しない）
-    inserted_or_updated = 0
-    for _, row in df.iterrows():
-        try:
-            cursor.execute("""
-                INSERT INTO products (商品名, 品番CD, カラーNO, カラー名, サイズ数計, 革の種類,ブランド)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(品番CD, カラーNO) DO UPDATE SET
-                    商品名=excluded.商品名,
-                    カラー名=excluded.カラー名,
-                    サイズ数計=excluded.サイズ数計,
-                    革の種類=excluded.革の種類,
-                    ブランド=excluded.ブランド
-            """, (
-                row["商品名"], row["品番CD"], row["カラーNO"], row["カラー名"], row["サイズ数計"],
-                row["革の種類"], row["ブランド"]
-            ))
-            inserted_or_updated += 1
-        except Exception as e:
-            print(f"登録エラー: {e}")
-    conn.commit()
-    messagebox.showinfo("完了", f"✅ {inserted_or_updated} 件を登録（新規または更新）しました。")
-    df_all = pd.read_sql("SELECT * FROM products", conn)
-    df_all.to_csv("商品マスタ.csv", index=False, encoding="utf-8-sig")
+    try:
+        with profile_stage("DB登録") as stage:
+            counts = upsert_products(conn, df)
+            stage["rows"] = counts["inserted"] + counts["updated"]
+    except Exception as e:
+        dialogs.showerror("エラー", f"DB登録に失敗しました: {e}")
+        conn.close()
+        return
+    dialogs.showinfo(
+        "完了",
+        f"✅ 新規 {counts['inserted']} 件・更新 {counts['updated']} 件を登録しました。"
+        f"（変更なし {counts['unchanged']} 件）"
+    )
+    # 商品マスタは既存行の更新があるため追記ではなく常に全件出力
+    with profile_stage("CSV出力"):
+        export_table_csv(conn, "products", PRODUCT_CSV)
     conn.close()
 
 def upload_price_csv():
@@ -469,226 +2295,215 @@ def upload_price_csv():
     )
     if not file_path:
         return
-    db_name = get_db_path("product.db")
-    conn = sqlite3.connect(db_name)
+    run_task("商品マスタ金額取込", import_price_csv, file_path)
+
+@profiled("商品マスタ金額取込")
+def import_price_csv(file_path):
+    import pandas as pd
+    conn = connect_db("product.db")
     try:
-        df_csv = pd.read_csv(file_path, dtype=str, encoding="cp932")
+        with profile_stage("CSV読込") as stage:
+            df_csv = pd.read_csv(file_path, dtype=str, encoding="cp932")
+            stage["rows"] = len(df_csv)
     except Exception as e:
-        messagebox.showerror("エラー", f"CSVファイルの読込に失敗しました: {e}")
+        dialogs.showerror("エラー", f"CSVファイルの読込に失敗しました: {e}")
         conn.close()
         return
     # 必要な列名を確認
     if not ("商品コード" in df_csv.columns and "通常価格" in df_csv.columns):
-        messagebox.showerror("エラー", "CSVに必要な列（商品コード、通常価格）がありません。")
+        dialogs.showerror("エラー", "CSVに必要な列（商品コード、通常価格）がありません。")
         conn.close()
         return
-    # DBから既存データ取得
-    df_db = pd.read_sql("SELECT * FROM products", conn)
-    update_count = 0
-    for idx, row in df_csv.iterrows():
-        code8 = str(row["商品コード"])[:8]
-        price_str = row["通常価格"]
-        try:
-            price = float(price_str)
-            price_wo_tax = round(price / 1.1)
-        except (ValueError, TypeError):
-            continue  # 金額が変換できない場合はスキップ
-        # DB内で品番CDの上8桁が一致する行を抽出
-        mask = df_db["品番CD"].str[:8] == code8
-        if mask.any():
-            df_db.loc[mask, "金額"] = price_wo_tax
-            update_count += mask.sum()
-    # DBへ反映
+    # 商品コード上8桁ごとの税抜金額（通常価格は現在の標準税率の税込価格）
+    # 金額が変換できない行はスキップ、同じコードは後の行を採用
+    from datetime import date
+    today = date.today()
+    df_price = pd.DataFrame({
+        "品番8": df_csv["商品コード"].str[:8],
+        "金額": remove_tax(pd.to_numeric(df_csv["通常価格"], errors="coerce"), today.year * 100 + today.month).round(),
+    }).dropna()
+    df_price = df_price.drop_duplicates(subset="品番8", keep="last")
+
+    # DBへ反映（品番CD上8桁の式インデックスで突合し、productsをその場で更新）
     try:
-        # 一時テーブルに書き出し
-        df_db.to_sql("products_tmp", conn, if_exists="replace", index=False)
-        cursor = conn.cursor()
-        # 本来のproductsテーブルを削除
-        cursor.execute("DROP TABLE IF EXISTS products")
-        # 主キー付きで再作成
-        cursor.execute("""
-            CREATE TABLE products (
-                商品名 TEXT,
-                品番CD TEXT,
-                カラーNO TEXT,
-                カラー名 TEXT,
-                サイズ数計 INTEGER,
-                金額 REAL,
-                革の種類 TEXT,
-                ブランド TEXT,
-                PRIMARY KEY (品番CD, カラーNO)
-            )
-        """)
-        # データを移し替え
-        cursor.execute("""
-            INSERT INTO products (商品名, 品番CD, カラーNO, カラー名, サイズ数計, 金額, 革の種類, ブランド)
-            SELECT 商品名, 品番CD, カラーNO, カラー名, サイズ数計, 金額, 革の種類, ブランド FROM products_tmp
-        """)
-        cursor.execute("DROP TABLE IF EXISTS products_tmp")
-        conn.commit()
-        messagebox.showinfo("完了", f"✅ {update_count} 件の金額を更新しました。")
+        with profile_stage("DB登録") as stage:
+            conn.execute("DROP TABLE IF EXISTS temp.price_staging")
+            conn.execute("CREATE TEMP TABLE price_staging (品番8 TEXT PRIMARY KEY, 金額 REAL)")
+            conn.execute("BEGIN")
+            insert_rows(conn, "temp.price_staging", df_price)
+            cur = conn.execute("""
+                UPDATE products SET 金額 = s.金額
+                FROM temp.price_staging s
+                WHERE substr(products.品番CD, 1, 8) = s.品番8
+            """)
+            update_count = cur.rowcount
+            conn.commit()
+            stage["rows"] = update_count
+        clear_summary_cache()
+        dialogs.showinfo("完了", f"✅ {update_count} 件の金額を更新しました。")
     except Exception as e:
-        messagebox.showerror("エラー", f"DB更新に失敗しました: {e}")
-    df_all = pd.read_sql("SELECT * FROM products", conn)
-    df_all.to_csv("商品マスタ.csv", index=False, encoding="utf-8-sig")
+        conn.rollback()
+        dialogs.showerror("エラー", f"DB更新に失敗しました: {e}")
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.price_staging")
+    # 商品マスタは既存行の更新があるため追記ではなく常に全件出力
+    with profile_stage("CSV出力"):
+        export_table_csv(conn, "products", PRODUCT_CSV)
     conn.close()
 
-def download_sales_summary(selected_brand_var):
-    import pandas as pd
-    import sqlite3
-    import os
-
-    # 年月・品番範囲の取得
-    start_year = int(start_year_var.get())
-    start_month = int(start_month_var.get())
-    end_year = int(end_year_var.get())
-    end_month = int(end_month_var.get())
-    start_key = start_year * 100 + start_month
-    end_key = end_year * 100 + end_month
-    # start_product_code = start_product_code_var.get()
-    # end_product_code = end_product_code_var.get()
-
-    db_mode = db_select_var.get()  # ラジオボタンの値を取得
-    selected_brand = selected_brand_var.get()
-    # DB接続
-    conn_prod = sqlite3.connect(get_db_path("product.db"))
-    try:
-        df_products = pd.read_sql("SELECT * FROM products", conn_prod)
-    except Exception as e:
-        messagebox.showerror("エラー", f"商品マスタDB読込エラー: {e}")
-        conn_prod.close()
-        return
+# === 売上集計エンジン ===
+# 点数・金額の2つの集計は同じデータを同じ条件で読むので、1回のgroupbyで両方を計算してキャッシュする
+# キャッシュは (データ種別, ブランド, 期間, フィルタ, DBファイルの更新状況) ごとに持ち、取込・商品マスタ更新後にクリアする
+# （他のPCがDropbox上のDBに取り込んだ場合は、DBファイルの更新日時・サイズが変わるので別のキーになる）
+
+# 集計の種類: (集計値の列, 合計列の名前)
+SUMMARY_MEASURES = {
+    "count": ("点数", "点数合計"),
+    "amount": ("金額合計", "金額合計"),
+}
+SUMMARY_CACHE_SIZE = 8
+summary_cache = {}
+summary_cache_lock = threading.Lock()
+REPORT_DB_MODES = ["WEB", "店舗", "ALL"]
+
+@dataclass(frozen=True)
+class ReportRequest:
+    # 売上集計の条件（画面は get_report_params、コマンドラインは cli_report_request で作る）
+    # 年齢・性別・居住地・ギフトはWEBのみ、folder は出力先（Noneならダウンロードフォルダ）
+    start_year: int
+    start_month: int
+    end_year: int
+    end_month: int
+    db_mode: str = "ALL"
+    brand: str = "(すべて)"
+    age: str = "ALL"
+    gender: str = "ALL"
+    region: str = "ALL"
+    gift: str = "ALL"
+    measure: str = "count"
+    folder: str = None
+
+    @property
+    def start_key(self):
+        return self.start_year * 100 + self.start_month
+
+    @property
+    def end_key(self):
+        return self.end_year * 100 + self.end_month
+
+    @property
+    def filters(self):
+        return {"age": self.age, "gender": self.gender, "region": self.region, "gift": self.gift}
+
+def clear_summary_cache():
+    with summary_cache_lock:
+        summary_cache.clear()
+
+def summary_data_version():
+    # 集計で読むDB（WAL含む）の更新日時とサイズ。ファイルが無ければNone
+    version = []
+    for db_filename in ["frame.db", *REPORT_ATTACHED_DBS.values()]:
+        for path in (get_db_path(db_filename), get_db_path(db_filename) + "-wal"):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                version.append(None)
+            else:
+                version.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+def summary_cache_key(request):
+    # 点数・金額で集計結果を共有するので measure と出力先はキーに含めない
+    return (
+        request.db_mode, request.brand,
+        request.start_year, request.start_month, request.end_year, request.end_month,
+        tuple(sorted(request.filters.items())),
+        summary_data_version(),
+    )
 
-    # ブランドでフィルタリング
-    if selected_brand != "(すべて)":
-        df_products = df_products[df_products["ブランド"] == selected_brand]
+def get_sales_aggregate(request):
+    # 集計済みデータを返す（条件の誤りは ValueError、DB読込のエラーはそのまま送出）
+    import pandas as pd
+    key = summary_cache_key(request)
+    with summary_cache_lock:
+        agg = summary_cache.get(key)
+    if agg is not None:
+        return agg
+
+    db_mode = request.db_mode
+    selected_brand = request.brand
+
+    # --- データ取得（期間・ブランド・WEB用フィルタ・商品マスタの条件はSQLで絞り込む） ---
+    if db_mode not in REPORT_DB_MODES:
+        raise ValueError("データ種別を選択してください。")
+    report_progress("売上データ読込中...")
+    with profile_stage("DB読込") as stage:
+        df_products, df_sales, df_first, df_months = read_sales_report(
+            db_mode, request.start_key, request.end_key, selected_brand, request.filters)
+        stage["rows"] = len(df_sales)
+
+    with profile_stage("集計") as stage:
+        # 年月列追加（期間の絞り込みはSQL側で済んでいる）
+        df_sales["年月"] = make_month_labels(df_sales)
+        all_months = sorted(set(make_month_labels(df_months)))
+
+        # product側の結合キー列を作成（frame側の品番10桁は集計テーブルの列）
+        df_products["結合キー"] = df_products["品番CD"].astype(str) + "0" + df_products["カラーNO"].astype(str)
+
+        # 点数と金額（点数×税抜金額）を品番10桁×年月にまとめる
+        report_progress("集計中...")
+        measure_cols = [col for col, _ in SUMMARY_MEASURES.values()]
+        summary = df_sales.groupby(["品番10", "年月"], as_index=False, observed=True)[measure_cols].sum()
+
+        agg = {
+            "products": df_products,
+            "summary": summary,
+            "all_months": all_months,
+            "brand": selected_brand,
+            "not_in_master": None,
+        }
 
-    # --- データ取得 ---
-    if db_mode == "WEB":
-        conn_frame = sqlite3.connect(get_db_path("frame.db"))
-        try:
-            df_orders = pd.read_sql("SELECT * FROM orders", conn_frame)
-        except Exception as e:
-            messagebox.showerror("エラー", f"WEB用DB読込エラー: {e}")
-            conn_prod.close()
-            conn_frame.close()
-            return
-        conn_frame.close()
-        # === ギフト列を必ずint型(0/1)に変換 ===
-        if "ギフト" in df_orders.columns:
-            df_orders["ギフト"] = pd.to_numeric(df_orders["ギフト"], errors="coerce").fillna(0).astype(int)
-        # === WEB時のみフィルタ適用 ===
-        # 年齢
-        if "年齢" in df_orders.columns:
-            df_orders["年齢"] = pd.to_numeric(df_orders["年齢"], errors="coerce")
-        age = filter_age_var.get()
-        if age != "ALL" and "年齢" in df_orders.columns:
-            if age == "10代以下":
-                df_orders = df_orders[df_orders["年齢"] < 20]
-            elif age == "60代以上":
-                df_orders = df_orders[df_orders["年齢"] >= 60]
-            else:
-                try:
-                    age_num = int(age[:2])
-                    df_orders = df_orders[(df_orders["年齢"] >= age_num) & (df_orders["年齢"] < age_num+10)]
-                except:
-                    pass
-        # 性別
-        gender = filter_gender_var.get()
-        if gender != "ALL" and "性別" in df_orders.columns:
-            if gender == "男性":
-                df_orders = df_orders[df_orders["性別"].isin(["RM", "M"])]
-            elif gender == "女性":
-                df_orders = df_orders[df_orders["性別"].isin(["RL", "L"])]
-        # 居住地
-        region = filter_region_var.get()
-        if region != "ALL" and "居住地" in df_orders.columns:
-            region_map = {
-                "北海道地方": ["北海道"],
-                "東北地方": ["青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県"],
-                "関東地方": ["東京都", "神奈川県", "千葉県", "埼玉県", "茨城県", "栃木県", "群馬県"],
-                "中部地方": ["新潟県", "富山県", "石川県", "福井県", "山梨県", "長野県", "岐阜県", "静岡県", "愛知県"],
-                "近畿地方": ["大阪府", "兵庫県", "京都府", "滋賀県", "奈良県", "和歌山県", "三重県"],
-                "中国地方": ["鳥取県", "島根県", "岡山県", "広島県", "山口県"],
-                "四国地方": ["徳島県", "香川県", "愛媛県", "高知県"],
-                "九州地方": ["福岡県", "佐賀県", "長崎県", "熊本県", "大分県", "宮崎県", "鹿児島県","沖縄県"]
+        # 商品マスタに無い品番10桁（登録ブランドが選択ブランドと一致する行だけで再集計）
+        if not df_sales["商品マスタ"].all():
+            filtered_sales = df_sales
+            if selected_brand != "(すべて)":
+                filtered_sales = filtered_sales[filtered_sales["ブランド"] == selected_brand]
+            # 品名・色・金額は最初に出てきた行から取る
+            first_rows = df_first.set_index("品番10")
+            first_rows["税抜金額数値"] = pd.to_numeric(first_rows["税抜金額"], errors="coerce").fillna(0)
+            agg["not_in_master"] = {
+                "summary": filtered_sales.groupby(["品番10", "年月"], as_index=False, observed=True)[measure_cols].sum(),
+                "codes": set(filtered_sales.loc[filtered_sales["商品マスタ"] == 0, "品番10"]),
+                "first_rows": first_rows[["品名", "色", "税抜金額", "税抜金額数値"]],
             }
-            if region in region_map:
-                df_orders = df_orders[df_orders["居住地"].isin(region_map[region])]
-            else:
-                df_orders = df_orders[df_orders["居住地"] == region]
-        # ギフト
-        gift = filter_gift_var.get()
-        if gift != "ALL" and "ギフト" in df_orders.columns:
-            df_orders["ギフト"] = pd.to_numeric(df_orders["ギフト"], errors="coerce").fillna(0).astype(int)
-            if gift == "あり":
-                df_orders = df_orders[df_orders["ギフト"] == 1]
-            elif gift == "なし":
-                df_orders = df_orders[df_orders["ギフト"] == 0]
-    elif db_mode == "店舗":
-        conn_fukuoka = sqlite3.connect(get_db_path("framefukuoka.db"))
-        try:
-            df_orders = pd.read_sql("SELECT * FROM orders", conn_fukuoka)
-        except Exception as e:
-            messagebox.showerror("エラー", f"店舗用DB読込エラー: {e}")
-            conn_prod.close()
-            conn_fukuoka.close()
-            return
-        conn_fukuoka.close()
-    elif db_mode == "ALL":
-        conn_frame = sqlite3.connect(get_db_path("frame.db"))
-        conn_fukuoka = sqlite3.connect(get_db_path("framefukuoka.db"))
-        try:
-            df_orders_web = pd.read_sql("SELECT * FROM orders", conn_frame)
-            df_orders_shop = pd.read_sql("SELECT * FROM orders", conn_fukuoka)
-            df_orders = pd.concat([df_orders_web, df_orders_shop], ignore_index=True)
-        except Exception as e:
-            messagebox.showerror("エラー", f"DB読込エラー: {e}")
-            conn_prod.close()
-            conn_frame.close()
-            conn_fukuoka.close()
-            return
-        conn_frame.close()
-        conn_fukuoka.close()
-    else:
-        messagebox.showerror("エラー", "データ種別を選択してください。")
-        conn_prod.close()
-        return
+        stage["rows"] = len(summary)
+
+    with summary_cache_lock:
+        while len(summary_cache) >= SUMMARY_CACHE_SIZE:
+            summary_cache.pop(next(iter(summary_cache)))
+        summary_cache[key] = agg
+    return agg
+
+def build_sales_summary(request):
+    # 集計条件から出力用の表を作る（ダイアログ・ファイル出力はしない）
+    if request.measure not in SUMMARY_MEASURES:
+        raise ValueError(f"集計の種類が正しくありません: {request.measure}")
+    agg = get_sales_aggregate(request)
+    with profile_stage("ピボット") as stage:
+        merged = build_sales_table(agg, request.measure)
+        stage["rows"] = len(merged)
+    return merged
+
+def build_sales_table(agg, measure):
+    # 集計済みデータから出力用の表（商品マスタ＋月別列＋合計列）を作る
+    import pandas as pd
+    value_col, total_col = SUMMARY_MEASURES[measure]
+    df_products = agg["products"]
+    selected_brand = agg["brand"]
 
-    # --- 以降は今まで通り ---
-    # 年月キー追加
-    df_orders["年"] = pd.to_numeric(df_orders["年"], errors="coerce")
-    df_orders["月"] = pd.to_numeric(df_orders["月"], errors="coerce")
-    df_orders = df_orders.dropna(subset=["年", "月"])
-    df_orders["年月"] = df_orders["年"].astype(int).astype(str).str[-2:] + "/" + df_orders["月"].astype(int).astype(str).str.zfill(2)
-    df_orders["年月キー"] = (df_orders["年"].astype(int) * 100 + df_orders["月"].astype(int)).astype("Int64")
-    df_orders = df_orders[(df_orders["年月キー"] >= start_key) & (df_orders["年月キー"] <= end_key)]
-
-    # --- ここから品番範囲フィルタをproduct.dbで実施 ---
-    # if start_product_code and end_product_code:
-    #     df_products = df_products[
-    #         (df_products["品番CD"].str[:8] >= start_product_code[:8]) &
-    #         (df_products["品番CD"].str[:8] <= end_product_code[:8])
-    #     ]
-    # --- ここまで ---
-
-    # 1. 革の種類が"SAMPL"のものは除外
-    df_products = df_products[df_products["革の種類"] != "SAMPL"]
-    # 金額が空（NaNやNone）のものも除外
-    if "金額" in df_products.columns:
-        df_products = df_products[df_products["金額"].notna()]
-
-    # frame側の品番10桁列とproduct側の結合キー列を作成
-    df_orders["品番10"] = df_orders["品番"].astype(str).str[:10]
-    df_products["結合キー"] = df_products["品番CD"].astype(str) + "0" + df_products["カラーNO"].astype(str)
-
-    # 月ごとにワイド形式で集計
-    df_orders["点数"] = pd.to_numeric(df_orders["点数"], errors="coerce").fillna(0)
-    summary = (
-        df_orders.groupby(["品番10", "年月"], as_index=False)["点数"].sum()
-    )
-    summary_pivot = summary.pivot(index="品番10", columns="年月", values="点数")
-    summary_pivot = summary_pivot.fillna(0).astype(int)
+    # 月ごとにワイド形式
+    summary_pivot = agg["summary"].pivot(index="品番10", columns="年月", values=value_col)
+    summary_pivot = to_int_frame(summary_pivot.reindex(columns=agg["all_months"]).fillna(0))
     summary_pivot.reset_index(inplace=True)
 
     # 商品マスタと結合
@@ -699,84 +2514,40 @@ def download_sales_summary(selected_brand_var):
         right_on="品番10",
         how="left"
     )
-    # month_colsをここで定義
     month_cols = [col for col in summary_pivot.columns if col != "品番10"]
+    base_cols = ["品番CD", "商品名", "カラーNO", "カラー名", "サイズ数計", "金額", "革の種類"]
 
-    # 商品マスタに無い品番10桁を抽出
-    not_in_master = set(df_orders["品番10"]) - set(df_products["結合キー"])
-    if not_in_master:
-        # # 上2桁が"71"のものだけ抽出
-        # not_in_master_71 = sorted([code for code in not_in_master if str(code).startswith("30")])
-        # msg = f"商品マスタに存在しない品番（10桁, 先頭2桁=71）: {not_in_master_71}"
-        # #print(msg)
-        # messagebox.showinfo("商品マスタに無い品番(71)", msg)  # 必要ならコメントアウト解除
-
-        # --- 商品マスタに無い品番10桁のデータも出力用に作成 ---
-        # 追加分もブランド・品番範囲でフィルタ
-        filtered_orders = df_orders.copy()
-        if selected_brand != "(すべて)":
-            filtered_orders = filtered_orders[filtered_orders["ブランド"] == selected_brand]
-        # if start_product_code and end_product_code:
-        #     filtered_orders = filtered_orders[
-        #         (filtered_orders["品番"].str[:8] >= start_product_code[:8]) &
-        #         (filtered_orders["品番"].str[:8] <= end_product_code[:8])
-        #     ]
-        # 再集計
-        filtered_orders["点数"] = pd.to_numeric(filtered_orders["点数"], errors="coerce").fillna(0)
-        summary = (
-            filtered_orders.groupby(["品番10", "年月"], as_index=False)["点数"].sum()
-        )
-        summary_pivot_filtered = summary.pivot(index="品番10", columns="年月", values="点数").fillna(0).astype(int).reset_index()
-        not_in_master_filtered = set(filtered_orders["品番10"]) - set(df_products["結合キー"])
-        not_in_master_df = summary_pivot_filtered[summary_pivot_filtered["品番10"].isin(not_in_master_filtered)].copy()
+    # --- 商品マスタに無い品番10桁のデータも出力用に作成 ---
+    nim = agg["not_in_master"]
+    if nim is not None:
+        summary_pivot_filtered = to_int_frame(nim["summary"].pivot(index="品番10", columns="年月", values=value_col).fillna(0)).reset_index()
+        not_in_master_df = summary_pivot_filtered[summary_pivot_filtered["品番10"].isin(nim["codes"])].copy()
         # 商品マスタのカラムを空欄で追加（なければ追加）
         for col in ["品番CD", "商品名", "カラー名", "金額", "カラーNO", "サイズ数計", "革の種類"]:
             if col not in not_in_master_df.columns:
                 not_in_master_df[col] = pd.NA
-        # 既存の品番CD/商品名/カラー名/金額はordersから埋める
-        for col in ["品番CD", "商品名", "カラー名", "金額"]:
-            if col == "品番CD":
-                not_in_master_df[col] = not_in_master_df["品番10"].str[:8] #+ "00"
-            elif col == "商品名":
-                not_in_master_df[col] = not_in_master_df["品番10"].map(
-                    df_orders.drop_duplicates("品番10").set_index("品番10")["品名"]
-                )
-            elif col == "カラー名":
-                not_in_master_df[col] = not_in_master_df["品番10"].map(
-                    df_orders.drop_duplicates("品番10").set_index("品番10")["色"]
-                )
-            elif col == "金額":
-                not_in_master_df[col] = not_in_master_df["品番10"].map(
-                    df_orders.drop_duplicates("品番10").set_index("品番10")["税抜金額"]
-                )
+        # 品番CD/商品名/カラー名/金額はordersから埋める（金額集計では金額も数値にしたものを使う）
+        first_rows = nim["first_rows"]
+        price_col = "税抜金額数値" if measure == "amount" else "税抜金額"
+        not_in_master_df["品番CD"] = not_in_master_df["品番10"].str[:8]
+        not_in_master_df["商品名"] = not_in_master_df["品番10"].map(first_rows["品名"])
+        not_in_master_df["カラー名"] = not_in_master_df["品番10"].map(first_rows["色"])
+        not_in_master_df["金額"] = not_in_master_df["品番10"].map(first_rows[price_col])
         # month_colsのうち、not_in_master_dfに無い列は0で追加
         for col in month_cols:
             if col not in not_in_master_df.columns:
                 not_in_master_df[col] = 0
-        # 点数合計列を追加
-        not_in_master_df["点数合計"] = not_in_master_df[month_cols].sum(axis=1)
-        # 商品マスタ側と同じ列順に
-        output_cols = ["品番CD", "商品名", "カラーNO", "カラー名", "サイズ数計", "金額", "革の種類"] + month_cols + ["点数合計"]
-        not_in_master_df = not_in_master_df[output_cols]
-        # 既存mergedの末尾に追加
+        not_in_master_df[total_col] = not_in_master_df[month_cols].sum(axis=1)
+        # 商品マスタ側と同じ列順にして既存mergedの末尾に追加
+        not_in_master_df = not_in_master_df[base_cols + month_cols + [total_col]]
         merged = pd.concat([merged, not_in_master_df], ignore_index=True)
 
-    # 列順序
-    base_cols = ["品番CD", "商品名", "カラーNO", "カラー名", "サイズ数計", "金額", "革の種類"]
-    month_cols = [col for col in summary_pivot.columns if col != "品番10"]
-    output_cols = base_cols + month_cols
-    merged = merged[output_cols]
-
-    # 売上が0の場合は0を入れる
-    merged[month_cols] = merged[month_cols].fillna(0).astype(int)
-
-    # === 点数合計列を追加 ===
-    merged["点数合計"] = merged[month_cols].sum(axis=1)
-    output_cols = base_cols + month_cols + ["点数合計"]
-    merged = merged[output_cols]
-    # =======================
+    # 列順序（売上が0の場合は0を入れる）
+    merged = merged[base_cols + month_cols]
+    merged[month_cols] = to_int_frame(merged[month_cols].fillna(0))
+    merged[total_col] = merged[month_cols].sum(axis=1)
 
-    # 3. ソート
+    # ソート
     if selected_brand in ["WHITEHOUSE COX", "BEORMA"]:
         leather_order = ["BRI", "VIN BR", "NATUR", "VTC BADALASSI", "BADALASSI", "BR/RUS"]
         merged["__leather_order"] = merged["革の種類"].apply(
@@ -796,411 +2567,212 @@ def download_sales_summary(selected_brand_var):
     else:
         merged = merged.sort_values(by=["品番CD"], ascending=[True])
 
-    # 4. ソート後、同じ並びの重複分は指定カラムのみnanにする
+    # ソート後、同じ並びの重複分は指定カラムのみnanにする
     dup_cols = ["品番CD", "商品名", "金額"]
     mask = merged.duplicated(subset=dup_cols, keep='first')
     for col in dup_cols:
         merged.loc[mask, col] = pd.NA
+    return merged
 
-    # ファイル名と保存先
-    folder = os.path.join(os.path.expanduser("~"), "Downloads")
-    start_yy = str(start_year)[-2:]
-    end_yy = str(end_year)[-2:]
+def get_output_folder(request):
+    # 出力先フォルダ（コマンドラインで指定が無ければダウンロードフォルダ）
+    return request.folder or os.path.join(os.path.expanduser("~"), "Downloads")
+
+def sales_summary_path(request):
+    # 出力ファイルのパス
+    folder = get_output_folder(request)
+    start_yy = str(request.start_year)[-2:]
+    end_yy = str(request.end_year)[-2:]
     # ブランド名（(すべて)の場合は全ブランド）
-    brand_for_filename = selected_brand if selected_brand != "(すべて)" else "全ブランド"
-    filename = f"商品別売上集計_{brand_for_filename}_{start_yy}年{start_month}月-{end_yy}年{end_month}月_{db_mode}.xlsx"
-    full_path = os.path.join(folder, filename)
+    brand_for_filename = request.brand if request.brand != "(すべて)" else "全ブランド"
+    prefix = "商品別売上集計_金額" if request.measure == "amount" else "商品別売上集計"
+    filename = f"{prefix}_{brand_for_filename}_{start_yy}年{request.start_month}月-{end_yy}年{request.end_month}月_{request.db_mode}.xlsx"
+    return os.path.join(folder, filename)
 
-    # === 上書き確認を追加 ===
+def confirm_overwrite(full_path):
+    # 上書き確認
     if os.path.exists(full_path):
-        overwrite = messagebox.askyesno("確認", f"{filename} は既に存在します。\n上書きしますか？")
+        filename = os.path.basename(full_path)
+        overwrite = dialogs.askyesno("確認", f"{filename} は既に存在します。\n上書きしますか？")
         if not overwrite:
-            messagebox.showinfo("キャンセル", "保存をキャンセルしました。")
-            conn_prod.close()
-            return
+            dialogs.showinfo("キャンセル", "保存をキャンセルしました。")
+            return False
+    return True
 
-    # Excel出力（以降は既存のまま）
+def run_sales_summary(request):
+    # 画面・コマンドライン用: 集計して表を返す（エラーはダイアログで知らせてNone）
     try:
-        merged.to_excel(full_path, index=False)
-
-        # openpyxlで色付け
-        from openpyxl import load_workbook
-        from openpyxl.styles import PatternFill
-
-        wb = load_workbook(full_path)
-        ws = wb.active
-
-        # 色分け用に「革の種類」情報を一時保存
-        leather_types = merged["革の種類"] if "革の種類" in merged.columns else None
-        # もし削除済みなら、色分け前にleather_types = merged["革の種類"].copy() で保存しておく
-
-        # === ここで不要な列を削除して再出力 ===
-        drop_cols = ["カラーNO", "サイズ数計", "革の種類", "__leather_order", "__品番4"]
-        for col in drop_cols:
-            if col in merged.columns:
-                merged.drop(columns=col, inplace=True)
-        merged.to_excel(full_path, index=False)
-
-        # openpyxlで色付け（この時点で「革の種類」列はもう無いので、色分け用データを事前に保存しておく必要あり）
-        from openpyxl import load_workbook
-        from openpyxl.styles import PatternFill
-
-        wb = load_workbook(full_path)
-        ws = wb.active
-
-        # ヘッダー行から「品番CD」の列番号を取得
-        header = [cell.value for cell in ws[1]]
-        col_idx品番CD = header.index("品番CD") + 1  # openpyxlは1始まり
-
-        # 塗りつぶしスタイル（革の種類ごとに色を指定）
-        fill_colors = {
-            "BRI": "EBF1DE",           # RGB(235,241,222)
-            "VIN BR": "CCC0DA",        # RGB(204,192,218)
-            "NATUR": "FDE9D9",         # RGB(253,233,217)
-            "VTC BADALASSI": "DDD9C4", # RGB(221,217,196)
-            "BADALASSI": "FABF8F",     # RGB(250,191,143)
-        }
-
-        # 色分け（leather_typesを使う）
-        if leather_types is not None:
-            for row in range(2, ws.max_row + 1):
-                leather_type = leather_types.iloc[row - 2]  # pandasのindexは0始まり
-                if leather_type in fill_colors:
-                    fill = PatternFill(start_color=fill_colors[leather_type], end_color=fill_colors[leather_type], fill_type="solid")
-                    ws.cell(row=row, column=col_idx品番CD).fill = fill
-
-        # === ここからフォント設定追加 ===
-        from openpyxl.styles import Font
-
-        # ヘッダー行から対象列のインデックス取得
-        header = [cell.value for cell in ws[1]]
-        col_idx_map = {name: idx + 1 for idx, name in enumerate(header)}
-        # 品番CD・カラー名・金額はフォントサイズ9
-        for col_name in ["品番CD", "カラー名", "金額"]:
-            if col_name in col_idx_map:
-                col_idx = col_idx_map[col_name]
-                for row in range(2, ws.max_row + 1):  # 2行目から最終行まで
-                    ws.cell(row=row, column=col_idx).font = Font(size=9)
-        # 商品名・点数はBOLD
-        for col_name in ["商品名", "点数"]:
-            if col_name in col_idx_map:
-                col_idx = col_idx_map[col_name]
-                for row in range(1, ws.max_row + 1):  # ヘッダーも含めてBOLD
-                    old_font = ws.cell(row=row, column=col_idx).font
-                    ws.cell(row=row, column=col_idx).font = Font(
-                        name=old_font.name if old_font else None,
-                        size=old_font.size if old_font and old_font.size else None,
-                        bold=True
-                    )
-        # === ここまで追加 ===
-
-        # === ここから罫線追加 ===
-        from openpyxl.styles import Border, Side
-
-        thin = Side(border_style="thin", color="000000")
-        # まず全セルの罫線をクリア
-        #for row in ws.iter_rows(min_row=1, max_row=ws.max_row, min_col=1, max_col=ws.max_column):
-         #   for cell in row:
-          #      cell.border = Border()
-
-        # ヘッダー行には下罫線
-        #for cell in ws[1]:
-            #cell.border = Border(bottom=thin)
-
-        # 「品番CD」列のインデックスを取得
-        header = [cell.value for cell in ws[1]]
-        try:
-            col_idx品番CD = header.index("品番CD") + 1  # openpyxlは1始まり
-        except ValueError:
-            col_idx品番CD = 1  # デフォルトで1列目
-
-        # 2行目以降、「品番CD」がNaNまたは直前行と異なる場合、その行全体に上罫線
-        prev_value = ws.cell(row=1, column=col_idx品番CD).value
-        for row in range(2, ws.max_row + 1):
-            curr_value = ws.cell(row=row, column=col_idx品番CD).value
-            if (prev_value is None and curr_value is not None) or \
-               (prev_value is not None and curr_value is not None and prev_value != curr_value):
-                # その行全体に上罫線
-                for col in range(1, ws.max_column + 1):
-                    old_border = ws.cell(row=row, column=col).border
-                    ws.cell(row=row, column=col).border = Border(
-                        left=thin,
-                        right=thin,
-                        top=thin,
-                        bottom=old_border.bottom,
-                    )
-            else:
-                # それ以外の行も左右罫線は必ず引く
-                for col in range(1, ws.max_column + 1):
-                    old_border = ws.cell(row=row, column=col).border
-                    ws.cell(row=row, column=col).border = Border(
-                        left=thin,
-                        right=thin,
-                        top=old_border.top,
-                        bottom=old_border.bottom,
-                    )
-            prev_value = curr_value
-
-        # 最終行の下罫線を追加
-        for col in range(1, ws.max_column + 1):
-            old_border = ws.cell(row=ws.max_row, column=col).border
-            ws.cell(row=ws.max_row, column=col).border = Border(
-                left=old_border.left if old_border.left else thin,
-                right=old_border.right if old_border.right else thin,
-                top=old_border.top,
-                bottom=thin,
-            )
-        # === ここまで追加 ===
-
-        wb.save(full_path)
-
-        messagebox.showinfo("完了", f"✅ 商品別売上集計を出力しました：\n{full_path}")
+        return build_sales_summary(request)
+    except TaskCancelled:
+        raise
+    except ValueError as e:
+        dialogs.showerror("エラー", str(e))
     except Exception as e:
-        messagebox.showerror("エラー", f"Excel出力エラー: {e}")
+        dialogs.showerror("エラー", f"集計エラー: {e}")
+    return None
+
+@profiled("商品別売上集計")
+def download_sales_summary(request):
+    # 点数集計（画面の値は get_report_params でメインスレッドから取得済み）
+    request = replace(request, measure="count")
+    merged = run_sales_summary(request)
+    if merged is None:
+        return
 
-    conn_prod.close()
+    full_path = sales_summary_path(request)
+    if not confirm_overwrite(full_path):
+        return
 
-def download_sales_summary_amount(selected_brand_var):
-    import pandas as pd
-    import sqlite3
-    import os
-
-    start_year = int(start_year_var.get())
-    start_month = int(start_month_var.get())
-    end_year = int(end_year_var.get())
-    end_month = int(end_month_var.get())
-    start_key = start_year * 100 + start_month
-    end_key = end_year * 100 + end_month
-
-    db_mode = db_select_var.get()
-    selected_brand = selected_brand_var.get()
-    conn_prod = sqlite3.connect(get_db_path("product.db"))
+    # Excel出力
+    report_progress("Excel出力中...")
     try:
-        df_products = pd.read_sql("SELECT * FROM products", conn_prod)
+        with profile_stage("Excel書式出力") as stage:
+            write_styled_summary_excel(merged, full_path)
+            stage["rows"] = len(merged)
+        dialogs.showinfo("完了", f"✅ 商品別売上集計を出力しました：\n{full_path}")
     except Exception as e:
-        messagebox.showerror("エラー", f"商品マスタDB読込エラー: {e}")
-        conn_prod.close()
+        dialogs.showerror("エラー", f"Excel出力エラー: {e}")
+
+@profiled("商品別売上集計（金額）")
+def download_sales_summary_amount(request):
+    # 金額集計（点数集計と同じ条件なら集計結果を再利用）
+    request = replace(request, measure="amount")
+    merged = run_sales_summary(request)
+    if merged is None:
         return
-    if selected_brand != "(すべて)":
-        df_products = df_products[df_products["ブランド"] == selected_brand]
 
-    # --- データ取得 ---
-    if db_mode == "WEB":
-        conn_frame = sqlite3.connect(get_db_path("frame.db"))
-        try:
-            df_orders = pd.read_sql("SELECT * FROM orders", conn_frame)
-        except Exception as e:
-            messagebox.showerror("エラー", f"WEB用DB読込エラー: {e}")
-            conn_prod.close()
-            conn_frame.close()
-            return
-        conn_frame.close()
-        if "ギフト" in df_orders.columns:
-            df_orders["ギフト"] = pd.to_numeric(df_orders["ギフト"], errors="coerce").fillna(0).astype(int)
-        if "年齢" in df_orders.columns:
-            df_orders["年齢"] = pd.to_numeric(df_orders["年齢"], errors="coerce")
-        age = filter_age_var.get()
-        if age != "ALL" and "年齢" in df_orders.columns:
-            if age == "10代以下":
-                df_orders = df_orders[df_orders["年齢"] < 20]
-            elif age == "60代以上":
-                df_orders = df_orders[df_orders["年齢"] >= 60]
-            else:
-                try:
-                    age_num = int(age[:2])
-                    df_orders = df_orders[(df_orders["年齢"] >= age_num) & (df_orders["年齢"] < age_num+10)]
-                except:
-                    pass
-        gender = filter_gender_var.get()
-        if gender != "ALL" and "性別" in df_orders.columns:
-            if gender == "男性":
-                df_orders = df_orders[df_orders["性別"].isin(["RM", "M"])]
-            elif gender == "女性":
-                df_orders = df_orders[df_orders["性別"].isin(["RL", "L"])]
-        region = filter_region_var.get()
-        if region != "ALL" and "居住地" in df_orders.columns:
-            region_map = {
-                "北海道地方": ["北海道"],
-                "東北地方": ["青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県"],
-                "関東地方": ["東京都", "神奈川県", "千葉県", "埼玉県", "茨城県", "栃木県", "群馬県"],
-                "中部地方": ["新潟県", "富山県", "石川県", "福井県", "山梨県", "長野県", "岐阜県", "静岡県", "愛知県"],
-                "近畿地方": ["大阪府", "兵庫県", "京都府", "滋賀県", "奈良県", "和歌山県", "三重県"],
-                "中国地方": ["鳥取県", "島根県", "岡山県", "広島県", "山口県"],
-                "四国地方": ["徳島県", "香川県", "愛媛県", "高知県"],
-                "九州地方": ["福岡県", "佐賀県", "長崎県", "熊本県", "大分県", "宮崎県", "鹿児島県","沖縄県"]
-            }
-            if region in region_map:
-                df_orders = df_orders[df_orders["居住地"].isin(region_map[region])]
-            else:
-                df_orders = df_orders[df_orders["居住地"] == region]
-        gift = filter_gift_var.get()
-        if gift != "ALL" and "ギフト" in df_orders.columns:
-            df_orders["ギフト"] = pd.to_numeric(df_orders["ギフト"], errors="coerce").fillna(0).astype(int)
-            if gift == "あり":
-                df_orders = df_orders[df_orders["ギフト"] == 1]
-            elif gift == "なし":
-                df_orders = df_orders[df_orders["ギフト"] == 0]
-    elif db_mode == "店舗":
-        conn_fukuoka = sqlite3.connect(get_db_path("framefukuoka.db"))
-        try:
-            df_orders = pd.read_sql("SELECT * FROM orders", conn_fukuoka)
-        except Exception as e:
-            messagebox.showerror("エラー", f"店舗用DB読込エラー: {e}")
-            conn_prod.close()
-            conn_fukuoka.close()
-            return
-        conn_fukuoka.close()
-    elif db_mode == "ALL":
-        conn_frame = sqlite3.connect(get_db_path("frame.db"))
-        conn_fukuoka = sqlite3.connect(get_db_path("framefukuoka.db"))
-        try:
-            df_orders_web = pd.read_sql("SELECT * FROM orders", conn_frame)
-            df_orders_shop = pd.read_sql("SELECT * FROM orders", conn_fukuoka)
-            df_orders = pd.concat([df_orders_web, df_orders_shop], ignore_index=True)
-        except Exception as e:
-            messagebox.showerror("エラー", f"DB読込エラー: {e}")
-            conn_prod.close()
-            conn_frame.close()
-            conn_fukuoka.close()
-            return
-        conn_frame.close()
-        conn_fukuoka.close()
-    else:
-        messagebox.showerror("エラー", "データ種別を選択してください。")
-        conn_prod.close()
+    full_path = sales_summary_path(request)
+    if not confirm_overwrite(full_path):
         return
-
-    df_orders["年"] = pd.to_numeric(df_orders["年"], errors="coerce")
-    df_orders["月"] = pd.to_numeric(df_orders["月"], errors="coerce")
-    df_orders = df_orders.dropna(subset=["年", "月"])
-    df_orders["年月"] = df_orders["年"].astype(int).astype(str).str[-2:] + "/" + df_orders["月"].astype(int).astype(str).str.zfill(2)
-    df_orders["年月キー"] = (df_orders["年"].astype(int) * 100 + df_orders["月"].astype(int)).astype("Int64")
-    df_orders = df_orders[(df_orders["年月キー"] >= start_key) & (df_orders["年月キー"] <= end_key)]
-
-    df_products = df_products[df_products["革の種類"] != "SAMPL"]
-    if "金額" in df_products.columns:
-        df_products = df_products[df_products["金額"].notna()]
-
-    df_orders["品番10"] = df_orders["品番"].astype(str).str[:10]
-    df_products["結合キー"] = df_products["品番CD"].astype(str) + "0" + df_products["カラーNO"].astype(str)
-
-    # --- ここが金額集計のポイント ---
-    df_orders["点数"] = pd.to_numeric(df_orders["点数"], errors="coerce").fillna(0)
-    df_orders["税抜金額"] = pd.to_numeric(df_orders["税抜金額"], errors="coerce").fillna(0)
-    df_orders["金額合計"] = df_orders["点数"] * df_orders["税抜金額"]
-    summary = (
-        df_orders.groupby(["品番10", "年月"], as_index=False)["金額合計"].sum()
-    )
-    summary_pivot = summary.pivot(index="品番10", columns="年月", values="金額合計")
-    summary_pivot = summary_pivot.fillna(0).astype(int)
-    summary_pivot.reset_index(inplace=True)
-
-    merged = pd.merge(
-        df_products,
-        summary_pivot,
-        left_on="結合キー",
-        right_on="品番10",
-        how="left"
-    )
-    month_cols = [col for col in summary_pivot.columns if col != "品番10"]
-
-    not_in_master = set(df_orders["品番10"]) - set(df_products["結合キー"])
-    if not_in_master:
-        filtered_orders = df_orders.copy()
-        if selected_brand != "(すべて)":
-            filtered_orders = filtered_orders[filtered_orders["ブランド"] == selected_brand]
-        filtered_orders["点数"] = pd.to_numeric(filtered_orders["点数"], errors="coerce").fillna(0)
-        filtered_orders["税抜金額"] = pd.to_numeric(filtered_orders["税抜金額"], errors="coerce").fillna(0)
-        filtered_orders["金額合計"] = filtered_orders["点数"] * filtered_orders["税抜金額"]
-        summary = (
-            filtered_orders.groupby(["品番10", "年月"], as_index=False)["金額合計"].sum()
-        )
-        summary_pivot_filtered = summary.pivot(index="品番10", columns="年月", values="金額合計").fillna(0).astype(int).reset_index()
-        not_in_master_filtered = set(filtered_orders["品番10"]) - set(df_products["結合キー"])
-        not_in_master_df = summary_pivot_filtered[summary_pivot_filtered["品番10"].isin(not_in_master_filtered)].copy()
-        for col in ["品番CD", "商品名", "カラー名", "金額", "カラーNO", "サイズ数計", "革の種類"]:
-            if col not in not_in_master_df.columns:
-                not_in_master_df[col] = pd.NA
-        for col in ["品番CD", "商品名", "カラー名", "金額"]:
-            if col == "品番CD":
-                not_in_master_df[col] = not_in_master_df["品番10"].str[:8]
-            elif col == "商品名":
-                not_in_master_df[col] = not_in_master_df["品番10"].map(
-                    df_orders.drop_duplicates("品番10").set_index("品番10")["品名"]
-                )
-            elif col == "カラー名":
-                not_in_master_df[col] = not_in_master_df["品番10"].map(
-                    df_orders.drop_duplicates("品番10").set_index("品番10")["色"]
-                )
-            elif col == "金額":
-                not_in_master_df[col] = not_in_master_df["品番10"].map(
-                    df_orders.drop_duplicates("品番10").set_index("品番10")["税抜金額"]
-                )
-        for col in month_cols:
-            if col not in not_in_master_df.columns:
-                not_in_master_df[col] = 0
-        not_in_master_df["金額合計"] = not_in_master_df[month_cols].sum(axis=1)
-        output_cols = ["品番CD", "商品名", "カラーNO", "カラー名", "サイズ数計", "金額", "革の種類"] + month_cols + ["金額合計"]
-        not_in_master_df = not_in_master_df[output_cols]
-        merged = pd.concat([merged, not_in_master_df], ignore_index=True)
-
-    base_cols = ["品番CD", "商品名", "カラーNO", "カラー名", "サイズ数計", "金額", "革の種類"]
-    month_cols = [col for col in summary_pivot.columns if col != "品番10"]
-    output_cols = base_cols + month_cols
-    merged = merged[output_cols]
-    merged[month_cols] = merged[month_cols].fillna(0).astype(int)
-    merged["金額合計"] = merged[month_cols].sum(axis=1)
-    output_cols = base_cols + month_cols + ["金額合計"]
-    merged = merged[output_cols]
-
-    if selected_brand in ["WHITEHOUSE COX", "BEORMA"]:
-        leather_order = ["BRI", "VIN BR", "NATUR", "VTC BADALASSI", "BADALASSI", "BR/RUS"]
-        merged["__leather_order"] = merged["革の種類"].apply(
-            lambda x: leather_order.index(x) if x in leather_order else len(leather_order)
-        )
-        merged["__品番4"] = merged["品番CD"].str[:4]
-        merged = merged.sort_values(
-            by=["__品番4", "__leather_order", "革の種類", "商品名", "品番CD"],
-            ascending=[True, True, True, True, True]
-        )
-    elif selected_brand in ["Crockett&Jones", "PYRENEX"]:
-        merged["__品番4"] = merged["品番CD"].str[:4]
-        merged = merged.sort_values(
-            by=["__品番4", "商品名"],
-            ascending=[True, True]
-        )
-    else:
-        merged = merged.sort_values(by=["品番CD"], ascending=[True])
-
-    dup_cols = ["品番CD", "商品名", "金額"]
-    mask = merged.duplicated(subset=dup_cols, keep='first')
-    for col in dup_cols:
-        merged.loc[mask, col] = pd.NA
-
-    folder = os.path.join(os.path.expanduser("~"), "Downloads")
-    start_yy = str(start_year)[-2:]
-    end_yy = str(end_year)[-2:]
-    brand_for_filename = selected_brand if selected_brand != "(すべて)" else "全ブランド"
-    filename = f"商品別売上集計_金額_{brand_for_filename}_{start_yy}年{start_month}月-{end_yy}年{end_month}月_{db_mode}.xlsx"
-    full_path = os.path.join(folder, filename)
-
-    if os.path.exists(full_path):
-        overwrite = messagebox.askyesno("確認", f"{filename} は既に存在します。\n上書きしますか？")
-        if not overwrite:
-            messagebox.showinfo("キャンセル", "保存をキャンセルしました。")
-            conn_prod.close()
-            return
+    report_progress("Excel出力中...")
     try:
-        merged.to_excel(full_path, index=False)
-        messagebox.showinfo("完了", f"✅ 商品別売上集計（金額）を出力しました：\n{full_path}")
+        with profile_stage("Excel出力") as stage:
+            merged.to_excel(full_path, index=False)
+            stage["rows"] = len(merged)
+        dialogs.showinfo("完了", f"✅ 商品別売上集計（金額）を出力しました：\n{full_path}")
     except Exception as e:
-        messagebox.showerror("エラー", f"Excel出力エラー: {e}")
-    conn_prod.close()
+        dialogs.showerror("エラー", f"Excel出力エラー: {e}")
+
+# 点数集計Excelの色分け（革の種類ごとに品番CDセルを塗りつぶし）
+LEATHER_FILL_COLORS = {
+    "BRI": "EBF1DE",           # RGB(235,241,222)
+    "VIN BR": "CCC0DA",        # RGB(204,192,218)
+    "NATUR": "FDE9D9",         # RGB(253,233,217)
+    "VTC BADALASSI": "DDD9C4", # RGB(221,217,196)
+    "BADALASSI": "FABF8F",     # RGB(250,191,143)
+}
+
+class SummaryExcelStyles:
+    # 点数集計Excelのセル書式
+    # フォント・塗りつぶし・罫線の組合せごとに名前付きスタイルを1回だけ登録し、セルには名前で割り当てる
+    def __init__(self, wb):
+        from copy import copy
+        from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+        from openpyxl.styles.fonts import DEFAULT_FONT
+
+        self.wb = wb
+        self.Border = Border
+        self.NamedStyle = NamedStyle
+        self.Side = Side
+        self.thin = Side(border_style="thin", color="000000")
+        # 品番CD・カラー名・金額はフォントサイズ9、商品名・点数はBOLD、それ以外は既定のフォント
+        self.fonts = {
+            "small": Font(size=9),
+            "bold": Font(name=DEFAULT_FONT.name, size=DEFAULT_FONT.size, bold=True),
+            "normal": copy(DEFAULT_FONT),
+        }
+        self.fills = {
+            leather_type: PatternFill(start_color=color, end_color=color, fill_type="solid")
+            for leather_type, color in LEATHER_FILL_COLORS.items()
+        }
+        self.names = {}
+        # ヘッダー行（pandasのto_excelと同じ書式: 太字・四方罫線・中央揃え）
+        side = Side(border_style="thin")
+        self.header = self._register("売上集計_見出し", Font(bold=True),
+                                     None, Border(left=side, right=side, top=side, bottom=side),
+                                     Alignment(horizontal="center", vertical="top"))
+
+    def _register(self, name, font, fill, border, alignment=None):
+        style = self.NamedStyle(name=name, font=font, border=border, alignment=alignment)
+        if fill is not None:
+            style.fill = fill
+        self.wb.add_named_style(style)
+        return name
+
+    def cell_style(self, font_key, leather_type, top, bottom):
+        # データ行のスタイル名（左右罫線は常に、品番CDが変わる行は上罫線、最終行は下罫線）
+        key = (font_key, leather_type, top, bottom)
+        name = self.names.get(key)
+        if name is None:
+            thin = self.thin
+            border = self.Border(left=thin, right=thin, top=thin if top else self.Side(), bottom=thin if bottom else self.Side())
+            name = f"売上集計_{font_key}_{leather_type or 'なし'}_{int(top)}{int(bottom)}"
+            self._register(name, self.fonts[font_key], self.fills.get(leather_type), border)
+            self.names[key] = name
+        return name
+
+def write_styled_summary_excel(merged, full_path):
+    # 点数集計のExcel出力（革の種類で色分け、フォント・罫線を設定）
+    # 書込専用ブックに1行ずつ書式付きで書き出す（to_excel→読込→書式設定の繰返しはしない）
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+
+    # 色分け用の「革の種類」を保存してから不要な列を削除
+    leather_types = merged["革の種類"].tolist() if "革の種類" in merged.columns else None
+    drop_cols = ["カラーNO", "サイズ数計", "革の種類", "__leather_order", "__品番4"]
+    merged = merged.drop(columns=[col for col in drop_cols if col in merged.columns])
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    styles = SummaryExcelStyles(wb)
+
+    header = list(merged.columns)
+    # 列ごとのフォント
+    col_fonts = []
+    for name in header:
+        if name in ("品番CD", "カラー名", "金額"):
+            col_fonts.append("small")
+        elif name in ("商品名", "点数"):
+            col_fonts.append("bold")
+        else:
+            col_fonts.append("normal")
+    col_idx品番CD = header.index("品番CD") if "品番CD" in header else 0
+
+    header_cells = []
+    for name in header:
+        cell = WriteOnlyCell(ws, value=name)
+        cell.style = styles.header
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    # 「品番CD」がNaNでなく直前行と異なる行は上罫線、最終行は下罫線
+    # 行は1行ずつ変換し、1行先を読んで最終行かどうかを判定する（シート全体の行リストは作らない）
+    rows = df_to_rows(merged)
+    next_row = next(rows, None)
+    prev_value = header[col_idx品番CD]
+    i = 0
+    while next_row is not None:
+        row, next_row = next_row, next(rows, None)
+        curr_value = row[col_idx品番CD]
+        top = curr_value is not None and prev_value != curr_value
+        bottom = next_row is None
+        leather_type = leather_types[i] if leather_types is not None else None
+        cells = []
+        for j, value in enumerate(row):
+            cell = WriteOnlyCell(ws, value=value)
+            fill_type = leather_type if j == col_idx品番CD and leather_type in LEATHER_FILL_COLORS else None
+            cell.style = styles.cell_style(col_fonts[j], fill_type, top, bottom)
+            cells.append(cell)
+        ws.append(cells)
+        prev_value = curr_value
+        i += 1
+
+    wb.save(full_path)
 
 def open_upload_window():
     upload_window = tk.Toplevel()
     upload_window.title("アップロードメニュー")
-    upload_window.geometry("400x500")
+    upload_window.geometry("400x560")
 
     tk.Label(upload_window, text="WEB用のExcelファイルを選択してアップロード", font=("Arial", 10)).pack(pady=5)
     tk.Button(upload_window, text="ファイルをアップロード", command=upload_file).pack(pady=10)
@@ -1210,6 +2782,13 @@ def open_upload_window():
     tk.Button(upload_window, text="ファイルをアップロード", command=upload_fukuoka_file).pack(pady=10)
     tk.Button(upload_window, text="複数ファイルをアップロード", command=upload_fukuoka_files).pack(pady=10)
 
+    # 全データCSVの出力方法
+    tk.Label(upload_window, text="全データCSVの出力", font=("Arial", 10)).pack(pady=5)
+    csv_frame = tk.Frame(upload_window)
+    csv_frame.pack()
+    for mode, label in CSV_EXPORT_MODES.items():
+        tk.Radiobutton(csv_frame, text=label, variable=csv_export_mode_var, value=mode).pack(side="left", padx=5)
+
     tk.Label(upload_window, text="【商品マスタ管理】", font=("Arial", 10, "bold")).pack(pady=10)
     tk.Button(upload_window, text="商品マスタExcel取込", command=upload_product_excel).pack(pady=5)
     tk.Button(upload_window, text="商品マスタ金額CSV取込", command=upload_price_csv).pack(pady=5)
@@ -1217,64 +2796,28 @@ def open_upload_window():
     # 閉じるボタン
     tk.Button(upload_window, text="閉じる", command=upload_window.destroy).pack(pady=20)
 
-# 統合GUI
-window = tk.Tk()
-window.title("売上データ処理システム")
-window.geometry("400x600")
-
-tk.Button(window, text="アップロード", command=open_upload_window).pack(pady=20)
-
-tk.Label(window, text="指定したデータをExcelで出力", font=("Arial", 10)).pack(pady=10)
-
-from datetime import datetime
-current_year = datetime.now().year
-current_month = datetime.now().month
-years = list(range(2015, current_year + 1))
-months = list(range(1, 13))
-start_year_var = tk.StringVar(value=str(current_year))
-start_month_var = tk.StringVar(value=str(current_month - 1))
-end_year_var = tk.StringVar(value=str(current_year))
-end_month_var = tk.StringVar(value=str(current_month - 1))
-
-tk.Label(window, text="開始 年月").pack()
-frame1 = tk.Frame(window)
-frame1.pack()
-ttk.Combobox(frame1, textvariable=start_year_var, values=years, width=6).pack(side="left")
-ttk.Combobox(frame1, textvariable=start_month_var, values=months, width=4).pack(side="left")
-
-tk.Label(window, text="終了 年月").pack()
-frame2 = tk.Frame(window)
-frame2.pack()
-ttk.Combobox(frame2, textvariable=end_year_var, values=years, width=6).pack(side="left")
-ttk.Combobox(frame2, textvariable=end_month_var, values=months, width=4).pack(side="left")
-
-# "品番" 範囲指定用テキストボックス
-# tk.Label(window, text="③ 品番を指定（範囲指定: 12桁）").pack(pady=10)
-# frame3 = tk.Frame(window)
-# frame3.pack()
-# tk.Label(frame3, text="開始品番:").pack(side="left")
-# start_product_code_var = tk.StringVar()
-# tk.Entry(frame3, textvariable=start_product_code_var, width=15).pack(side="left")
-# tk.Label(frame3, text="終了品番:").pack(side="left")
-# end_product_code_var = tk.StringVar()
-# tk.Entry(frame3, textvariable=end_product_code_var, width=15).pack(side="left")
-
-# tk.Button(window, text="Excelファイルに出力", command=lambda: export_data(start_product_code_var.get(), end_product_code_var.get())).pack(pady=20)
-
-# === ラジオボタン追加 ===
-db_select_var = tk.StringVar(value="ALL")  # デフォルトはWEB
-radio_frame = tk.Frame(window)
-radio_frame.pack(pady=5)
-tk.Radiobutton(radio_frame, text="店舗", variable=db_select_var, value="店舗").pack(side="left", padx=10)
-tk.Radiobutton(radio_frame, text="WEB", variable=db_select_var, value="WEB").pack(side="left", padx=10)
-tk.Radiobutton(radio_frame, text="ALL", variable=db_select_var, value="ALL").pack(side="left", padx=10)
-
-# === ブランド選択用Combobox追加 ===
+def open_profile_window():
+    # 直近の取込・出力の段階ごとの時間（新しい順）。それより前の分は profile.log を見る
+    profile_window = tk.Toplevel()
+    profile_window.title("前回の処理時間")
+    profile_window.geometry("560x420")
+    text = tk.Text(profile_window, wrap="none", font=("Consolas", 9))
+    text.pack(fill="both", expand=True, padx=5, pady=5)
+    profiles = list(recent_profiles)
+    if profiles:
+        text.insert("end", "\n\n".join(format_profile(profile) for profile in profiles))
+    else:
+        text.insert("end", "まだ記録がありません。")
+    text.insert("end", f"\n\nログ: {get_profile_log_path()}")
+    text.config(state="disabled")
+    tk.Button(profile_window, text="閉じる", command=profile_window.destroy).pack(pady=5)
+
 def get_brand_list():
-    conn = sqlite3.connect(get_db_path("product.db"))
+    # 起動時にバックグラウンドで呼ぶのでpandasは使わない
+    conn = connect_db("product.db")
     try:
-        df = pd.read_sql("SELECT DISTINCT ブランド FROM products WHERE ブランド IS NOT NULL AND ブランド != ''", conn)
-        brands = sorted(df["ブランド"].dropna().unique().tolist())
+        rows = conn.execute("SELECT DISTINCT ブランド FROM products WHERE ブランド IS NOT NULL AND ブランド != ''").fetchall()
+        brands = sorted(row[0] for row in rows)
         brands.insert(0, "(すべて)")
         return brands
     except Exception as e:
@@ -1283,62 +2826,540 @@ def get_brand_list():
     finally:
         conn.close()
 
-brand_list = get_brand_list()
-selected_brand_var = tk.StringVar(value=brand_list[0])
-tk.Label(window, text="ブランドを選択").pack()
-brand_combo = ttk.Combobox(window, textvariable=selected_brand_var, values=brand_list, width=20, state="readonly")
-brand_combo.pack(pady=5)
-
-# === WEB時のみ表示するフィルタUI ===
-filter_frame = tk.Frame(window)
-
-# 年齢
-filter_age_var = tk.StringVar(value="ALL")
-tk.Label(filter_frame, text="年齢").grid(row=0, column=0, sticky="w", padx=5, pady=5)
-age_options = ["ALL", "10代以下", "20代", "30代", "40代", "50代", "60代以上"]
-age_combo = ttk.Combobox(filter_frame, textvariable=filter_age_var, values=age_options, width=10, state="readonly")
-age_combo.grid(row=0, column=1, sticky="w")
-
-# 性別
-filter_gender_var = tk.StringVar(value="ALL")
-tk.Label(filter_frame, text="性別").grid(row=1, column=0, sticky="w", padx=5, pady=5)
-gender_options = ["ALL", "男性", "女性"]
-gender_combo = ttk.Combobox(filter_frame, textvariable=filter_gender_var, values=gender_options, width=10, state="readonly")
-gender_combo.grid(row=1, column=1, sticky="w")
-
-# 居住地
-filter_region_var = tk.StringVar(value="ALL")
-region_list = [
-    "ALL", "北海道地方", "東北地方", "関東地方", "中部地方", "近畿地方", "中国地方", "四国地方", "九州地方"
-]
-tk.Label(filter_frame, text="居住地").grid(row=2, column=0, sticky="w", padx=5, pady=5)
-region_combo = ttk.Combobox(filter_frame, textvariable=filter_region_var, values=region_list, width=12, state="readonly")
-region_combo.grid(row=2, column=1, sticky="w")
-
-# ギフト
-filter_gift_var = tk.StringVar(value="ALL")
-tk.Label(filter_frame, text="ギフト").grid(row=3, column=0, sticky="w", padx=5, pady=5)
-gift_options = ["ALL", "あり", "なし"]
-gift_combo = ttk.Combobox(filter_frame, textvariable=filter_gift_var, values=gift_options, width=10, state="readonly")
-gift_combo.grid(row=3, column=1, sticky="w")
-
-# 初期状態は非表示
-def update_filter_frame(*args):
-    if db_select_var.get() == "WEB":
-        filter_frame.pack(after=radio_frame, pady=5)
+# === 起動時間の計測 ===
+# 「--startup-benchmark」で起動すると、自分自身（EXEならEXE）を「--startup-probe」付きで繰り返し起動し、
+# プロセス起動からウィンドウ表示・ブランド一覧の読込完了までの時間をユーザーごとのデータフォルダの startup_benchmark.txt に追記する
+STARTUP_BENCHMARK_RUNS = 5
+STARTUP_BENCHMARK_LOG = "startup_benchmark.txt"
+
+def run_startup_benchmark(runs=STARTUP_BENCHMARK_RUNS):
+    import json
+    import subprocess
+    import tempfile
+    import time
+    from datetime import datetime
+
+    if getattr(sys, "frozen", False):
+        cmd = [sys.executable]
     else:
-        filter_frame.pack_forget()
+        cmd = [sys.executable, os.path.abspath(__file__)]
+    results = []
+    for _ in range(runs):
+        fd, probe_path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            started = time.time()
+            subprocess.run(cmd + ["--startup-probe", probe_path], check=True, timeout=300)
+            with open(probe_path, encoding="utf-8") as f:
+                probe = json.load(f)
+        finally:
+            os.remove(probe_path)
+        results.append({name: t - started for name, t in probe.items()})
+
+    lines = [f"=== {datetime.now():%Y-%m-%d %H:%M:%S} {os.path.basename(cmd[-1])} ({runs}回) ==="]
+    for name in results[0]:
+        times = sorted(r[name] for r in results)
+        lines.append(f"{name}: 中央値 {times[len(times) // 2]:.2f}秒（最小 {times[0]:.2f} / 最大 {times[-1]:.2f}）")
+    log_path = os.path.join(get_local_data_dir(), STARTUP_BENCHMARK_LOG)
+    with open(log_path, "a", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    print("\n".join(lines))
+    print(f"結果を {log_path} に追記しました")
+
+# === 取込・集計のベンチマーク ===
+# 「benchmark」サブコマンドで、現行の列構成に合わせた架空の商品マスタ・WEB受注・店舗Excelを倍率ごとに作り、
+# 一時フォルダのDBに取込・集計して段階ごとの時間を計る（実際のDB・CSVには触らない）
+# 結果は benchmark_results.json（既定はユーザーごとのデータフォルダ）に追記し、同じ倍率の前回結果との比を表示する
+BENCHMARK_BASE_ROWS = {"products": 2600, "web": 3000, "store": 80}  # 1倍 = 商品マスタ全件と1か月分の受注のおおよその件数
+BENCHMARK_SCALES = [1, 10, 100]
+BENCHMARK_LOG = "benchmark_results.json"
+BENCHMARK_MONTH = (2024, 11)
+
+def write_benchmark_workbook(path, header, rows):
+    # 書込専用ブックに1行ずつ書き出す（大きな件数でもメモリを使わない）
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+
+def generate_benchmark_files(folder, scale, seed=0):
+    # 戻り値: {"products": 商品マスタExcel, "web": WEB受注Excel, "store": 店舗Excel} のパス
+    import random
+    rng = random.Random(seed)
+    year, month = BENCHMARK_MONTH
+    brand_codes = list(get_brand_map())
+    words = LEATHER_KEYWORDS + ["JKT", "KNIT", "COAT", "SCARF", "BAG"]
+    paths = {
+        "products": os.path.join(folder, "商品マスタ.xlsx"),
+        "web": os.path.join(folder, f"受注{year}年{month}月.xlsx"),
+        "store": os.path.join(folder, f"データ出力{year}{month:02d}.xlsx"),
+    }
 
-db_select_var.trace_add("write", update_filter_frame)
-update_filter_frame()
+    # 商品マスタ: 品番CD（ブランド2桁＋連番6桁）ごとにカラーNO 1〜5
+    products = []
+    for i in range(BENCHMARK_BASE_ROWS["products"] * scale):
+        code = f"{brand_codes[i // 5 % len(brand_codes)]}{i // 5:06d}"
+        products.append([f"{rng.choice(words)} {i // 5:06d}", code, str(i % 5 + 1), f"COLOR {i % 5 + 1}", str(rng.randint(1, 8))])
+    write_benchmark_workbook(paths["products"], ["商品名", "品番CD", "カラーNO", "カラー名", "サイズ数計"], products)
+
+    def item_code():
+        # 12桁の品番（5%は商品マスタに無い品番）
+        if rng.random() < 0.05:
+            return f"{rng.choice(brand_codes)}9{rng.randrange(100000):05d}0101"
+        product = products[rng.randrange(len(products))]
+        return f"{product[1]}0{product[2]}{rng.randint(1, 6):02d}"
+
+    # WEB受注: WEB_COLUMN_INDICES の列位置に合わせる（5%は返品、2行で1受注）
+    prefectures = [pref for prefs in REGION_MAP.values() for pref in prefs]
+    web_rows = []
+    for i in range(BENCHMARK_BASE_ROWS["web"] * scale):
+        price = rng.choice([5000, 12000, 18000, 33000, 68000]) * (-1 if rng.random() < 0.05 else 1)
+        code = rng.choice(WEB_GIFT_ITEMS) if rng.random() < 0.01 else item_code()
+        web_rows.append([
+            year * 10000 + month * 100 + rng.randint(1, 28), f"W{year}{month:02d}{i // 2:07d}", "", "",
+            rng.choice([None, 18, 25, 34, 41, 52, 67]), rng.choice(["M", "RM", "L", "RL"]),
+            int(code), "送料" if rng.random() < 0.03 else f"ITEM {code[:8]}", "BLK", "M",
+            price, int(add_tax(price, year * 100 + month)), rng.choice(prefectures), "クレジットカード",
+            rng.choice([None, None, None, "リボン", "のし"]),
+        ])
+    write_benchmark_workbook(paths["web"], ["受注日", "受注№", "氏名", "メール", "年齢", "性別", "品番", "品名", "色",
+                                            "サイズ", "税抜金額", "税込金額", "居住地", "支払方法", "ギフトリボン"], web_rows)
+
+    # 店舗: parse_store_file が使う列（商品CD・プロパー金額・売上数など）と社員名
+    store_rows = []
+    for i in range(BENCHMARK_BASE_ROWS["store"] * scale):
+        code = item_code()
+        store_rows.append([code, f"ITEM {code[:8]}", "NVY", "M", str(rng.choice([12000, 18000, 33000])),
+                           str(rng.choice([1, 1, 1, 2, -1])), rng.choice(["山田", "佐藤", "ｗｅｂ"])])
+    write_benchmark_workbook(paths["store"], ["商品CD", "商品名", "カラー", "サイズ", "プロパー金額", "売上数", "社員名"], store_rows)
+    return paths
+
+def run_benchmark_scale(folder, scale):
+    # 1つの倍率の計測（DBは folder に新規作成）
+    # 戻り値: {"件数": {...}, "時間": {段階: 秒}, "メモリMB": {段階: 使用メモリのピーク}, "生成秒": 秒}
+    import time
+    started = time.perf_counter()
+    paths = generate_benchmark_files(folder, scale)
+    generate_seconds = round(time.perf_counter() - started, 3)
+    for db_filename in MIGRATIONS:
+        db_path_cache[db_filename] = os.path.join(folder, db_filename)
+    os.chdir(folder)
+    with profile_run(f"ベンチマーク {scale}倍") as profile:
+        counts = {"商品マスタ": BENCHMARK_BASE_ROWS["products"] * scale, **run_benchmark_stages(folder, paths)}
+    stages = [stage for stage in profile.stages if stage["depth"] == 0]
+    return {
+        "件数": counts,
+        "時間": {stage["name"]: round(stage["seconds"], 3) for stage in stages},
+        "メモリMB": {stage["name"]: stage["peak_mb"] for stage in stages},
+        "生成秒": generate_seconds,
+    }
 
-# 商品別売上集計ダウンロードボタン
-tk.Button(window, text="商品別売上集計ダウンロード", command=lambda: download_sales_summary(selected_brand_var)).pack(pady=10)
-# 商品別売上集計（金額）ダウンロードボタンを追加
-btn_amount = tk.Button(window, text="商品別売上集計（金額）ダウンロード", command=lambda: download_sales_summary_amount(selected_brand_var))
-btn_amount.pack(pady=10)
+def run_benchmark_stages(folder, paths):
+    # 各段階を profile_stage で計測する（取込関数の中の段階は1つ下の段階として記録される）
+    def timed(name, func, *args):
+        with profile_stage(name):
+            return func(*args)
 
-# 閉じるボタン
-tk.Button(window, text="閉じる", command=window.destroy).pack(pady=20)
+    timed("商品マスタ取込", import_product_excel, paths["products"])
 
-window.mainloop()
\ No newline at end of file
+    conn = connect_db("frame.db")
+    try:
+        year, month, df_web = timed("WEB_Excel読込", parse_web_file, paths["web"])
+        timed("WEB_DB登録", store_web_orders, conn, df_web)
+        conn.commit()
+        # 同じ行の再登録（全件が重複）と、分割読込での再取込
+        timed("WEB_重複チェック", store_web_orders, conn, df_web)
+        conn.rollback()
+        timed("WEB_分割読込（再取込）", store_web_file_streaming, conn, paths["web"])
+        conn.rollback()
+        timed("WEB_月次集計", refresh_monthly_sales, conn, "frame.db")
+        conn.commit()
+        timed("WEB_CSV出力", export_table_csv, conn, "orders", WEB_CSV)
+        if has_analytics_cache():
+            timed("WEB_分析キャッシュ", refresh_analytics_cache, conn, "frame.db")
+    finally:
+        conn.close()
+
+    conn = connect_db("framefukuoka.db")
+    try:
+        year, month, df_store = timed("店舗_Excel読込", parse_store_file, paths["store"])
+        timed("店舗_DB登録", store_store_orders, conn, df_store)
+        refresh_monthly_sales(conn, "framefukuoka.db")
+        conn.commit()
+    finally:
+        conn.close()
+
+    clear_summary_cache()
+    request = ReportRequest(year, month, year, month)
+    agg = timed("集計_DB読込", get_sales_aggregate, request)
+    merged = timed("集計_ピボット", build_sales_table, agg, "count")
+    timed("集計_Excel書式出力", write_styled_summary_excel, merged, os.path.join(folder, "商品別売上集計.xlsx"))
+    return {"WEB受注": len(df_web), "店舗": len(df_store), "集計行": len(merged)}
+
+def get_git_revision():
+    # 計測したコードのコミット（gitで管理していない場合はNone）
+    import subprocess
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+def run_benchmark(scales=BENCHMARK_SCALES, output=None, keep_dir=None):
+    # keep_dir を指定すると、生成したExcel・DBを残す（未指定なら一時フォルダに作って削除）
+    # output を省略すると、結果はユーザーごとのデータフォルダの benchmark_results.json に追記する
+    import json
+    import platform
+    import shutil
+    import tempfile
+    from datetime import datetime
+    import pandas as pd
+
+    output = os.path.abspath(output or os.path.join(get_local_data_dir(), BENCHMARK_LOG))
+    runs = []
+    if os.path.exists(output):
+        with open(output, encoding="utf-8") as f:
+            runs = json.load(f)
+    run = {
+        "日時": f"{datetime.now():%Y-%m-%d %H:%M:%S}",
+        "スクリプト": os.path.basename(sys.executable if getattr(sys, "frozen", False) else __file__),
+        "コミット": get_git_revision(),
+        "Python": platform.python_version(),
+        "pandas": pd.__version__,
+        "倍率": {},
+    }
+    cwd = os.getcwd()
+    # 実際のDBの共有接続が残っていると、同じファイル名で一時フォルダのDBを開けないので閉じておく
+    close_db_connections()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for scale in scales:
+            folder = os.path.join(keep_dir or tmp_dir, f"x{scale}")
+            shutil.rmtree(folder, ignore_errors=True)
+            os.makedirs(folder)
+            try:
+                result = run_benchmark_scale(folder, scale)
+            finally:
+                close_db_connections()
+                # 分析用キャッシュはユーザーのデータフォルダにできるので、一時フォルダのDBの分を消しておく
+                shutil.rmtree(os.path.dirname(get_analytics_cache_dir("frame.db")), ignore_errors=True)
+                for db_filename in MIGRATIONS:
+                    db_path_cache.pop(db_filename, None)
+                clear_summary_cache()
+                os.chdir(cwd)
+            run["倍率"][str(scale)] = result
+
+            # 同じ倍率の前回結果との比較
+            previous = next((r["倍率"][str(scale)]["時間"] for r in reversed(runs) if str(scale) in r["倍率"]), {})
+            print(f"=== {scale}倍（WEB受注 {result['件数']['WEB受注']} 件・店舗 {result['件数']['店舗']} 件・"
+                  f"商品マスタ {result['件数']['商品マスタ']} 件） ===")
+            for name, seconds in result["時間"].items():
+                note = f"（前回比 x{seconds / previous[name]:.2f}）" if previous.get(name) else ""
+                memory = f" ピーク {result['メモリMB'][name]:.0f}MB" if result["メモリMB"][name] is not None else ""
+                print(f"{name}: {seconds:.3f}秒{memory}{note}")
+
+    runs.append(run)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(runs, f, ensure_ascii=False, indent=2)
+    print(f"結果を {output} に追記しました")
+
+# === コマンドライン実行 ===
+# Tkを使わずに取込・集計を実行する（サーバーでの夜間バッチ用）。例:
+#   python 20250616-1.py ingest-web 受注フォルダ
+#   python 20250616-1.py ingest-store データ出力202403.xlsx --csv full
+#   python 20250616-1.py summary --brand PYRENEX --from 2024-01 --to 2024-12 --mode WEB --output 出力フォルダ --yes
+# ダイアログの内容はコンソールに出力し、エラー・警告があれば終了コード1を返す
+CLI_COMMANDS = ["ingest-web", "ingest-store", "products", "prices", "summary", "export", "benchmark"]
+
+def parse_year_month(text):
+    # "2024-03" / "202403" → (2024, 3)
+    import argparse
+    m = re.fullmatch(r"(\d{4})-?(\d{1,2})", text)
+    if not m or not 1 <= int(m.group(2)) <= 12:
+        raise argparse.ArgumentTypeError(f"年月は YYYY-MM で指定してください: {text}")
+    return int(m.group(1)), int(m.group(2))
+
+def expand_excel_paths(paths):
+    # フォルダが指定された場合は、中のExcelファイルを名前順に取込む（Excelの一時ファイル ~$ は除く）
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            file_paths.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.lower().endswith((".xlsx", ".xls")) and not name.startswith("~$")
+            ))
+        else:
+            file_paths.append(path)
+    return file_paths
+
+def cli_report_request(args):
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    request = ReportRequest(args.start[0], args.start[1], args.end[0], args.end[1], folder=args.output)
+    if args.command == "summary":
+        request = replace(request, db_mode=args.mode, brand=args.brand,
+                          age=args.age, gender=args.gender, region=args.region, gift=args.gift)
+    return request
+
+def cli_ingest(args):
+    file_paths = expand_excel_paths(args.paths)
+    if not file_paths:
+        dialogs.showerror("エラー", "取込むExcelファイルがありません。")
+        return
+    result = ingest_files(args.kind, file_paths, args.csv, progress=print_ingest_progress)
+    show_ingest_result(result, len(file_paths))
+
+def cli_summary(args):
+    request = cli_report_request(args)
+    if args.measure in ("count", "both"):
+        download_sales_summary(request)
+    if args.measure in ("amount", "both"):
+        download_sales_summary_amount(request)
+
+def cli_export(args):
+    export_data(cli_report_request(args), args.code_from, args.code_to)
+
+def build_cli_parser():
+    import argparse
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--db-dir", help="作業フォルダ（DB・全データCSVの場所）。省略時は通常どおりDropbox→カレントの順で探す")
+    common.add_argument("--yes", action="store_true", help="出力ファイルが既にあれば上書きする")
+
+    parser = argparse.ArgumentParser(description="売上データ処理システム（コマンドライン実行）")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, kind, label in [("ingest-web", "web", "WEB受注"), ("ingest-store", "store", "店舗")]:
+        p = sub.add_parser(name, parents=[common], help=f"{label}Excelの取込（フォルダ指定可）")
+        p.add_argument("paths", nargs="+", help="Excelファイルまたはフォルダ")
+        p.add_argument("--csv", choices=list(CSV_EXPORT_MODES) + ["none"], default="append",
+                       help="全データCSVの出力方法（既定: append）")
+        p.set_defaults(func=cli_ingest, kind=kind)
+
+    p = sub.add_parser("products", parents=[common], help="商品マスタExcelの取込")
+    p.add_argument("path")
+    p.set_defaults(func=lambda args: import_product_excel(args.path))
+
+    p = sub.add_parser("prices", parents=[common], help="商品マスタ金額CSVの取込")
+    p.add_argument("path")
+    p.set_defaults(func=lambda args: import_price_csv(args.path))
+
+    period = argparse.ArgumentParser(add_help=False)
+    period.add_argument("--from", dest="start", type=parse_year_month, required=True, help="開始年月（YYYY-MM）")
+    period.add_argument("--to", dest="end", type=parse_year_month, required=True, help="終了年月（YYYY-MM）")
+    period.add_argument("--output", help="出力フォルダ（既定: ダウンロードフォルダ）")
+
+    p = sub.add_parser("summary", parents=[common, period], help="商品別売上集計Excelの出力")
+    p.add_argument("--mode", choices=REPORT_DB_MODES, default="ALL")
+    p.add_argument("--brand", default="(すべて)")
+    p.add_argument("--measure", choices=["count", "amount", "both"], default="both", help="点数・金額・両方（既定）")
+    p.add_argument("--age", default="ALL", help="年齢（WEBのみ。例: 30代）")
+    p.add_argument("--gender", default="ALL", help="性別（WEBのみ）")
+    p.add_argument("--region", default="ALL", help="居住地（WEBのみ。例: 関東地方）")
+    p.add_argument("--gift", default="ALL", help="ギフト（WEBのみ。あり/なし）")
+    p.set_defaults(func=cli_summary)
+
+    p = sub.add_parser("export", parents=[common, period], help="WEB受注データのExcel出力")
+    p.add_argument("--code-from", default="", help="開始品番")
+    p.add_argument("--code-to", default="", help="終了品番")
+    p.set_defaults(func=cli_export)
+
+    p = sub.add_parser("benchmark", parents=[common], help="架空データで取込・集計の各段階の時間を計測")
+    p.add_argument("--scales", type=int, nargs="+", default=BENCHMARK_SCALES, help="データ量の倍率（既定: 1 10 100）")
+    p.add_argument("--output", help=f"結果のJSON（既定: ユーザーのデータフォルダの {BENCHMARK_LOG}）")
+    p.add_argument("--keep", help="生成したExcel・DBを残すフォルダ")
+    p.set_defaults(func=lambda args: run_benchmark(args.scales, args.output, args.keep))
+    return parser
+
+def run_cli(argv):
+    # コマンドラインから実行して終了コードを返す
+    global dialogs
+    args = build_cli_parser().parse_args(argv)
+    if args.db_dir:
+        # 取込ファイル・出力先の相対パスは起動時のカレントフォルダから解決する
+        for name in ("path", "output"):
+            if getattr(args, name, None):
+                setattr(args, name, os.path.abspath(getattr(args, name)))
+        if hasattr(args, "paths"):
+            args.paths = [os.path.abspath(path) for path in args.paths]
+        os.chdir(args.db_dir)
+        # Dropboxのフォルダがあっても、DBは指定したフォルダのものだけを使う
+        close_db_connections()
+        for db_filename in MIGRATIONS:
+            db_path_cache[db_filename] = os.path.join(os.getcwd(), db_filename)
+    dialogs = ConsoleDialogs(assume_yes=args.yes)
+    try:
+        if args.command != "benchmark":
+            run_migrations()
+        args.func(args)
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        close_db_connections()
+    return 1 if dialogs.failed else 0
+
+if __name__ == "__main__":
+    # 複数ファイル取込のプロセスプール用（PyInstallerでEXE化した場合に必要）
+    import multiprocessing
+    multiprocessing.freeze_support()
+
+    import time
+    # サブコマンド付きで起動した場合はGUIを出さずに実行して終了
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS + ["-h", "--help"]:
+        sys.exit(run_cli(sys.argv[1:]))
+    if "--startup-benchmark" in sys.argv:
+        run_startup_benchmark()
+        sys.exit()
+    # 起動時間計測用（--startup-probe 出力先）: 各段階の時刻を記録して、読込完了後に終了する
+    startup_probe_path = sys.argv[sys.argv.index("--startup-probe") + 1] if "--startup-probe" in sys.argv else None
+    startup_times = {"モジュール読込": time.time()}
+
+    # 統合GUI
+    window = tk.Tk()
+    window.title("売上データ処理システム")
+    window.geometry("400x650")
+
+    # 重い処理はワーカースレッドで実行（進捗バー・キャンセル付き）
+    task_runner = TaskRunner(window)
+
+    tk.Button(window, text="アップロード", command=open_upload_window).pack(pady=20)
+
+    # 取込後の全データCSV出力方法（アップロード画面のラジオボタン）
+    csv_export_mode_var = tk.StringVar(value="append")
+
+    tk.Label(window, text="指定したデータをExcelで出力", font=("Arial", 10)).pack(pady=10)
+
+    from datetime import datetime
+    current_year = datetime.now().year
+    current_month = datetime.now().month
+    years = list(range(2015, current_year + 1))
+    months = list(range(1, 13))
+    start_year_var = tk.StringVar(value=str(current_year))
+    start_month_var = tk.StringVar(value=str(current_month - 1))
+    end_year_var = tk.StringVar(value=str(current_year))
+    end_month_var = tk.StringVar(value=str(current_month - 1))
+
+    tk.Label(window, text="開始 年月").pack()
+    frame1 = tk.Frame(window)
+    frame1.pack()
+    ttk.Combobox(frame1, textvariable=start_year_var, values=years, width=6).pack(side="left")
+    ttk.Combobox(frame1, textvariable=start_month_var, values=months, width=4).pack(side="left")
+
+    tk.Label(window, text="終了 年月").pack()
+    frame2 = tk.Frame(window)
+    frame2.pack()
+    ttk.Combobox(frame2, textvariable=end_year_var, values=years, width=6).pack(side="left")
+    ttk.Combobox(frame2, textvariable=end_month_var, values=months, width=4).pack(side="left")
+
+    # "品番" 範囲指定用テキストボックス
+    # tk.Label(window, text="③ 品番を指定（範囲指定: 12桁）").pack(pady=10)
+    # frame3 = tk.Frame(window)
+    # frame3.pack()
+    # tk.Label(frame3, text="開始品番:").pack(side="left")
+    # start_product_code_var = tk.StringVar()
+    # tk.Entry(frame3, textvariable=start_product_code_var, width=15).pack(side="left")
+    # tk.Label(frame3, text="終了品番:").pack(side="left")
+    # end_product_code_var = tk.StringVar()
+    # tk.Entry(frame3, textvariable=end_product_code_var, width=15).pack(side="left")
+
+    # tk.Button(window, text="Excelファイルに出力", command=lambda: export_data(get_report_params(selected_brand_var), start_product_code_var.get(), end_product_code_var.get())).pack(pady=20)
+
+    # === ラジオボタン追加 ===
+    db_select_var = tk.StringVar(value="ALL")  # デフォルトはWEB
+    radio_frame = tk.Frame(window)
+    radio_frame.pack(pady=5)
+    tk.Radiobutton(radio_frame, text="店舗", variable=db_select_var, value="店舗").pack(side="left", padx=10)
+    tk.Radiobutton(radio_frame, text="WEB", variable=db_select_var, value="WEB").pack(side="left", padx=10)
+    tk.Radiobutton(radio_frame, text="ALL", variable=db_select_var, value="ALL").pack(side="left", padx=10)
+
+    # === ブランド選択用Combobox追加 ===
+    # ブランド一覧は画面表示後にバックグラウンドで読み込む（それまでは「(すべて)」のみ）
+    selected_brand_var = tk.StringVar(value="(すべて)")
+    tk.Label(window, text="ブランドを選択").pack()
+    brand_combo = ttk.Combobox(window, textvariable=selected_brand_var, values=["(すべて)"], width=20, state="readonly")
+    brand_combo.pack(pady=5)
+
+    # === WEB時のみ表示するフィルタUI ===
+    filter_frame = tk.Frame(window)
+
+    # 年齢
+    filter_age_var = tk.StringVar(value="ALL")
+    tk.Label(filter_frame, text="年齢").grid(row=0, column=0, sticky="w", padx=5, pady=5)
+    age_options = ["ALL", "10代以下", "20代", "30代", "40代", "50代", "60代以上"]
+    age_combo = ttk.Combobox(filter_frame, textvariable=filter_age_var, values=age_options, width=10, state="readonly")
+    age_combo.grid(row=0, column=1, sticky="w")
+
+    # 性別
+    filter_gender_var = tk.StringVar(value="ALL")
+    tk.Label(filter_frame, text="性別").grid(row=1, column=0, sticky="w", padx=5, pady=5)
+    gender_options = ["ALL", "男性", "女性"]
+    gender_combo = ttk.Combobox(filter_frame, textvariable=filter_gender_var, values=gender_options, width=10, state="readonly")
+    gender_combo.grid(row=1, column=1, sticky="w")
+
+    # 居住地
+    filter_region_var = tk.StringVar(value="ALL")
+    region_list = [
+        "ALL", "北海道地方", "東北地方", "関東地方", "中部地方", "近畿地方", "中国地方", "四国地方", "九州地方"
+    ]
+    tk.Label(filter_frame, text="居住地").grid(row=2, column=0, sticky="w", padx=5, pady=5)
+    region_combo = ttk.Combobox(filter_frame, textvariable=filter_region_var, values=region_list, width=12, state="readonly")
+    region_combo.grid(row=2, column=1, sticky="w")
+
+    # ギフト
+    filter_gift_var = tk.StringVar(value="ALL")
+    tk.Label(filter_frame, text="ギフト").grid(row=3, column=0, sticky="w", padx=5, pady=5)
+    gift_options = ["ALL", "あり", "なし"]
+    gift_combo = ttk.Combobox(filter_frame, textvariable=filter_gift_var, values=gift_options, width=10, state="readonly")
+    gift_combo.grid(row=3, column=1, sticky="w")
+
+    # 初期状態は非表示
+    def update_filter_frame(*args):
+        if db_select_var.get() == "WEB":
+            filter_frame.pack(after=radio_frame, pady=5)
+        else:
+            filter_frame.pack_forget()
+
+    db_select_var.trace_add("write", update_filter_frame)
+    update_filter_frame()
+
+    # 商品別売上集計ダウンロードボタン
+    tk.Button(window, text="商品別売上集計ダウンロード", command=lambda: run_task(
+        "商品別売上集計", download_sales_summary, get_report_params(selected_brand_var))).pack(pady=10)
+    # 商品別売上集計（金額）ダウンロードボタンを追加
+    btn_amount = tk.Button(window, text="商品別売上集計（金額）ダウンロード", command=lambda: run_task(
+        "商品別売上集計（金額）", download_sales_summary_amount, get_report_params(selected_brand_var)))
+    btn_amount.pack(pady=10)
+
+    # 取込・出力の段階ごとの処理時間
+    tk.Button(window, text="前回の処理時間", command=open_profile_window).pack(pady=5)
+
+    # 閉じるボタン
+    tk.Button(window, text="閉じる", command=window.destroy).pack(pady=20)
+
+    def apply_brand_list(brand_list):
+        brand_combo["values"] = brand_list
+        startup_times["ブランド一覧"] = time.time()
+        if startup_probe_path:
+            import json
+            with open(startup_probe_path, "w", encoding="utf-8") as f:
+                json.dump(startup_times, f)
+            window.destroy()
+
+    def load_startup_data():
+        # 起動時にDBスキーマを最新化（インデックス・年月キー列の追加など）してからブランド一覧を読む
+        run_migrations()
+        task_runner.call_in_ui(apply_brand_list, get_brand_list())
+        # 最初の取込・集計で待たないよう、pandasを先に読み込んでおく
+        if not startup_probe_path:
+            import pandas
+
+    def on_window_shown():
+        window.update_idletasks()
+        startup_times["ウィンドウ表示"] = time.time()
+        threading.Thread(target=load_startup_data, daemon=True).start()
+
+    window.after(0, on_window_shown)
+    window.mainloop()
+    close_db_connections()
@@ -0,0 +1,41 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "20250616-1.py")
+
+
+@pytest.fixture(scope="session")
+def app():
+    # ファイル名にハイフンがあるので、importではなくパスから読み込む
+    spec = importlib.util.spec_from_file_location("salesapp", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["salesapp"] = module
+    spec.loader.exec_module(module)
+    # 処理時間はログファイル（スクリプトと同じフォルダ）に書かない
+    module.profile_logger = False
+    return module
+
+
+@pytest.fixture(autouse=True)
+def local_data_dir(tmp_path, monkeypatch):
+    # PCごとの記録（ログ・キャッシュ）はユーザーのデータフォルダではなく一時フォルダに作る
+    folder = tmp_path / "local"
+    monkeypatch.setenv("LOCALAPPDATA", str(folder))
+    return folder
+
+
+@pytest.fixture
+def db_dir(app, tmp_path, monkeypatch):
+    # DBはすべて一時フォルダに作る（Dropbox・リポジトリのDBには触らない）
+    monkeypatch.chdir(tmp_path)
+    app.close_db_connections()
+    saved = dict(app.db_path_cache)
+    for db_filename in app.MIGRATIONS:
+        app.db_path_cache[db_filename] = str(tmp_path / db_filename)
+    yield tmp_path
+    app.close_db_connections()
+    app.db_path_cache.clear()
+    app.db_path_cache.update(saved)
@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+from test_web_import import write_web_excel
+
+pytest.importorskip("pyarrow")
+
+
+def import_web(app, db_dir, name, days, prefix):
+    excel = db_dir / name
+    write_web_excel(excel, days, prefix)
+    app.ingest_files("web", [str(excel)], "none")
+
+
+def cached_orders(app):
+    df = app.read_analytics_cache("frame.db")
+    return set(df["受注№"])
+
+
+def test_cache_is_kept_outside_db_folder(app, db_dir, local_data_dir):
+    import_web(app, db_dir, "受注2024年4月.xlsx", range(1, 11), "A")
+
+    assert cached_orders(app) == {f"A{day:03d}" for day in range(1, 11)}
+    assert not (db_dir / app.ANALYTICS_CACHE_DIR).exists()
+    assert str(local_data_dir) in app.get_analytics_cache_dir("frame.db")
+
+
+def test_cache_is_rebuilt_when_synced_db_reuses_cached_rowids(app, db_dir):
+    import_web(app, db_dir, "受注2024年4月.xlsx", range(1, 11), "A")
+    assert len(cached_orders(app)) == 10
+
+    # 他のPCで末尾の行が置き換えられたDBが同期された場合（rowidは再利用され、行数も同じ）
+    other = sqlite3.connect(db_dir / "frame.db")
+    try:
+        other.execute("UPDATE orders SET 受注№ = 'B' || substr(受注№, 2) WHERE rowid > 5")
+        other.commit()
+    finally:
+        other.close()
+
+    assert cached_orders(app) == {f"A{day:03d}" for day in range(1, 6)} | {f"B{day:03d}" for day in range(6, 11)}
+
+
+def test_cache_is_rebuilt_when_synced_db_lost_cached_rows(app, db_dir):
+    import_web(app, db_dir, "受注2024年4月.xlsx", range(1, 11), "A")
+    assert len(cached_orders(app)) == 10
+
+    other = sqlite3.connect(db_dir / "frame.db")
+    try:
+        other.execute("DELETE FROM orders WHERE rowid > 5")
+        other.commit()
+    finally:
+        other.close()
+    # このPCで取り込んだ行は、キャッシュの最終rowid以下のrowidになる
+    import_web(app, db_dir, "受注2024年5月.xlsx", range(1, 4), "C")
+
+    assert cached_orders(app) == {f"A{day:03d}" for day in range(1, 6)} | {"C001", "C002", "C003"}
@@ -0,0 +1,33 @@
+import json
+
+
+def test_benchmark_results_default_to_local_data_dir(app, db_dir, local_data_dir, monkeypatch):
+    monkeypatch.setattr(app, "dialogs", app.dialogs)
+
+    assert app.run_cli(["benchmark", "--scales", "1"]) == 0
+
+    results = local_data_dir / app.LOCAL_DATA_DIRNAME / app.BENCHMARK_LOG
+    assert [run["倍率"].keys() for run in json.loads(results.read_text(encoding="utf-8"))] == [{"1"}]
+    assert not (db_dir / app.BENCHMARK_LOG).exists()
+    # 一時フォルダのDBの分析用キャッシュは残さない
+    cache_root = local_data_dir / app.LOCAL_DATA_DIRNAME / app.ANALYTICS_CACHE_DIR
+    assert not cache_root.exists() or not any(cache_root.iterdir())
+
+
+def test_startup_benchmark_log_in_local_data_dir(app, tmp_path, local_data_dir, monkeypatch):
+    import subprocess
+
+    def fake_run(cmd, **kwargs):
+        # 起動した子プロセスの代わりに計測結果（時刻）を書く
+        probe_path = cmd[cmd.index("--startup-probe") + 1]
+        with open(probe_path, "w", encoding="utf-8") as f:
+            json.dump({"ウィンドウ表示": 0.0}, f)
+
+    monkeypatch.setattr(subprocess, "run", fake_run)
+    monkeypatch.chdir(tmp_path)
+
+    app.run_startup_benchmark(runs=2)
+
+    log = local_data_dir / app.LOCAL_DATA_DIRNAME / app.STARTUP_BENCHMARK_LOG
+    assert "ウィンドウ表示" in log.read_text(encoding="utf-8")
+    assert not (tmp_path / app.STARTUP_BENCHMARK_LOG).exists()
@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+from test_cli import write_store_excel
+from test_web_import import write_web_excel
+
+
+class CancelAt:
+    # ワーカースレッドの代わり: 指定した文字列で始まる進捗通知のときにキャンセルされたことにする
+    def __init__(self, app, prefix):
+        self.app = app
+        self.prefix = prefix
+        self.messages = []
+
+    def is_worker(self):
+        return True
+
+    def report(self, message, done=None, total=None, cancellable=True):
+        self.messages.append(message)
+        if cancellable and message.startswith(self.prefix):
+            raise self.app.TaskCancelled()
+
+    def call_in_ui(self, func, *args):
+        return None
+
+
+def count_rows(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("prefix", ["DB登録中... ", "月次集計中", "登録を確定中"])
+def test_cancel_streaming_web_import_rolls_back(app, db_dir, monkeypatch, prefix):
+    monkeypatch.setattr(app, "WEB_STREAMING_MIN_BYTES", 0)
+    runner = CancelAt(app, prefix)
+    monkeypatch.setattr(app, "task_runner", runner)
+    excel = db_dir / "受注2024年4月.xlsx"
+    write_web_excel(excel, range(1, 31), "A")
+
+    with pytest.raises(app.TaskCancelled):
+        app.process_file(str(excel), csv_mode="none")
+
+    app.close_db_connections()
+    assert count_rows(db_dir / "frame.db", "orders") == 0
+    assert count_rows(db_dir / "frame.db", "ingested_files") == 0
+    # 分割読込ではチャンクごとに通知（キャンセルの機会）がある
+    assert any(message.startswith("Excel読込中") or message.startswith("DB登録中... ") for message in runner.messages)
+
+
+def test_cancel_store_import_rolls_back(app, db_dir, monkeypatch):
+    monkeypatch.setattr(app, "task_runner", CancelAt(app, "登録を確定中"))
+    excel = db_dir / "データ出力202404.xlsx"
+    write_store_excel(excel)
+
+    with pytest.raises(app.TaskCancelled):
+        app.process_fukuoka_file(str(excel), csv_mode="none")
+
+    app.close_db_connections()
+    assert count_rows(db_dir / "framefukuoka.db", "orders") == 0
+
+
+def test_cancel_after_commit_still_writes_csv(app, db_dir, monkeypatch):
+    # コミット後はキャンセルしても全データCSVまで出力する（CSVとDBがずれないように）
+    monkeypatch.setattr(app, "task_runner", CancelAt(app, "CSV出力中"))
+    excel = db_dir / "データ出力202404.xlsx"
+    write_store_excel(excel)
+
+    app.process_fukuoka_file(str(excel), csv_mode="full")
+
+    assert (db_dir / app.STORE_CSV).exists()
+    assert count_rows(db_dir / "framefukuoka.db", "orders") == 2
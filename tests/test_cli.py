@@ -0,0 +1,37 @@
+import sqlite3
+
+import pandas as pd
+
+
+def write_store_excel(path):
+    pd.DataFrame({
+        "商品CD": ["7201001", "7201002"],
+        "商品名": ["シャツ", "ニット"],
+        "カラー": ["NAVY", "GREY"],
+        "サイズ": ["M", "L"],
+        "プロパー金額": ["10000", "20000"],
+        "売上数": ["1", "2"],
+    }).to_excel(path, index=False)
+
+
+def test_ingest_with_db_dir_writes_only_to_that_folder(app, db_dir, monkeypatch):
+    monkeypatch.setattr(app, "dialogs", app.dialogs)
+    # 通常の起動で見つかるDB（Dropbox）の代わり
+    shared = db_dir / "shared"
+    shared.mkdir()
+    for db_filename in app.MIGRATIONS:
+        app.db_path_cache[db_filename] = str(shared / db_filename)
+    work = db_dir / "work"
+    work.mkdir()
+    excel = db_dir / "データ出力202404.xlsx"
+    write_store_excel(excel)
+
+    code = app.run_cli(["ingest-store", str(excel), "--db-dir", str(work), "--csv", "none", "--yes"])
+
+    assert code == 0
+    assert list(shared.iterdir()) == []
+    conn = sqlite3.connect(work / "framefukuoka.db")
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0] == 2
+    finally:
+        conn.close()
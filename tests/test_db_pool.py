@@ -0,0 +1,33 @@
+import shutil
+import sqlite3
+
+
+def test_commit_is_written_back_to_db_file(app, db_dir):
+    # DB本体だけをコピーしても（Dropboxが-walと別に同期しても）コミット済みの行が見える
+    conn = app.connect_db("framefukuoka.db")
+    conn.execute("CREATE TABLE sample (id INTEGER)")
+    conn.executemany("INSERT INTO sample VALUES (?)", [(i,) for i in range(59)])
+    conn.commit()
+    conn.close()
+
+    shutil.copy(db_dir / "framefukuoka.db", db_dir / "copy.db")
+    copy = sqlite3.connect(db_dir / "copy.db")
+    try:
+        assert copy.execute("SELECT COUNT(*) FROM sample").fetchone()[0] == 59
+    finally:
+        copy.close()
+
+
+def test_release_writes_back_pending_wal(app, db_dir):
+    conn = app.connect_db("framefukuoka.db")
+    conn.execute("CREATE TABLE sample (id INTEGER)")
+    conn.execute("INSERT INTO sample VALUES (1)")
+    sqlite3.Connection.commit(conn)  # 書き戻しなしのコミット
+    app.release_db_connections()
+
+    shutil.copy(db_dir / "framefukuoka.db", db_dir / "copy.db")
+    copy = sqlite3.connect(db_dir / "copy.db")
+    try:
+        assert copy.execute("SELECT COUNT(*) FROM sample").fetchone()[0] == 1
+    finally:
+        copy.close()
@@ -0,0 +1,10 @@
+import os
+
+from conftest import SCRIPT
+
+
+def test_profile_log_is_written_to_local_data_dir(app, local_data_dir):
+    path = app.get_profile_log_path()
+    assert os.path.dirname(path) == str(local_data_dir / app.LOCAL_DATA_DIRNAME)
+    assert os.path.dirname(path) != os.path.dirname(SCRIPT)
+    assert os.path.isdir(os.path.dirname(path))
@@ -0,0 +1,21 @@
+import sqlite3
+
+from test_cli import write_store_excel
+
+
+def test_summary_cache_sees_import_from_another_pc(app, db_dir):
+    excel = db_dir / "データ出力202404.xlsx"
+    write_store_excel(excel)
+    app.ingest_files("store", [str(excel)], "none")
+    request = app.ReportRequest(2024, 4, 2024, 4, db_mode="店舗")
+    before = app.get_sales_aggregate(request)["summary"]["点数"].sum()
+
+    # 他のPCがDropbox上の同じDBに取り込んだ場合（このプロセスのキャッシュはクリアされない）
+    other = sqlite3.connect(db_dir / "framefukuoka.db")
+    try:
+        other.execute("UPDATE monthly_sales SET 点数 = 点数 + 10 WHERE rowid = (SELECT MIN(rowid) FROM monthly_sales)")
+        other.commit()
+    finally:
+        other.close()
+
+    assert app.get_sales_aggregate(request)["summary"]["点数"].sum() == before + 10
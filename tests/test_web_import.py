@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def old_backfill_loop(df_selected):
+    # 置き換え前の parse_web_file の処理（比較用にそのまま残す）
+    last_positive_date = None
+    for idx, row in df_selected.iterrows():
+        if row["税込金額"] >= 0:
+            last_positive_date = row["受注日"]
+        else:
+            if last_positive_date is not None:
+                df_selected.at[idx, "受注日"] = last_positive_date
+    return df_selected["受注日"]
+
+
+def make_orders(dates, amounts, index=None):
+    return pd.DataFrame({
+        "受注日": pd.array(dates, dtype="Int64"),
+        "税込金額": pd.Series(amounts, dtype="float64").to_numpy(),
+    }, index=index)
+
+
+CASES = {
+    "NaN金額": make_orders([20240401, 20240402, 20240403, 20240404], [1000, np.nan, -500, 2000]),
+    "0円以上の行の受注日がNA": make_orders([20240401, None, 20240403, 20240404], [1000, 500, -500, -300]),
+    "先頭がマイナス": make_orders([20240401, 20240402, 20240403, 20240404], [-1000, np.nan, 500, -500]),
+    "連番でないindex": make_orders([20240401, 20240402, 20240403, 20240404, 20240405],
+                                   [1000, -1000, 0, -200, np.nan], index=[10, 3, 7, 42, 0]),
+}
+
+
+@pytest.mark.parametrize("name", list(CASES))
+def test_backfill_return_dates_matches_old_loop(app, name):
+    df = CASES[name]
+    expected = old_backfill_loop(df.copy())
+    result = app.backfill_return_dates(df["受注日"], df["税込金額"])
+    pd.testing.assert_series_equal(result, expected)
+
+
+def test_backfill_return_dates_matches_old_loop_random(app):
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        n = int(rng.integers(1, 40))
+        dates = [None if rng.random() < 0.1 else 20240400 + int(d) for d in rng.integers(1, 31, n)]
+        amounts = rng.choice([-1000.0, -1.0, 0.0, 1.0, 5000.0, np.nan], n)
+        df = make_orders(dates, amounts, index=rng.permutation(n * 2)[:n])
+        expected = old_backfill_loop(df.copy())
+        pd.testing.assert_series_equal(app.backfill_return_dates(df["受注日"], df["税込金額"]), expected)
+
+        # 分割読込: 前のチャンクの受注日を state で引き継いでも全体を一度に処理した結果と同じ
+        state = {}
+        split = int(rng.integers(0, n + 1))
+        chunks = [app.backfill_return_dates(part["受注日"], part["税込金額"], state)
+                  for part in (df.iloc[:split], df.iloc[split:])]
+        pd.testing.assert_series_equal(pd.concat(chunks), expected)
+
+
+def write_web_excel(path, days, prefix):
+    # WEB受注Excel（列位置は WEB_COLUMN_INDICES と同じ）
+    rows = [[20240400 + day, f"{prefix}{day:03d}", "", "", 35, "M", 720100100101, "シャツ", "NAVY", "M",
+             10000, 11000, "東京都", "カード", None] for day in days]
+    pd.DataFrame(rows, columns=["受注日", "受注№", "a", "b", "年齢", "性別", "品番", "品名", "色", "サイズ",
+                                "税抜", "税込", "居住地", "支払", "ギフト"]).to_excel(path, index=False)
+
+
+def month_orders(app):
+    conn = app.connect_db("frame.db")
+    try:
+        return {row[0] for row in conn.execute("SELECT 受注№ FROM orders WHERE 年月キー = 202404")}
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_split_web_files_for_same_month_are_merged(app, db_dir, monkeypatch, streaming):
+    if streaming:
+        monkeypatch.setattr(app, "WEB_STREAMING_MIN_BYTES", 0)
+    first = db_dir / "受注2024年4月_前半.xlsx"
+    second = db_dir / "受注2024年4月_後半.xlsx"
+    write_web_excel(first, range(1, 16), "A")
+    write_web_excel(second, range(16, 31), "B")
+
+    app.ingest_files("web", [str(first)], "none")
+    result = app.ingest_files("web", [str(second)], "none")
+
+    # 前半・後半の両方が残る（後のファイルで月が置き換えられない）
+    assert result["replaced"] == []
+    orders = month_orders(app)
+    assert len(orders) == 30
+    assert {"A001", "A015", "B016", "B030"} <= orders
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_web_file_covering_registered_period_replaces_month(app, db_dir, monkeypatch, streaming):
+    if streaming:
+        monkeypatch.setattr(app, "WEB_STREAMING_MIN_BYTES", 0)
+    first = db_dir / "受注2024年4月_前半.xlsx"
+    full = db_dir / "受注2024年4月.xlsx"
+    write_web_excel(first, range(1, 16), "A")
+    write_web_excel(full, range(1, 31), "C")
+
+    app.ingest_files("web", [str(first)], "none")
+    result = app.ingest_files("web", [str(full)], "none")
+
+    assert result["replaced"] == [str(full)]
+    assert month_orders(app) == {f"C{day:03d}" for day in range(1, 31)}